@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class InternalReportsConfig(AppConfig):
     name = 'internal_reports'
     verbose_name = 'Internal reports'
+
+    def ready(self):
+        from internal_reports.tracing import configure_tracing
+        import internal_reports.signals  # noqa: F401
+
+        configure_tracing()
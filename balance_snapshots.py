@@ -0,0 +1,55 @@
+"""
+Daily snapshots of asset container values.
+
+snapshot_balances task stores values of all containers once a day, so
+balances report for a past date reads one day of the snapshot table instead
+of valuing every container.
+"""
+from datetime import date
+
+from django.db import transaction
+
+from datastorage.models import AssetContainer
+from internal_reports.constants import BALANCE_SNAPSHOT_BATCH_SIZE
+from internal_reports.models import AssetContainerBalanceSnapshot
+from internal_reports.valuation import get_container_values
+
+
+def snapshot_context_balances(context, day=None):
+    """
+    Store current values of containers of the context for the day. Snapshot
+    of the day is replaced if it's already stored
+
+    :param context: AppContext instance
+    :param day: date of the snapshot, today by default
+    :return: number of stored values
+    """
+
+    day = day or date.today()
+
+    containers = AssetContainer.objects.filter(user__app_context=context)
+    values = get_container_values(containers)
+
+    snapshots = [
+        AssetContainerBalanceSnapshot(
+            container_id=container_id,
+            user_id=user_id,
+            date=day,
+            name=name,
+            type=type_name,
+            value=values.get(container_id)
+        )
+        for container_id, user_id, name, type_name in containers.values_list(
+            'pk', 'user_id', 'name', 'type__name').iterator()
+    ]
+
+    with transaction.atomic():
+        AssetContainerBalanceSnapshot.objects.filter(
+            user__app_context=context,
+            date=day
+        ).delete()
+
+        AssetContainerBalanceSnapshot.objects.bulk_create(
+            snapshots, batch_size=BALANCE_SNAPSHOT_BATCH_SIZE)
+
+    return len(snapshots)
@@ -0,0 +1,145 @@
+"""
+Adaptive limit of concurrent calls to external services.
+
+AIMD (additive increase, multiplicative decrease): after every window of
+calls the limit grows by one while calls succeed and latency stays close to
+the baseline, and is cut when calls fail or get slow. Baseline is moving
+average of the lowest latency of recent windows, so it follows the service
+when it gets slower or faster for good.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from internal_reports.constants import (
+    AIMD_BASELINE_SMOOTHING,
+    AIMD_DECREASE_FACTOR,
+    AIMD_LATENCY_TOLERANCE
+)
+
+
+@contextmanager
+def unlimited():
+    """
+    Slot of calls that are not limited
+    """
+
+    yield
+
+
+class AIMDLimiter:
+    """
+    Limit of concurrent calls that adapts to the service health.
+
+    :ivar limit: current number of calls allowed at once
+    :ivar history: list with [seconds since start, limit] for every change
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None,
+                 failure_errors=(), latency_tolerance=AIMD_LATENCY_TOLERANCE,
+                 decrease_factor=AIMD_DECREASE_FACTOR,
+                 baseline_smoothing=AIMD_BASELINE_SMOOTHING):
+        """
+        :param initial: initial limit
+        :param minimum: min limit
+        :param maximum: max limit, not limited by default
+        :param failure_errors: errors that mean the service is overloaded
+        :param latency_tolerance: call is slow if its latency is that many
+            times higher than the baseline
+        :param decrease_factor: limit is multiplied by it on decrease
+        :param baseline_smoothing: weight of the lowest latency of the last
+            window in the baseline
+        """
+
+        self.minimum = max(minimum, 1)
+        self.maximum = maximum
+        self.limit = self.clamp(initial)
+        self.failure_errors = failure_errors
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.baseline_smoothing = baseline_smoothing
+
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+        self.started = time.time()
+        self.history = [[0.0, self.limit]]
+        self.baseline = None
+        self.window = list()
+
+    def clamp(self, limit):
+        limit = max(limit, self.minimum)
+
+        if self.maximum is not None:
+            limit = min(limit, self.maximum)
+
+        return limit
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+
+            self.in_flight += 1
+
+    def release(self, latency, failed):
+        """
+        Free the slot and record the call
+        :param latency: seconds the call took
+        :param failed: call failed because of the service
+        """
+
+        with self.condition:
+            self.in_flight -= 1
+            self.window.append((latency, failed))
+
+            if len(self.window) >= self.limit:
+                self.adjust()
+
+            self.condition.notify_all()
+
+    def adjust(self):
+        """
+        Change limit after the window of calls
+        """
+
+        latencies = [latency for latency, _ in self.window]
+        latency = sum(latencies) / len(latencies)
+        failed = any(failed for _, failed in self.window)
+
+        self.window = list()
+
+        if not failed:
+            if self.baseline is None:
+                self.baseline = min(latencies)
+            else:
+                self.baseline += self.baseline_smoothing * (
+                    min(latencies) - self.baseline)
+
+        if failed or latency > self.baseline * self.latency_tolerance:
+            limit = self.clamp(int(self.limit * self.decrease_factor))
+        else:
+            limit = self.clamp(self.limit + 1)
+
+        if limit != self.limit:
+            self.limit = limit
+            self.history.append([round(time.time() - self.started, 1), limit])
+
+    @contextmanager
+    def slot(self):
+        """
+        Wait for free slot and hold it while the call runs
+        """
+
+        self.acquire()
+
+        started = time.time()
+        failed = False
+
+        try:
+            yield
+        except self.failure_errors:
+            failed = True
+            raise
+        finally:
+            self.release(time.time() - started, failed)
@@ -2,6 +2,7 @@ FILE_FORMAT_CSV = 'csv'
 FILE_FORMAT_JSON = 'json'
 
 MIME_TYPE_CSV = 'text/csv'
+MIME_TYPE_JSON = 'application/json'
 
 INTERNAL_REPORT_ACTIVE_USERS = 0
 INTERNAL_REPORT_USER_RISK_SCORES = 1
@@ -23,6 +24,78 @@ INTERNAL_REPORT_TYPES = (
     (INTERNAL_REPORT_ASSETS, 'Assets'),
 )
 
+COLUMN_FORMATTER_DATE_SHORT = 'date_short'
+COLUMN_FORMATTER_DATE_LONG = 'date_long'
+COLUMN_FORMATTER_CHOICE_DISPLAY = 'choice_display'
+COLUMN_FORMATTER_FREQUENCY_TYPE = 'frequency_type'
+COLUMN_FORMATTER_CONTAINER_VALUE = 'container_value'
+
+# Columns of flat reports (one row per DB entry):
+# (column name, source field path, formatter, type).
+# Column without source is only listed in CSV, where it's empty
+INTERNAL_REPORT_COLUMNS = {
+    INTERNAL_REPORT_ASSETS: (
+        ('id', 'id', None, int),
+        ('user_id', 'user__app_uid', None, str),
+        ('name', 'name', None, str),
+        ('type', 'type', None, None),
+        ('value', 'value', None, float),
+        ('quantity', 'quantity', None, float),
+        ('price', 'financial_information__unit_price', None, float),
+        ('updated_at', 'financial_information__market_data_updated',
+         COLUMN_FORMATTER_DATE_SHORT, str),
+    ),
+    INTERNAL_REPORT_GOALS: (
+        ('user_id', 'user__app_uid', None, str),
+        ('goal_id', 'id', None, int),
+        ('name', None, None, str),
+        ('type', 'type__name', None, str),
+        ('value', 'value', None, float),
+        ('created', 'created', COLUMN_FORMATTER_DATE_LONG, str),
+        ('start_date', 'start_date', COLUMN_FORMATTER_DATE_SHORT, str),
+        ('end_date', 'end_date', COLUMN_FORMATTER_DATE_SHORT, str),
+        ('frequency', 'frequency', None, int),
+    ),
+    INTERNAL_REPORT_RECURRENT_ORDERS: (
+        ('user_id', 'user__app_uid', None, str),
+        ('status', 'status__name', None, str),
+        ('amount', 'amount', None, float),
+        ('frequency_type', 'frequency_type',
+         COLUMN_FORMATTER_FREQUENCY_TYPE, str),
+        ('frequency', 'frequency', None, int),
+        ('order_start_date', 'order_start_date',
+         COLUMN_FORMATTER_DATE_SHORT, str),
+        ('order_next_date', 'order_next_date',
+         COLUMN_FORMATTER_DATE_SHORT, str),
+        ('order_end_date', 'order_end_date',
+         COLUMN_FORMATTER_DATE_SHORT, str),
+        ('action', 'action', None, str),
+        ('orders_created', 'orders_created', None, int),
+        ('number_of_retries', 'number_of_retries', None, int),
+        ('direct_debit', 'direct_debit', None, bool),
+        ('created', 'created', COLUMN_FORMATTER_DATE_LONG, str),
+        ('mandate_id', 'mandate_id', None, str),
+        ('direct_debit_date', 'direct_debit_date',
+         COLUMN_FORMATTER_DATE_SHORT, str),
+        ('cancel_after_next_execution', 'cancel_after_next_execution',
+         None, bool),
+    ),
+    INTERNAL_REPORT_ORDERS: (
+        ('user_id', 'user__app_uid', None, str),
+        ('type', 'action', None, str),
+        ('date', 'value_date', COLUMN_FORMATTER_DATE_SHORT, str),
+        ('value', 'value', None, float),
+        ('status', 'status', COLUMN_FORMATTER_CHOICE_DISPLAY, str),
+        ('rebalancing', 'rebalancing', None, bool),
+    ),
+    INTERNAL_REPORT_BALANCES: (
+        ('user_id', 'user__app_uid', None, str),
+        ('name', 'name', None, str),
+        ('type', 'type__name', None, str),
+        ('total_value', 'id', COLUMN_FORMATTER_CONTAINER_VALUE, float),
+    ),
+}
+
 INTERNAL_REPORT_CSV_COLUMNS = {
     INTERNAL_REPORT_ACTIVE_USERS: [
         'personid',
@@ -37,16 +110,6 @@ INTERNAL_REPORT_CSV_COLUMNS = {
         'position_end_value',
         'error'
     ],
-    INTERNAL_REPORT_ASSETS: [
-        'id',
-        'user_id',
-        'name',
-        'type',
-        'value',
-        'quantity',
-        'price',
-        'updated_at'
-    ],
     INTERNAL_REPORT_USER_RISK_SCORES: [
         'user_id',
         'selected_user_risk_score',
@@ -77,52 +140,14 @@ INTERNAL_REPORT_CSV_COLUMNS = {
         'return_in_cash',
         'cumulative_performance',
         'error'
-    ],
-    INTERNAL_REPORT_GOALS: [
-        'user_id',
-        'goal_id',
-        'name',
-        'type',
-        'value',
-        'created',
-        'start_date',
-        'end_date',
-        'frequency'
-    ],
-    INTERNAL_REPORT_RECURRENT_ORDERS: [
-        'user_id',
-        'status',
-        'amount',
-        'frequency_type',
-        'frequency',
-        'order_start_date',
-        'order_next_date',
-        'order_end_date',
-        'action',
-        'orders_created',
-        'number_of_retries',
-        'direct_debit',
-        'created',
-        'mandate_id',
-        'direct_debit_date',
-        'cancel_after_next_execution',
-    ],
-    INTERNAL_REPORT_ORDERS: [
-        'user_id',
-        'type',
-        'date',
-        'value',
-        'status',
-        'rebalancing',
-    ],
-    INTERNAL_REPORT_BALANCES: [
-        'user_id',
-        'name',
-        'type',
-        'total_value',
     ]
 }
 
+INTERNAL_REPORT_CSV_COLUMNS.update({
+    report_type: [column[0] for column in columns]
+    for report_type, columns in INTERNAL_REPORT_COLUMNS.items()
+})
+
 INTERNAL_REPORT_STATUS_GENERATING = 0
 INTERNAL_REPORT_STATUS_READY = 1
 INTERNAL_REPORT_STATUS_FAILED = 2
@@ -132,3 +157,117 @@ INTERNAL_REPORT_STATUSES = (
     (INTERNAL_REPORT_STATUS_READY, 'Ready'),
     (INTERNAL_REPORT_STATUS_FAILED, 'Failed')
 )
+
+TRACING_EXPORTER_OTLP = 'otlp'
+TRACING_EXPORTER_FILE = 'file'
+TRACING_DEFAULT_ENDPOINT = 'http://localhost:4318/v1/traces'
+TRACING_DEFAULT_FILE = 'internal_reports_traces.jsonl'
+TRACING_DEFAULT_USER_SAMPLE_RATE = 0.01
+TRACING_SERVICE_NAME = 'internal_reports'
+
+# Number of rows stored in one InternalReportChunk
+INTERNAL_REPORT_CHUNK_SIZE = 1000
+# Number of rows sorted in memory before they are spilled to temporary file
+INTERNAL_REPORT_SORT_BUFFER_SIZE = 50000
+# Number of report rows returned by detailed report view at once
+INTERNAL_REPORT_PAGE_SIZE = 1000
+# Database vendors flat reports are sorted by, other vendors are sorted in
+# Python, as their text order may differ from code point order
+BINARY_ORDER_VENDORS = ('postgresql', 'mysql', 'sqlite')
+
+HISTORY_CACHE_BACKEND_LOCAL = 'local'
+HISTORY_CACHE_BACKEND_SHARED = 'shared'
+# Max estimated size in bytes of histories kept by local cache
+HISTORY_CACHE_DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Estimated size in bytes of a history day without components
+HISTORY_DAY_ESTIMATED_BYTES = 512
+# Estimated size in bytes of a component kept as dict
+HISTORY_COMPONENT_ESTIMATED_BYTES = 1024
+# Estimated size in bytes of a unique value of columnar history
+HISTORY_VALUE_ESTIMATED_BYTES = 128
+# Max number of cached date ranges per user
+HISTORY_CACHE_RANGES_PER_USER = 4
+# Seconds cached history is valid, prices of recent days can be updated
+HISTORY_CACHE_DEFAULT_TIMEOUT = 6 * 60 * 60
+
+# Days of history stored on the first fill of daily portfolio values
+DAILY_PORTFOLIO_VALUES_DEFAULT_DAYS = 3 * 365
+
+# Columns of active users report with several thresholds. Threshold columns
+# are repeated for every threshold with suffix like '_10d_50'
+ACTIVE_USERS_THRESHOLDS_CSV_COLUMNS = [
+    'personid',
+    'first_date_reported',
+    'position_first_date_reported',
+    'position_average_value',
+    'position_end_date',
+    'position_end_value'
+]
+ACTIVE_USERS_THRESHOLD_CSV_COLUMNS = [
+    'consecutive_days',
+    'average_value_of_consecutive_days',
+    'position_start_date',
+    'position_start_value'
+]
+ACTIVE_USERS_THRESHOLD_SUFFIX = '_{consecutive_days}d_{amount_to_validate}'
+
+# Adaptive concurrency of Core Analyse calls
+AIMD_DECREASE_FACTOR = 0.5
+AIMD_LATENCY_TOLERANCE = 2.0
+# Weight of the last window in the latency baseline
+AIMD_BASELINE_SMOOTHING = 0.3
+
+# Computed quarter report data is stored and reused by default
+QUARTER_REPORT_DATA_CACHE_DEFAULT = True
+# Version of quarter report data calculation, stored data of other versions
+# is not used. Increase it when summary or overview calculation changes
+QUARTER_REPORT_DATA_VERSION = 1
+
+# Number of users whose quarter data is checked at once
+QUARTER_CHECKS_BATCH_SIZE = 1000
+
+QUARTER_END_MONTHS = (3, 6, 9, 12)
+
+# Quarter pre-screen: users whose portfolio value and stored balances
+# changed less than this share and who have no transactions in the quarter
+# are not validated fully, except for the audit sample of them
+QUARTER_PRESCREEN_MAX_CHANGE = 0.05
+QUARTER_PRESCREEN_AUDIT_FRACTION = 0.05
+
+# Sampling mode of quarter validation: 95% confidence of the failure rate
+# bounds and number of portfolio size groups of stratified samples
+SAMPLING_CONFIDENCE_Z = 1.96
+SAMPLING_STRATA_COUNT = 4
+
+# Users of quarter validation queued to the pool at once and sent to a
+# worker thread at once
+QUARTER_VALIDATION_WINDOW_SIZE = 1000
+QUARTER_VALIDATION_POOL_CHUNK_SIZE = 4
+# Users of active users report read from the database and queued to the pool
+# at once
+ACTIVE_USERS_WINDOW_SIZE = 1000
+
+# Max database connections of reporter worker threads in the process
+REPORTER_DB_CONNECTIONS_DEFAULT = 4
+
+# Values of containers are summed by the database in balances and risk score
+# reports
+BULK_VALUATION_DEFAULT = True
+# Relation of AssetContainer to its assets, container value is their sum
+ASSET_CONTAINER_ASSETS_RELATION = 'has_assets'
+
+# Rows of balance snapshot inserted at once
+BALANCE_SNAPSHOT_BATCH_SIZE = 1000
+
+# Models with user foreign key suggested risk score is derived from
+SUGGESTED_RISK_SCORE_DEFAULT_INPUTS = ('datastorage.Transaction',)
+# Suggested risk scores stored at once
+SUGGESTED_RISK_SCORE_BATCH_SIZE = 1000
+
+# Columns of balances report for a past date, read from the snapshot table
+BALANCE_SNAPSHOT_COLUMNS = (
+    ('user_id', 'user__app_uid', None, str),
+    ('name', 'name', None, str),
+    ('type', 'type', None, str),
+    ('total_value', 'value', None, float),
+)
@@ -0,0 +1,218 @@
+"""
+Stored daily portfolio values of users.
+
+Values are added incrementally by fill_daily_portfolio_values task from the
+same history the reporters use. Active users report finds users with enough
+consecutive days over the amount with a single window query and goes to
+Core Analyse only for users whose values are not stored for the period.
+"""
+import logging
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from client_core_analyse.errors import CanNotConnectToCoreAnalyze
+from internal_reports.constants import DAILY_PORTFOLIO_VALUES_DEFAULT_DAYS
+from internal_reports.daily_values import DailyPortfolioValues
+from internal_reports.errors import BrokenPortfolioComponent
+from internal_reports.history_cache import (
+    get_cached_portfolio_history,
+    to_date
+)
+from internal_reports.models import (
+    UserDailyPortfolioValue,
+    UserDailyPortfolioValueSync
+)
+from pdf.errors import NoPortfolioHistory
+
+
+logger = logging.getLogger(__name__)
+
+# Runs of days with value over the amount are found as islands: row number
+# of the day among all days minus its number among days with the same
+# active flag is constant inside every run
+ACTIVE_USERS_QUERY = '''
+SELECT DISTINCT user_id FROM (
+    SELECT user_id, island
+    FROM (
+        SELECT
+            user_id,
+            value >= %(amount)s AS active,
+            ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY date)
+            - ROW_NUMBER() OVER (
+                PARTITION BY user_id, value >= %(amount)s ORDER BY date
+            ) AS island
+        FROM {values_table}
+        WHERE date >= %(start_date)s AND date <= %(end_date)s
+            AND user_id IN (
+                SELECT user_id FROM {sync_table}
+                WHERE synced_from <= %(start_date)s
+                    AND synced_until >= %(end_date)s
+            )
+    ) days
+    WHERE active
+    GROUP BY user_id, island
+    HAVING COUNT(*) >= %(consecutive_days)s
+) runs
+'''
+
+
+def fill_user_daily_values(user_mapping, end_date):
+    """
+    Store daily portfolio values of the user up to the date. Stored period
+    ends with the last day history has, users without history are not
+    marked as stored, so reporters fetch and report them
+
+    :param user_mapping: UserMapping instance
+    :param end_date: last date to store
+    :return: number of stored values
+    """
+
+    sync = UserDailyPortfolioValueSync.objects.filter(
+        user=user_mapping).first()
+
+    if sync is None:
+        start_date = end_date - timedelta(days=getattr(
+            settings, 'INTERNAL_REPORTS_DAILY_VALUES_DAYS',
+            DAILY_PORTFOLIO_VALUES_DEFAULT_DAYS))
+    else:
+        start_date = sync.synced_until + timedelta(days=1)
+
+    if start_date > end_date:
+        return 0
+
+    # Every user is filled once a day, cached history would only push out
+    # histories reporters read
+    try:
+        daily_values = DailyPortfolioValues.from_history(
+            get_cached_portfolio_history(user_mapping, start_date, end_date,
+                                         use_cache=False))
+    except NoPortfolioHistory:
+        return 0
+
+    values = [
+        UserDailyPortfolioValue(user_id=user_mapping.pk, date=day,
+                                value=value)
+        for day, value in zip(map(to_date, daily_values.dates),
+                              daily_values.values)
+        if start_date <= day <= end_date
+    ]
+
+    if not values:
+        return 0
+
+    with transaction.atomic():
+        if sync is None:
+            UserDailyPortfolioValue.objects.filter(
+                user_id=user_mapping.pk).delete()
+
+        UserDailyPortfolioValue.objects.bulk_create(values)
+
+        UserDailyPortfolioValueSync.objects.update_or_create(
+            user_id=user_mapping.pk,
+            defaults=dict(
+                synced_from=sync.synced_from if sync else start_date,
+                synced_until=max(value.date for value in values)
+            )
+        )
+
+    return len(values)
+
+
+def fill_daily_values(users, end_date=None):
+    """
+    Store daily portfolio values of users up to the date
+
+    :param users: iterable with UserMapping instances
+    :param end_date: last date to store, yesterday by default
+    :return: number of stored values
+    """
+
+    end_date = end_date or date.today() - timedelta(days=1)
+    stored = 0
+
+    for user_mapping in users:
+        try:
+            stored += fill_user_daily_values(user_mapping, end_date)
+        except (BrokenPortfolioComponent, CanNotConnectToCoreAnalyze) as ex:
+            logger.warning('Daily values of {} are not stored: {}'.format(
+                user_mapping, ex))
+
+    return stored
+
+
+def reset_user_daily_values(user_id):
+    """
+    Mark stored values of the user as outdated, they are filled again by the
+    next run of the task
+    :param user_id: UserMapping ID
+    """
+
+    UserDailyPortfolioValueSync.objects.filter(user_id=user_id).delete()
+
+
+def get_stored_user_ids(start_date, end_date, using=DEFAULT_DB_ALIAS):
+    """
+    Get users whose daily values are stored for the whole period
+    :param start_date: period start date
+    :param end_date: period end date
+    :param using: database alias
+    :return: set with UserMapping IDs
+    """
+
+    return set(UserDailyPortfolioValueSync.objects.using(using).filter(
+        synced_from__lte=to_date(start_date),
+        synced_until__gte=to_date(end_date)
+    ).values_list('user_id', flat=True))
+
+
+def get_active_user_ids(start_date, end_date, consecutive_days, amount,
+                        using=DEFAULT_DB_ALIAS):
+    """
+    Get users with stored values that have at least consecutive_days days
+    in a row with value equal or higher than amount
+
+    :param start_date: period start date
+    :param end_date: period end date
+    :param consecutive_days: min number of consecutive days
+    :param amount: min daily portfolio value
+    :param using: database alias
+    :return: set with UserMapping IDs
+    """
+
+    query = ACTIVE_USERS_QUERY.format(
+        values_table=UserDailyPortfolioValue._meta.db_table,
+        sync_table=UserDailyPortfolioValueSync._meta.db_table
+    )
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(query, dict(
+            amount=amount,
+            start_date=to_date(start_date),
+            end_date=to_date(end_date),
+            consecutive_days=consecutive_days
+        ))
+
+        return {user_id for user_id, in cursor.fetchall()}
+
+
+def get_stored_daily_values(user_mapping, start_date, end_date,
+                            using=DEFAULT_DB_ALIAS):
+    """
+    Get stored daily values of the user in the period
+    :param user_mapping: UserMapping instance
+    :param start_date: period start date
+    :param end_date: period end date
+    :param using: database alias
+    :return: DailyPortfolioValues instance
+    """
+
+    rows = UserDailyPortfolioValue.objects.using(using).filter(
+        user=user_mapping,
+        date__gte=to_date(start_date),
+        date__lte=to_date(end_date)
+    ).order_by('date').values_list('date', 'value')
+
+    return DailyPortfolioValues([day for day, _ in rows],
+                                [value for _, value in rows])
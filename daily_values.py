@@ -0,0 +1,112 @@
+import numpy
+
+from internal_reports.errors import BrokenPortfolioComponent
+
+
+class DailyPortfolioValues:
+    """
+    Daily portfolio values of a single user.
+
+    Portfolio history is turned into (days x components) price and quantity
+    matrices once and all daily totals are computed together. Totals are
+    accumulated component by component in history order and rounded with
+    round(), so values are the same as summing every day in a Python loop.
+    """
+
+    def __init__(self, dates, values):
+        """
+        :param dates: list with history dates
+        :param values: list with daily portfolio values, rounded to cents
+        """
+
+        self.dates = dates
+        self.values = values
+        self.array = numpy.array(values, dtype=float)
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def from_history(cls, portfolio_history):
+        """
+        Calculate daily values from formatted portfolio history
+        :param portfolio_history: dict with date as key and dict with
+            components list as value or ColumnarPortfolioHistory instance
+        :return: DailyPortfolioValues instance
+        """
+
+        if hasattr(portfolio_history, 'daily_values'):
+            return portfolio_history.daily_values()
+
+        dates = list(portfolio_history.keys())
+        days = [portfolio_history[date]['components'] for date in dates]
+
+        width = max((len(components) for components in days), default=0)
+
+        prices = numpy.zeros((len(days), width))
+        quantities = numpy.zeros((len(days), width))
+
+        for row, components in enumerate(days):
+            for column, component in enumerate(components):
+                try:
+                    prices[row, column] = component['price_eur']
+                    quantities[row, column] = component['quantity']
+                except KeyError:
+                    raise BrokenPortfolioComponent
+
+        return cls.from_matrices(dates, prices, quantities)
+
+    @classmethod
+    def from_matrices(cls, dates, prices, quantities):
+        """
+        Calculate daily values from price and quantity matrices. Empty
+        component slots must have zero price and quantity
+        :param dates: list with history dates
+        :param prices: (days x components) array with EUR prices
+        :param quantities: (days x components) array with quantities
+        :return: DailyPortfolioValues instance
+        """
+
+        totals = numpy.zeros(len(dates))
+
+        for column in range(prices.shape[1]):
+            totals += prices[:, column] * quantities[:, column]
+
+        return cls(dates, [round(value, 2) for value in totals.tolist()])
+
+    def find_consecutive_days(self, expected_consecutive_days,
+                              amount_to_validate):
+        """
+        Find the first run of at least expected_consecutive_days days with
+        value equal or higher than amount_to_validate
+        :param expected_consecutive_days: min length of the run
+        :param amount_to_validate: min daily portfolio value
+        :return: tuple with start and end (exclusive) indexes of the run or
+            None if there is no such run
+        """
+
+        mask = (self.array >= amount_to_validate).astype(numpy.int8)
+        edges = numpy.flatnonzero(numpy.diff(
+            numpy.concatenate(([0], mask, [0]))))
+
+        starts = edges[::2]
+        ends = edges[1::2]
+
+        runs = numpy.flatnonzero(ends - starts >= expected_consecutive_days)
+
+        if not len(runs):
+            return None
+
+        return int(starts[runs[0]]), int(ends[runs[0]])
+
+    def average(self, start=0, end=None):
+        """
+        Average daily value in range of days
+        :param start: index of the first day
+        :param end: index after the last day
+        :return: average value
+        """
+
+        values = self.values[start:end]
+
+        return sum(values) / len(values)
@@ -0,0 +1,97 @@
+"""
+Bounded use of database connections by reporter worker threads.
+
+Django opens a connection per thread on the first query and keeps it until
+the thread ends, so a pool of many I/O-bound threads keeps as many idle
+connections. Worker threads run their database work in a slot of the limiter
+shared by the whole process: there are never more slots taken than the limit
+and the thread's connections are closed when the slot is released.
+
+Settings:
+
+* INTERNAL_REPORTS_DB_CONNECTIONS - max connections of reporter threads
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from internal_reports.constants import REPORTER_DB_CONNECTIONS_DEFAULT
+
+
+connection_limiter = None
+connection_limiter_lock = threading.Lock()
+
+
+def close_thread_connections():
+    """
+    Close database connections opened by the current thread. Connections
+    inside a transaction are left open, closing them would break it
+    """
+
+    for connection in connections.all():
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+class ConnectionLimiter:
+    """
+    Limit of threads that use database at once
+    """
+
+    def __init__(self, size):
+        """
+        :param size: max number of threads with open connections
+        """
+
+        self.size = size
+        self.semaphore = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def slot(self):
+        """
+        Wait for free slot, run database work and close the connections
+        """
+
+        with self.semaphore:
+            try:
+                yield
+            finally:
+                close_thread_connections()
+
+
+def close_pool_connections(pool, processes):
+    """
+    Close database connections of every worker thread of the pool. Pool has
+    no worker finalizer, so every worker runs one closing task and waits on
+    a barrier until all workers took theirs
+
+    :param pool: thread pool
+    :param processes: number of worker threads of the pool
+    """
+
+    barrier = threading.Barrier(processes)
+
+    def close_worker_connections(_):
+        close_thread_connections()
+        barrier.wait()
+
+    pool.map(close_worker_connections, range(processes), chunksize=1)
+
+
+def get_connection_limiter():
+    """
+    Get limiter shared by all reporters in the process
+    :return: ConnectionLimiter instance
+    """
+
+    global connection_limiter
+
+    with connection_limiter_lock:
+        if connection_limiter is None:
+            connection_limiter = ConnectionLimiter(getattr(
+                settings, 'INTERNAL_REPORTS_DB_CONNECTIONS',
+                REPORTER_DB_CONNECTIONS_DEFAULT))
+
+    return connection_limiter
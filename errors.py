@@ -111,3 +111,41 @@ class WrongInputValue(Error):
     description = message
     status = HTTP_404_NOT_FOUND
     level = logging.ERROR
+
+
+class WrongThresholds(Error):
+    error = 'CCO-404-912'
+    message = 'Thresholds are wrong'
+    description = ('Thresholds should be comma separated pairs of '
+                   'consecutive_days:amount_to_validate, e.g. 10:50,20:100')
+    status = HTTP_404_NOT_FOUND
+    level = logging.ERROR
+
+
+class WrongQuarterDates(Error):
+    error = 'CCO-404-913'
+    message = 'Quarter dates are wrong'
+    description = ('end_dates should be comma separated dates and year '
+                   'should have at least one finished quarter')
+    status = HTTP_404_NOT_FOUND
+    level = logging.ERROR
+
+
+class WrongSampleParameters(Error):
+    error = 'CCO-404-914'
+    message = 'Sample parameters are wrong'
+    description = ('Either sample_size should be a positive integer or '
+                   'sample_fraction a number between 0 and 1')
+    status = HTTP_404_NOT_FOUND
+    level = logging.ERROR
+
+
+class PrescreenNotAvailable(Error):
+    error = 'CCO-404-915'
+    message = 'Quarter pre-screen is not available'
+    description = ('Date field of transactions the pre-screen finds '
+                   'quarter flows with is not configured or is not a date '
+                   'field, set '
+                   'INTERNAL_REPORTS_PRESCREEN_TRANSACTION_DATE_FIELD')
+    status = HTTP_404_NOT_FOUND
+    level = logging.ERROR
@@ -1,22 +1,49 @@
 import json
 
+from celery.signals import before_task_publish
+from django.utils.module_loading import import_string
 from rest_framework import status
 from rest_framework.response import Response
 
-from internal_reports.reports.assets import ReporterAssets
 from serviceAPI.celery import app
 from internal_reports.constants import *
 from internal_reports.models import InternalReport
-from internal_reports.reports.active_users_list import ReporterActiveUsersList
-from internal_reports.reports.balances import ReporterBalances
-from internal_reports.reports.goals_report import ReporterGoals
-from internal_reports.reports.orders import ReporterOrders
-from internal_reports.reports.recurrent_orders import ReporterRecurrentOrders
-from internal_reports.reports.users_risk_score import ReporterRiskScoreUsersList
 from internal_reports.serializers import InternalReportSerializer
-from internal_reports.reports.validate_quarter_data import (
-    ReporterInvalidQuarterData
-)
+from internal_reports.tracing import span, continue_trace, inject_headers
+
+
+# Reporters are resolved by dotted path when report is generated, so web
+# workers importing views do not load reporters and their dependencies
+REPORTERS = {
+    INTERNAL_REPORT_ACTIVE_USERS:
+        'internal_reports.reports.active_users_list.ReporterActiveUsersList',
+    INTERNAL_REPORT_USER_RISK_SCORES:
+        'internal_reports.reports.users_risk_score.ReporterRiskScoreUsersList',
+    INTERNAL_REPORT_QUARTER_VALIDATION:
+        'internal_reports.reports.validate_quarter_data.'
+        'ReporterInvalidQuarterData',
+    INTERNAL_REPORT_GOALS:
+        'internal_reports.reports.goals_report.ReporterGoals',
+    INTERNAL_REPORT_RECURRENT_ORDERS:
+        'internal_reports.reports.recurrent_orders.ReporterRecurrentOrders',
+    INTERNAL_REPORT_ORDERS:
+        'internal_reports.reports.orders.ReporterOrders',
+    INTERNAL_REPORT_BALANCES:
+        'internal_reports.reports.balances.ReporterBalances',
+    INTERNAL_REPORT_ASSETS:
+        'internal_reports.reports.assets.ReporterAssets'
+}
+
+
+def get_reporter_class(report_type):
+    """
+    Import reporter class for report type
+
+    :param report_type: Report type
+    :return: reporter class
+    """
+
+    return import_string(REPORTERS[report_type])
 
 
 def start_report_generating(context, report_type, input_data=None):
@@ -30,14 +57,19 @@ def start_report_generating(context, report_type, input_data=None):
     :return: Response with internal report object
     """
 
-    internal_report = InternalReport.objects.create(
-        context=context,
-        type=report_type,
-        status=INTERNAL_REPORT_STATUS_GENERATING,
-        input_data=json.dumps(input_data or {})
-    )
+    with span('internal_reports.start_report_generating',
+              report_type=report_type) as current_span:
+        internal_report = InternalReport.objects.create(
+            context=context,
+            type=report_type,
+            status=INTERNAL_REPORT_STATUS_GENERATING,
+            input_data=json.dumps(input_data or {})
+        )
 
-    generate_report_in_background.delay(internal_report.id)
+        if current_span is not None:
+            current_span.set_attribute('report_id', internal_report.id)
+
+        generate_report_in_background.delay(internal_report.id)
 
     return Response(
         data=InternalReportSerializer(internal_report).data,
@@ -45,26 +77,45 @@ def start_report_generating(context, report_type, input_data=None):
     )
 
 
-@app.task
-def generate_report_in_background(internal_report_id):
+@app.task(bind=True)
+def generate_report_in_background(self, internal_report_id):
     """
     Start internal report generating as Celery task
 
     :param internal_report_id: ID of internal report that is generated
     """
 
+    with continue_trace(self.request):
+        with span('internal_reports.generate_report',
+                  report_id=internal_report_id):
+            generate_report(internal_report_id)
+
+
+def generate_report(internal_report_id):
+    """
+    Generate internal report with reporter of its type
+
+    :param internal_report_id: ID of internal report that is generated
+    """
+
     internal_report = InternalReport.objects.get(pk=internal_report_id)
-    generator = {
-        INTERNAL_REPORT_ACTIVE_USERS: ReporterActiveUsersList,
-        INTERNAL_REPORT_USER_RISK_SCORES: ReporterRiskScoreUsersList,
-        INTERNAL_REPORT_QUARTER_VALIDATION: ReporterInvalidQuarterData,
-        INTERNAL_REPORT_GOALS: ReporterGoals,
-        INTERNAL_REPORT_RECURRENT_ORDERS: ReporterRecurrentOrders,
-        INTERNAL_REPORT_ORDERS: ReporterOrders,
-        INTERNAL_REPORT_BALANCES: ReporterBalances,
-        INTERNAL_REPORT_ASSETS: ReporterAssets
-    }
-    generator[internal_report.type](
+
+    reporter = get_reporter_class(internal_report.type)(
         context=internal_report.context,
         **json.loads(internal_report.input_data)
-    ).run(internal_report)
+    )
+
+    with span('internal_reports.reporter.run',
+              report_id=internal_report_id,
+              reporter=reporter.__class__.__name__):
+        reporter.run(internal_report)
+
+
+@before_task_publish.connect
+def inject_trace_headers(sender=None, headers=None, **kwargs):
+    """
+    Propagate trace context to report generating task via message headers
+    """
+
+    if sender == generate_report_in_background.name:
+        inject_headers(headers)
@@ -0,0 +1,431 @@
+"""
+Cache of formatted portfolio histories shared by reporters and report runs.
+
+Histories are cached per user and data version. Data version is changed
+when user's transactions change, so stale histories are never returned.
+Versions are kept in Django cache shared by all processes, so a change
+saved by a web process invalidates histories cached by Celery workers too.
+Cached history of a wider date range is used for any range inside it.
+Histories are kept in columnar form (see portfolio_history.py).
+
+Keys are prefixed with a namespace version, clearing the cache changes it,
+so only histories of this module are dropped and other keys of the Django
+cache are kept.
+
+Settings:
+
+* INTERNAL_REPORTS_HISTORY_CACHE_BACKEND - 'local' (default), 'shared' or
+  None to disable the cache
+* INTERNAL_REPORTS_HISTORY_CACHE_MAX_BYTES - max estimated size of histories
+  in local cache, in bytes
+* INTERNAL_REPORTS_HISTORY_CACHE_ALIAS - Django cache (e.g. Redis) keeping
+  data versions of both backends and histories of shared backend
+* INTERNAL_REPORTS_HISTORY_CACHE_TIMEOUT - seconds cached history is valid
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+
+from client_core_analyse.errors import CanNotConnectToCoreAnalyze
+from internal_reports.concurrency import unlimited
+from internal_reports.constants import (
+    HISTORY_CACHE_BACKEND_LOCAL,
+    HISTORY_CACHE_BACKEND_SHARED,
+    HISTORY_CACHE_DEFAULT_MAX_BYTES,
+    HISTORY_CACHE_DEFAULT_TIMEOUT,
+    HISTORY_CACHE_RANGES_PER_USER,
+    HISTORY_COMPONENT_ESTIMATED_BYTES,
+    HISTORY_DAY_ESTIMATED_BYTES
+)
+from internal_reports.errors import BrokenPortfolioComponent
+from pdf.errors import NoPortfolioHistory
+
+
+# Errors that are reported for the user instead of failing the report
+HISTORY_ERRORS = (
+    NoPortfolioHistory,
+    BrokenPortfolioComponent,
+    CanNotConnectToCoreAnalyze
+)
+
+
+def to_date(value):
+    """
+    Convert date, datetime or None to date
+    :param value: date value
+    :return: date object or None
+    """
+
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def estimate_history_size(history):
+    """
+    Approximate memory taken by formatted portfolio history
+    :param history: formatted portfolio history
+    :return: size in bytes
+    """
+
+    if hasattr(history, 'estimate_size'):
+        return history.estimate_size()
+
+    components = sum(len(day.get('components') or ())
+                     for day in history.values() if isinstance(day, dict))
+
+    return (len(history) * HISTORY_DAY_ESTIMATED_BYTES
+            + components * HISTORY_COMPONENT_ESTIMATED_BYTES)
+
+
+class HistoryVersions:
+    """
+    Namespace and data versions of users kept in Django cache
+    """
+
+    namespace_key = 'internal_reports:history_namespace'
+
+    def __init__(self, alias):
+        """
+        :param alias: Django cache alias
+        """
+
+        self.cache = caches[alias]
+
+    @staticmethod
+    def get_version_key(user_id):
+        return 'internal_reports:history_version:{}'.format(user_id)
+
+    def get_key(self, user_id):
+        """
+        Key of cached histories of the user
+        :param user_id: UserMapping ID
+        :return: tuple with namespace, user ID and data version
+        """
+
+        version_key = self.get_version_key(user_id)
+        values = self.cache.get_many([self.namespace_key, version_key])
+
+        return (values.get(self.namespace_key, 0), user_id,
+                values.get(version_key, 0))
+
+    def bump(self, user_id):
+        self.increment(self.get_version_key(user_id))
+
+    def clear(self):
+        self.increment(self.namespace_key)
+
+    def increment(self, key):
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, None)
+
+
+class LocalHistoryCacheBackend:
+    """
+    In-process cache with LRU eviction of users, size is limited by
+    estimated size of cached histories. Histories of old versions are not
+    read anymore and are evicted
+    """
+
+    def __init__(self, max_bytes, timeout, versions):
+        """
+        :param max_bytes: max estimated size of cached histories in bytes
+        :param timeout: seconds cached history is valid
+        :param versions: HistoryVersions instance
+        """
+
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.versions = versions
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get_key(self, user_id):
+        return self.versions.get_key(user_id)
+
+    def bump_version(self, user_id):
+        self.versions.bump(user_id)
+
+    def get_entries(self, key):
+        with self.lock:
+            entries = self.entries.get(key)
+
+            if entries is None:
+                return list()
+
+            self.entries.move_to_end(key)
+
+        now = time.time()
+
+        return [entry[:3] for entry in entries if entry[3] > now]
+
+    def add_entry(self, key, start_date, end_date, history):
+        size = estimate_history_size(history)
+
+        with self.lock:
+            self.size -= sum(entry[4] for entry in self.entries.get(key, ()))
+
+            entries = [
+                entry for entry in self.entries.pop(key, list())
+                if not covers(start_date, end_date, entry[0], entry[1])
+            ]
+            entries.append((start_date, end_date, history,
+                            time.time() + self.timeout, size))
+
+            entries = entries[-HISTORY_CACHE_RANGES_PER_USER:]
+            self.entries[key] = entries
+            self.size += sum(entry[4] for entry in entries)
+
+            while self.size > self.max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= sum(entry[4] for entry in evicted)
+
+    def clear(self):
+        self.versions.clear()
+
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class SharedHistoryCacheBackend:
+    """
+    Cache in Django cache backend (Redis in production) shared by all
+    workers. Eviction is done by the cache server
+    """
+
+    def __init__(self, alias, timeout, versions):
+        """
+        :param alias: Django cache alias
+        :param timeout: seconds cached history is valid
+        :param versions: HistoryVersions instance
+        """
+
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.versions = versions
+
+    @staticmethod
+    def get_entries_key(key):
+        return 'internal_reports:history:{}:{}:{}'.format(*key)
+
+    def get_key(self, user_id):
+        return self.versions.get_key(user_id)
+
+    def bump_version(self, user_id):
+        self.versions.bump(user_id)
+
+    def get_entries(self, key):
+        return self.cache.get(self.get_entries_key(key)) or list()
+
+    def add_entry(self, key, start_date, end_date, history):
+        entries = [
+            entry for entry in self.get_entries(key)
+            if not covers(start_date, end_date, entry[0], entry[1])
+        ]
+        entries.append((start_date, end_date, history))
+
+        self.cache.set(self.get_entries_key(key),
+                       entries[-HISTORY_CACHE_RANGES_PER_USER:],
+                       self.timeout)
+
+    def clear(self):
+        self.versions.clear()
+
+
+def covers(cached_start, cached_end, start_date, end_date):
+    """
+    Check if cached date range contains requested one. None means unlimited
+    :return: boolean value
+    """
+
+    return ((cached_start is None
+             or (start_date is not None and cached_start <= start_date))
+            and (cached_end is None
+                 or (end_date is not None and cached_end >= end_date)))
+
+
+def slice_history(history, start_date, end_date):
+    """
+    Take part of history in date range
+    :param history: formatted portfolio history
+    :param start_date: first date or None
+    :param end_date: last date or None
+    :return: history in date range
+    """
+
+    dates = [
+        history_date for history_date in history
+        if (start_date is None or to_date(history_date) >= start_date)
+        and (end_date is None or to_date(history_date) <= end_date)
+    ]
+
+    if hasattr(history, 'slice'):
+        positions = {history_date: row
+                     for row, history_date in enumerate(history)}
+        return history.slice([positions[history_date]
+                              for history_date in dates])
+
+    return OrderedDict(
+        (history_date, history[history_date]) for history_date in dates)
+
+
+class PortfolioHistoryCache:
+    """
+    Read-through cache of formatted portfolio histories
+    """
+
+    def __init__(self, backend):
+        """
+        :param backend: cache backend instance
+        """
+
+        self.backend = backend
+
+    def get(self, user_mapping, start_date, end_date, loader):
+        """
+        Get history from cache or load it
+
+        :param user_mapping: UserMapping instance
+        :param start_date: first date of history
+        :param end_date: last date of history
+        :param loader: function that loads history if it's not cached
+        :return: formatted portfolio history
+        """
+
+        start_date = to_date(start_date)
+        end_date = to_date(end_date)
+
+        key = self.backend.get_key(user_mapping.pk)
+
+        for cached_start, cached_end, history in self.backend.get_entries(key):
+            if (cached_start, cached_end) == (start_date, end_date):
+                return history
+
+            if covers(cached_start, cached_end, start_date, end_date):
+                return slice_history(history, start_date, end_date)
+
+        history = loader()
+
+        self.backend.add_entry(key, start_date, end_date, history)
+
+        return history
+
+    def invalidate(self, user_id):
+        """
+        Drop cached histories of the user
+        :param user_id: UserMapping ID
+        """
+
+        self.backend.bump_version(user_id)
+
+    def clear(self):
+        self.backend.clear()
+
+
+history_cache = None
+history_cache_lock = threading.Lock()
+
+
+def get_history_cache():
+    """
+    Get cache configured in settings
+    :return: PortfolioHistoryCache instance or None if cache is disabled
+    """
+
+    global history_cache
+
+    backend_name = getattr(settings, 'INTERNAL_REPORTS_HISTORY_CACHE_BACKEND',
+                           HISTORY_CACHE_BACKEND_LOCAL)
+
+    if not backend_name:
+        return None
+
+    with history_cache_lock:
+        if history_cache is None:
+            timeout = getattr(settings,
+                              'INTERNAL_REPORTS_HISTORY_CACHE_TIMEOUT',
+                              HISTORY_CACHE_DEFAULT_TIMEOUT)
+            alias = getattr(settings, 'INTERNAL_REPORTS_HISTORY_CACHE_ALIAS',
+                            'default')
+            versions = HistoryVersions(alias)
+
+            if backend_name == HISTORY_CACHE_BACKEND_SHARED:
+                backend = SharedHistoryCacheBackend(
+                    alias=alias,
+                    timeout=timeout,
+                    versions=versions)
+            else:
+                backend = LocalHistoryCacheBackend(
+                    max_bytes=getattr(
+                        settings, 'INTERNAL_REPORTS_HISTORY_CACHE_MAX_BYTES',
+                        HISTORY_CACHE_DEFAULT_MAX_BYTES),
+                    timeout=timeout,
+                    versions=versions)
+
+            history_cache = PortfolioHistoryCache(backend)
+
+    return history_cache
+
+
+def get_cached_portfolio_history(user_mapping, start_date, end_date,
+                                 call_slot=unlimited, use_cache=True):
+    """
+    Get formatted portfolio history through the cache
+
+    :param user_mapping: UserMapping instance
+    :param start_date: first date of history
+    :param end_date: last date of history
+    :param call_slot: context manager factory Core Analyse call runs in,
+        it's not entered if history is cached
+    :param use_cache: False to load history without reading or filling
+        the cache, for one-pass jobs over all users
+    :return: formatted portfolio history
+    """
+
+    from internal_reports.portfolio_history import to_columnar
+    from pdf.utils import get_formatted_portfolio_history
+
+    def load_history():
+        with call_slot():
+            history = get_formatted_portfolio_history(
+                user_mapping, start_date, end_date)
+
+        return to_columnar(history)
+
+    cache = get_history_cache() if use_cache else None
+
+    if cache is None:
+        return load_history()
+
+    return cache.get(user_mapping, start_date, end_date, load_history)
+
+
+def invalidate_user_history(user_id):
+    """
+    Drop cached histories of the user
+    :param user_id: UserMapping ID
+    """
+
+    cache = get_history_cache()
+
+    if cache is not None:
+        cache.invalidate(user_id)
+
+
+def clear_history_cache():
+    """
+    Drop all cached histories
+    """
+
+    cache = get_history_cache()
+
+    if cache is not None:
+        cache.clear()
@@ -0,0 +1,100 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand
+
+
+MEASURE_SCRIPT = """
+import resource
+import time
+
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+
+import json
+import sys
+
+import django
+
+django.setup()
+
+setup_time = time.perf_counter() - started
+
+import internal_reports.urls
+
+print(json.dumps(dict(
+    import_time=time.perf_counter() - started,
+    setup_time=setup_time,
+    max_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    rss_growth_kb=(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                   - rss_before),
+    loaded=[name for name in {modules} if name in sys.modules]
+)))
+"""
+
+HEAVY_MODULES = [
+    'pandas',
+    'numpy',
+    'pdf.errors',
+    'pdf.utils',
+    'pdf.generators.quarter_report_modules',
+    'client_core_analyse',
+    'internal_reports.history_cache',
+    'internal_reports.reports.active_users_list',
+    'internal_reports.reports.validate_quarter_data',
+]
+
+
+def measure_import():
+    """
+    Import internal reports URLs in a fresh interpreter. Measurement starts
+    in the bare interpreter, so Django setup and modules imported by
+    AppConfig.ready() are included
+
+    :return: dict with import time, setup time, memory and heavy modules
+        loaded as a side effect
+    """
+
+    script = MEASURE_SCRIPT.format(modules=repr(HEAVY_MODULES))
+    output = subprocess.check_output([sys.executable, '-c', script],
+                                     env=dict(os.environ))
+
+    return json.loads(output.decode().splitlines()[-1])
+
+
+class Command(BaseCommand):
+    """
+    Measure how expensive it is for a web worker to import internal reports
+    URLs: import time, memory and heavy modules loaded as a side effect.
+    Every run happens in a fresh interpreter.
+    """
+
+    help = 'Benchmark import of internal_reports.urls in a fresh process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help='Number of fresh processes to measure')
+
+    def handle(self, *args, **options):
+        results = [measure_import() for _ in range(options['runs'])]
+
+        import_times = [result['import_time'] for result in results]
+
+        self.stdout.write('Runs: {}'.format(len(results)))
+        self.stdout.write('Django setup, median: {:.3f}s'.format(
+            statistics.median([result['setup_time'] for result in results])))
+        self.stdout.write('Import time with setup, median: {:.3f}s '
+                          '(min {:.3f}s, max {:.3f}s)'.format(
+                              statistics.median(import_times),
+                              min(import_times), max(import_times)))
+        self.stdout.write('Max RSS, median: {} kB'.format(statistics.median(
+            [result['max_rss_kb'] for result in results])))
+        self.stdout.write(
+            'RSS growth from bare interpreter, median: {} kB'.format(
+                statistics.median(
+                    [result['rss_growth_kb'] for result in results])))
+        self.stdout.write('Heavy modules loaded: {}'.format(
+            ', '.join(results[-1]['loaded']) or 'none'))
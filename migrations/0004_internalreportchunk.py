@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-19 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internal_reports', '0003_auto_20200318_2153'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='internalreport',
+            name='metrics',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='InternalReportChunk',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True,
+                    primary_key=True,
+                    serialize=False,
+                    verbose_name='ID'
+                )),
+                ('number', models.IntegerField()),
+                ('data', models.TextField()),
+                ('report', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='chunks',
+                    to='internal_reports.InternalReport'
+                )),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='internalreportchunk',
+            unique_together=set([('report', 'number')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-19 11:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internal_reports', '0004_internalreportchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='internalreport',
+            name='presorted',
+            field=models.BooleanField(default=False),
+        ),
+    ]
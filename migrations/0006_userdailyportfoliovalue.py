@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-19 12:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permission', '0028_auto_20191009_1337'),
+        ('internal_reports', '0005_internalreport_presorted'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDailyPortfolioValue',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True,
+                    primary_key=True,
+                    serialize=False,
+                    verbose_name='ID'
+                )),
+                ('date', models.DateField()),
+                ('value', models.FloatField()),
+                ('user', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='daily_portfolio_values',
+                    to='permission.UserMapping'
+                )),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserDailyPortfolioValueSync',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True,
+                    primary_key=True,
+                    serialize=False,
+                    verbose_name='ID'
+                )),
+                ('synced_from', models.DateField()),
+                ('synced_until', models.DateField()),
+                ('user', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='daily_portfolio_values_sync',
+                    to='permission.UserMapping'
+                )),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='userdailyportfoliovalue',
+            unique_together=set([('user', 'date')]),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-19 14:05
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permission', '0028_auto_20191009_1337'),
+        ('internal_reports', '0006_userdailyportfoliovalue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuarterReportData',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True,
+                    primary_key=True,
+                    serialize=False,
+                    verbose_name='ID'
+                )),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('portfolio_creating_date', models.DateField()),
+                ('data_version', models.PositiveSmallIntegerField()),
+                ('summary', models.TextField()),
+                ('overview', models.TextField()),
+                ('created', models.DateTimeField(
+                    default=datetime.datetime.now
+                )),
+                ('user', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='quarter_report_data',
+                    to='permission.UserMapping'
+                )),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='quarterreportdata',
+            unique_together=set([(
+                'user',
+                'start_date',
+                'end_date',
+                'portfolio_creating_date',
+                'data_version'
+            )]),
+        ),
+    ]
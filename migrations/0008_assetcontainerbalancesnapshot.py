@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-19 17:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permission', '0028_auto_20191009_1337'),
+        ('internal_reports', '0007_quarterreportdata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetContainerBalanceSnapshot',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True,
+                    primary_key=True,
+                    serialize=False,
+                    verbose_name='ID'
+                )),
+                ('container_id', models.IntegerField()),
+                ('date', models.DateField()),
+                ('name', models.CharField(max_length=255, null=True)),
+                ('type', models.CharField(max_length=255, null=True)),
+                ('value', models.FloatField(null=True)),
+                ('user', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='balance_snapshots',
+                    to='permission.UserMapping'
+                )),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='assetcontainerbalancesnapshot',
+            unique_together=set([('date', 'container_id')]),
+        ),
+    ]
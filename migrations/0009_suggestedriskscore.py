@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-19 18:10
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permission', '0028_auto_20191009_1337'),
+        ('internal_reports', '0008_assetcontainerbalancesnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SuggestedRiskScore',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True,
+                    primary_key=True,
+                    serialize=False,
+                    verbose_name='ID'
+                )),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('value', models.TextField()),
+                ('computed', models.DateTimeField(
+                    default=datetime.datetime.now
+                )),
+                ('user', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='suggested_risk_score',
+                    to='permission.UserMapping'
+                )),
+            ],
+        ),
+    ]
@@ -4,10 +4,12 @@ from datetime import datetime
 from django.db import models
 
 from internal_reports.constants import (
+    INTERNAL_REPORT_ACTIVE_USERS,
     INTERNAL_REPORT_TYPES,
     INTERNAL_REPORT_STATUSES,
     INTERNAL_REPORT_CSV_COLUMNS)
-from permission.models import AppContext
+from internal_reports.utils import get_thresholds_csv_columns
+from permission.models import AppContext, UserMapping
 
 
 class InternalReport(models.Model):
@@ -19,7 +21,10 @@ class InternalReport(models.Model):
     :cvar status: report status
     :cvar generated: timestamp when report was generated
     :cvar input_data: info from report request
-    :cvar data: report data
+    :cvar data: report data or message if report has no rows. Rows of
+        generated reports are stored in InternalReportChunk
+    :cvar metrics: JSON with report generating metrics
+    :cvar presorted: report rows are stored sorted by user_id
     """
 
     context = models.ForeignKey(AppContext, verbose_name="Context")
@@ -28,6 +33,8 @@ class InternalReport(models.Model):
     generated = models.DateTimeField(default=datetime.now)
     input_data = models.TextField()
     data = models.TextField(null=True, blank=True)
+    metrics = models.TextField(null=True, blank=True)
+    presorted = models.BooleanField(default=False)
 
     def __str__(self):
         return '{type} report ({status}) from {date}'.format(
@@ -37,13 +44,184 @@ class InternalReport(models.Model):
         )
 
     def get_csv_columns(self):
+        if self.type == INTERNAL_REPORT_ACTIVE_USERS:
+            thresholds = json.loads(self.input_data).get('thresholds')
+
+            if thresholds:
+                return get_thresholds_csv_columns(thresholds)
+
         return INTERNAL_REPORT_CSV_COLUMNS[self.type]
 
+    def iter_rows(self):
+        """
+        Iterate over report rows stored in chunks
+        """
+
+        for chunk in self.chunks.order_by('number').iterator():
+            for row in json.loads(chunk.data):
+                yield row
+
     def get_data(self):
-        if not self.data:
-            return 'Report has no data'
-        else:
+        """
+        Get legacy report data stored in data field. Reports stored in chunks
+        are read with iter_rows()
+        """
+
+        if self.data:
             try:
                 return json.loads(self.data)
             except ValueError:
                 return 'Report has broken data'
+
+        return 'Report has no data'
+
+    def get_metrics(self):
+        if not self.metrics:
+            return dict()
+        return json.loads(self.metrics)
+
+    def update_metrics(self, **metrics):
+        """
+        Add values to report metrics. Report is not saved
+        """
+
+        data = self.get_metrics()
+        data.update(metrics)
+        self.metrics = json.dumps(data)
+
+
+class InternalReportChunk(models.Model):
+    """
+    Table to store internal report rows in chunks, so generating and storing
+    report does not need the whole report in memory.
+
+    :cvar report: InternalReport this chunk belongs to
+    :cvar number: position of the chunk in the report
+    :cvar data: JSON list with report rows
+    """
+
+    report = models.ForeignKey(InternalReport, related_name='chunks',
+                               on_delete=models.CASCADE)
+    number = models.IntegerField()
+    data = models.TextField()
+
+    class Meta:
+        unique_together = ('report', 'number')
+
+
+class UserDailyPortfolioValue(models.Model):
+    """
+    Table to store daily portfolio values of users. It's filled by
+    fill_daily_portfolio_values task and used by active users report.
+
+    :cvar user: UserMapping the value belongs to
+    :cvar date: day of the value
+    :cvar value: portfolio value in EUR rounded to cents
+    """
+
+    user = models.ForeignKey(UserMapping,
+                             related_name='daily_portfolio_values',
+                             on_delete=models.CASCADE)
+    date = models.DateField()
+    value = models.FloatField()
+
+    class Meta:
+        unique_together = ('user', 'date')
+
+
+class UserDailyPortfolioValueSync(models.Model):
+    """
+    Table to store date range of user's daily portfolio values that are
+    complete. It's removed when user's transactions change.
+
+    :cvar user: UserMapping the range belongs to
+    :cvar synced_from: first date of the range
+    :cvar synced_until: last date of the range
+    """
+
+    user = models.OneToOneField(UserMapping,
+                                related_name='daily_portfolio_values_sync',
+                                on_delete=models.CASCADE)
+    synced_from = models.DateField()
+    synced_until = models.DateField()
+
+
+class QuarterReportData(models.Model):
+    """
+    Table to store computed quarter report data of users, used by quarter
+    validation. Rows of the user are removed when user's transactions
+    change, so stored data is always up to date.
+
+    :cvar user: UserMapping the data belongs to
+    :cvar start_date: quarter start date
+    :cvar end_date: quarter end date
+    :cvar portfolio_creating_date: portfolio creating date data is computed
+        with
+    :cvar data_version: version of calculation data is computed with
+    :cvar summary: JSON with result of PortfolioSummaryCalculator
+    :cvar overview: JSON with portfolio overview data
+    :cvar created: timestamp when data was computed
+    """
+
+    user = models.ForeignKey(UserMapping,
+                             related_name='quarter_report_data',
+                             on_delete=models.CASCADE)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    portfolio_creating_date = models.DateField()
+    data_version = models.PositiveSmallIntegerField()
+    summary = models.TextField()
+    overview = models.TextField()
+    created = models.DateTimeField(default=datetime.now)
+
+    class Meta:
+        unique_together = ('user', 'start_date', 'end_date',
+                           'portfolio_creating_date', 'data_version')
+
+
+class AssetContainerBalanceSnapshot(models.Model):
+    """
+    Table to store values of asset containers per day. It's filled by
+    snapshot_balances task and used by balances report for past dates.
+    Container is stored by ID with its name and type of the day, so
+    balances of removed containers are still reported.
+
+    :cvar container_id: AssetContainer ID
+    :cvar user: UserMapping the container belongs to
+    :cvar date: day of the value
+    :cvar name: container name
+    :cvar type: container type name
+    :cvar value: container value
+    """
+
+    container_id = models.IntegerField()
+    user = models.ForeignKey(UserMapping,
+                             related_name='balance_snapshots',
+                             on_delete=models.CASCADE)
+    date = models.DateField()
+    name = models.CharField(max_length=255, null=True)
+    type = models.CharField(max_length=255, null=True)
+    value = models.FloatField(null=True)
+
+    class Meta:
+        # Leading date column serves report queries for a day
+        unique_together = ('date', 'container_id')
+
+
+class SuggestedRiskScore(models.Model):
+    """
+    Table to store suggested risk scores of users. Score is computed again
+    when fingerprint of its inputs changes, see suggested_risk_scores.py.
+
+    :cvar user: UserMapping the score belongs to
+    :cvar fingerprint: hash of the inputs the score is computed from
+    :cvar value: JSON encoded suggested risk score
+    :cvar computed: timestamp when the score was computed
+    """
+
+    user = models.OneToOneField(UserMapping,
+                                related_name='suggested_risk_score',
+                                on_delete=models.CASCADE)
+    fingerprint = models.CharField(max_length=40)
+    value = models.TextField()
+    computed = models.DateTimeField(default=datetime.now)
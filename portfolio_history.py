@@ -0,0 +1,327 @@
+"""
+Columnar representation of formatted portfolio history.
+
+Formatted history is a dict of date -> {'components': [dict, ...]}, so a few
+years of history take tens of thousands of small dicts per user. Here all
+components are stored in flat per-key columns: float values in float arrays,
+other values (ISIN codes, names, flags) as integer codes into a list of
+unique values. Day dicts are built on access, so existing callers work with
+the history as with a usual read-only dict.
+
+The mapping is read-only: every access builds a new day dict, so changes
+made to it are lost and reading a day again builds it again. Code that
+changes days or reads them many times (PDF calculators) gets a usual dict
+from to_dict() once.
+"""
+from collections.abc import Mapping
+
+import numpy
+
+from internal_reports.constants import (
+    HISTORY_DAY_ESTIMATED_BYTES,
+    HISTORY_VALUE_ESTIMATED_BYTES
+)
+from internal_reports.daily_values import DailyPortfolioValues
+from internal_reports.errors import BrokenPortfolioComponent
+
+
+COMPONENTS_KEY = 'components'
+
+# Placeholder for components without the key, never returned to callers
+MISSING = object()
+
+
+class FloatColumn:
+    """
+    Component values which are all floats
+    """
+
+    def __init__(self, values):
+        self.values = numpy.array(values, dtype=float)
+
+    def get(self, index):
+        return self.values[index].item()
+
+    def as_floats(self):
+        return self.values
+
+    def estimate_size(self):
+        return self.values.nbytes
+
+    def take(self, indexes):
+        column = FloatColumn.__new__(FloatColumn)
+        column.values = self.values[indexes]
+        return column
+
+
+class CodedColumn:
+    """
+    Component values of any hashable type stored as codes of unique values.
+    Values are told apart by type too, so 1, 1.0 and True stay different
+    """
+
+    def __init__(self, values):
+        uniques = dict()
+
+        codes = [uniques.setdefault((type(value), value), len(uniques))
+                 for value in values]
+
+        self.uniques = [value for _, value in uniques]
+        self.codes = numpy.array(codes, dtype=numpy.int32)
+
+    def get(self, index):
+        return self.uniques[self.codes[index]]
+
+    def as_floats(self):
+        return numpy.array(self.uniques, dtype=float)[self.codes]
+
+    def estimate_size(self):
+        return (self.codes.nbytes
+                + len(self.uniques) * HISTORY_VALUE_ESTIMATED_BYTES)
+
+    def take(self, indexes):
+        column = CodedColumn.__new__(CodedColumn)
+        column.uniques = self.uniques
+        column.codes = self.codes[indexes]
+        return column
+
+
+def make_column(values):
+    """
+    Choose storage for component values
+    :param values: list of values, MISSING for components without the key
+    :return: FloatColumn or CodedColumn instance
+    """
+
+    if all(type(value) is float for value in values if value is not MISSING):
+        return FloatColumn([numpy.nan if value is MISSING else value
+                            for value in values])
+
+    return CodedColumn(values)
+
+
+class ColumnarPortfolioHistory(Mapping):
+    """
+    Read-only formatted portfolio history stored by columns
+    """
+
+    def __init__(self, dates, days, offsets, shapes, shape_codes, columns):
+        """
+        :param dates: list with history dates
+        :param days: list with day dicts without components
+        :param offsets: array with index of the first component of every day
+            and total number of components at the end
+        :param shapes: list with tuples of component keys
+        :param shape_codes: array with index of shape for every component
+        :param columns: dict with key as key and column as value
+        """
+
+        self.dates = dates
+        self.days = days
+        self.offsets = offsets
+        self.shapes = shapes
+        self.shape_codes = shape_codes
+        self.columns = columns
+        self.index = {date: row for row, date in enumerate(dates)}
+
+    @classmethod
+    def from_dict(cls, portfolio_history):
+        """
+        Build columnar history from formatted portfolio history
+        :param portfolio_history: dict with date as key and dict with
+            components list as value
+        :return: ColumnarPortfolioHistory instance
+        :raises ValueError: if history can not be stored by columns
+        """
+
+        dates = list(portfolio_history.keys())
+        days = list()
+        offsets = [0]
+        shapes = dict()
+        shape_codes = list()
+        values = dict()
+
+        for date in dates:
+            day = portfolio_history[date]
+
+            if (not isinstance(day, dict)
+                    or not isinstance(day.get(COMPONENTS_KEY), list)):
+                raise ValueError('Day {} has no components list'.format(date))
+
+            day = dict(day)
+            components = day[COMPONENTS_KEY]
+            day[COMPONENTS_KEY] = None
+            days.append(day)
+
+            for component in components:
+                if not isinstance(component, dict):
+                    raise ValueError('Component is not a dict')
+
+                index = len(shape_codes)
+
+                shape_codes.append(
+                    shapes.setdefault(tuple(component), len(shapes)))
+
+                for key, value in component.items():
+                    if key not in values:
+                        values[key] = [MISSING] * index
+                    values[key].append(value)
+
+                for key_values in values.values():
+                    if len(key_values) == index:
+                        key_values.append(MISSING)
+
+            offsets.append(len(shape_codes))
+
+        try:
+            columns = {key: make_column(key_values)
+                       for key, key_values in values.items()}
+        except TypeError:
+            raise ValueError('Component has unhashable values')
+
+        return cls(
+            dates=dates,
+            days=days,
+            offsets=numpy.array(offsets, dtype=numpy.int64),
+            shapes=list(shapes),
+            shape_codes=numpy.array(shape_codes, dtype=numpy.int32),
+            columns=columns
+        )
+
+    def __getitem__(self, date):
+        """
+        Build day dict, changes made to it are not kept in the history
+        :param date: history date
+        :return: dict with day data and components list
+        """
+
+        row = self.index[date]
+
+        day = dict(self.days[row])
+        day[COMPONENTS_KEY] = [
+            self.get_component(index)
+            for index in range(self.offsets[row], self.offsets[row + 1])
+        ]
+
+        return day
+
+    def __iter__(self):
+        return iter(self.dates)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def copy(self):
+        return dict(self.items())
+
+    def estimate_size(self):
+        """
+        Approximate memory taken by the history
+        :return: size in bytes
+        """
+
+        return (len(self.dates) * HISTORY_DAY_ESTIMATED_BYTES
+                + self.offsets.nbytes + self.shape_codes.nbytes
+                + sum(column.estimate_size()
+                      for column in self.columns.values()))
+
+    def get_component(self, index):
+        """
+        Build component dict
+        :param index: index of the component in columns
+        :return: dict with component data
+        """
+
+        return {key: self.columns[key].get(index)
+                for key in self.shapes[self.shape_codes[index]]}
+
+    def get_float_column(self, key):
+        """
+        Component values as floats
+        :param key: component key, e.g. 'price_eur'
+        :return: array with value of every component
+        :raises BrokenPortfolioComponent: if some component has no such key
+        """
+
+        if key not in self.columns or not all(
+                key in self.shapes[code]
+                for code in numpy.unique(self.shape_codes)):
+            raise BrokenPortfolioComponent
+
+        return self.columns[key].as_floats()
+
+    def daily_values(self):
+        """
+        Calculate daily portfolio values
+        :return: DailyPortfolioValues instance
+        """
+
+        counts = numpy.diff(self.offsets)
+        width = int(counts.max()) if len(counts) else 0
+
+        prices = numpy.zeros((len(self.dates), width))
+        quantities = numpy.zeros((len(self.dates), width))
+
+        if len(self.shape_codes):
+            rows = numpy.repeat(numpy.arange(len(self.dates)), counts)
+            slots = numpy.arange(len(self.shape_codes)) - self.offsets[rows]
+
+            prices[rows, slots] = self.get_float_column('price_eur')
+            quantities[rows, slots] = self.get_float_column('quantity')
+
+        return DailyPortfolioValues.from_matrices(self.dates, prices,
+                                                  quantities)
+
+    def slice(self, rows):
+        """
+        Take part of history
+        :param rows: list with indexes of days to keep
+        :return: ColumnarPortfolioHistory instance
+        """
+
+        starts = self.offsets[rows]
+        counts = self.offsets[numpy.array(rows, dtype=numpy.int64) + 1] - starts
+
+        indexes = numpy.concatenate(
+            [numpy.arange(start, start + count)
+             for start, count in zip(starts.tolist(), counts.tolist())]
+            or [numpy.array([], dtype=numpy.int64)])
+
+        return ColumnarPortfolioHistory(
+            dates=[self.dates[row] for row in rows],
+            days=[self.days[row] for row in rows],
+            offsets=numpy.concatenate(([0], numpy.cumsum(counts))),
+            shapes=self.shapes,
+            shape_codes=self.shape_codes[indexes],
+            columns={key: column.take(indexes)
+                     for key, column in self.columns.items()}
+        )
+
+
+def to_columnar(portfolio_history):
+    """
+    Store history by columns if possible
+    :param portfolio_history: formatted portfolio history
+    :return: ColumnarPortfolioHistory instance or the history itself
+    """
+
+    if isinstance(portfolio_history, ColumnarPortfolioHistory):
+        return portfolio_history
+
+    try:
+        return ColumnarPortfolioHistory.from_dict(portfolio_history)
+    except ValueError:
+        return portfolio_history
+
+
+def to_dict(portfolio_history):
+    """
+    Build usual dict history, day dicts are built once and can be changed
+    :param portfolio_history: formatted portfolio history
+    :return: dict with date as key and day dict as value
+    """
+
+    if isinstance(portfolio_history, ColumnarPortfolioHistory):
+        return portfolio_history.copy()
+
+    return portfolio_history
@@ -0,0 +1,209 @@
+"""
+Quarter report data checks evaluated for many users at once.
+
+UserQuarterDataValidator collects numbers the checks need with
+gather_check_values and evaluate_checks runs all checks for a batch of
+users with NumPy. Results are the same as of the per-user checks:
+
+* sums are accumulated in the same order, item by item
+* round_values rounds like round(), values close to a tie are rounded
+  with round() itself
+"""
+import numpy
+
+from serviceAPI.settings import ISIN_CASH_COMPONENT
+
+
+NUMBER_TYPES = (int, float)
+# Integers up to this value are exact in float arrays
+MAX_EXACT_INT = 2 ** 53
+
+
+def round_values(values, digits=2):
+    """
+    Round array of floats exactly like round() does
+
+    :param values: array with values
+    :param digits: number of decimal digits
+    :return: array with rounded values
+    """
+
+    values = numpy.asarray(values, dtype=float)
+
+    scaled = values * 10.0 ** digits
+    result = numpy.rint(scaled) / 10.0 ** digits
+
+    # Product has rounding error, so only values far from a tie are
+    # rounded the same way as the exact decimal value
+    distance = numpy.abs(numpy.abs(scaled - numpy.floor(scaled)) - 0.5)
+    ambiguous = ~numpy.isfinite(scaled) | (
+        distance <= 1e-9 + numpy.abs(scaled) * 1e-15)
+
+    for index in numpy.flatnonzero(ambiguous):
+        result[index] = round(float(values[index]), digits)
+
+    return result
+
+
+def to_matrix(rows, depth=None):
+    """
+    Put rows of different length to array padded with zeros
+    :param rows: list of lists with values
+    :param depth: length of every value if values are tuples
+    :return: array with row per list
+    """
+
+    width = max((len(row) for row in rows), default=0)
+    shape = (len(rows), width) if depth is None else (len(rows), width, depth)
+    matrix = numpy.zeros(shape)
+
+    for index, row in enumerate(rows):
+        if row:
+            matrix[index, :len(row)] = row
+
+    return matrix
+
+
+def sequential_sum(matrix):
+    """
+    Sum values of every row one by one from left to right, like a loop
+    with += does
+    :param matrix: 2d array
+    :return: array with sum of every row
+    """
+
+    totals = numpy.zeros(matrix.shape[0])
+
+    for column in range(matrix.shape[1]):
+        totals += matrix[:, column]
+
+    return totals
+
+
+def is_number(value):
+    return (type(value) in NUMBER_TYPES
+            and (type(value) is float or abs(value) <= MAX_EXACT_INT))
+
+
+def gather_check_values(summary, overview_raw):
+    """
+    Collect numbers for the checks of one user. Data is read the same way
+    the per-user checks read it, so broken data raises the same errors
+
+    :param summary: Quarter summary data
+    :param overview_raw: Quarter overview data
+    :return: dict with values or None if some value is not a float or int
+    """
+
+    overview = dict()
+    isins = list()
+
+    for item in overview_raw:
+        isins.append(item['isin'])
+        overview[item['isin']] = item
+
+    flow_per_asset = summary['flow_per_asset']
+    isins += flow_per_asset.keys()
+
+    asset_values = dict()
+    assets_balance_terms = list()
+
+    for isin in set(isins):
+        start_value = overview.get(isin, dict()).get('start_total_value', 0)
+        end_value = overview.get(isin, dict()).get('end_total_value', 0)
+        flow_value = flow_per_asset.get(isin, 0)
+
+        asset_values[isin] = (start_value, end_value)
+        assets_balance_terms.append((start_value, flow_value, end_value))
+
+    if summary['flow_before_last_sell'] is not None:
+        flow = summary['flow_before_last_sell']
+    else:
+        flow = summary['net_inflow_outflow']
+
+    values = dict(
+        assets_balance_terms=assets_balance_terms,
+        vs_flow=flow_per_asset[ISIN_CASH_COMPONENT],
+        cash_start=asset_values[ISIN_CASH_COMPONENT][0],
+        cash_end=asset_values[ISIN_CASH_COMPONENT][1],
+        return_in_cash=summary['return_in_cash'],
+        cumulative_performance=summary['cumulative_performance'],
+        flow=flow,
+        ptf_end=(summary['ptf_before_last_sell']
+                 or summary['portfolio_end_value']),
+        portfolio_start_value=summary['portfolio_start_value'],
+        overview_start=[item['start_total_value'] for item in overview_raw],
+        overview_end=[item['end_total_value'] for item in overview_raw]
+    )
+
+    numbers = [value for key, value in values.items()
+               if key not in ('assets_balance_terms', 'overview_start',
+                              'overview_end')]
+    numbers += [value for term in assets_balance_terms for value in term]
+    numbers += values['overview_start'] + values['overview_end']
+
+    if not all(is_number(value) for value in numbers):
+        return None
+
+    return values
+
+
+def evaluate_checks(records):
+    """
+    Run quarter data checks for many users
+
+    :param records: list of dicts from gather_check_values
+    :return: list of dicts with check results for every record
+    """
+
+    if not records:
+        return list()
+
+    def column(key):
+        return numpy.array([record[key] for record in records], dtype=float)
+
+    terms = to_matrix([record['assets_balance_terms'] for record in records],
+                      depth=3)
+
+    assets_balance = sequential_sum(
+        (terms[:, :, 0] + terms[:, :, 1]) - terms[:, :, 2])
+
+    return_in_cash = column('return_in_cash')
+    cumulative_performance = column('cumulative_performance')
+    portfolio_start_value = column('portfolio_start_value')
+
+    revenue_per_asset = round_values(
+        round_values(assets_balance) + round_values(return_in_cash))
+
+    vs_valid = (round_values(column('cash_end'))
+                == round_values(column('vs_flow') + column('cash_start')))
+
+    revenue_is_valid = ((-0.1 <= cumulative_performance)
+                        & (cumulative_performance <= 0.1))
+
+    flow = round_values(column('flow'))
+    ptf_end = round_values(column('ptf_end'))
+
+    start_valid = (
+        round_values(sequential_sum(to_matrix(
+            [record['overview_start'] for record in records])))
+        == round_values(portfolio_start_value))
+    end_valid = (
+        round_values(sequential_sum(to_matrix(
+            [record['overview_end'] for record in records])))
+        == ptf_end)
+    trans_and_revenue_valid = (
+        round_values(portfolio_start_value + flow + return_in_cash)
+        == ptf_end)
+
+    return [
+        dict(
+            revenue_per_asset_valid=bool(revenue_per_asset[index] == 0),
+            vs_valid=bool(vs_valid[index]),
+            revenue_is_valid=bool(revenue_is_valid[index]),
+            start_valid=bool(start_valid[index]),
+            end_valid=bool(end_valid[index]),
+            trans_and_revenue_valid=bool(trans_and_revenue_valid[index])
+        )
+        for index in range(len(records))
+    ]
@@ -0,0 +1,235 @@
+"""
+Quarter report data of users (summary and overview) computed once and
+stored in QuarterReportData.
+
+Quarter validation reads data through get_quarter_report_data, so repeated
+validations of a finished quarter pay for Core Analyse calls and
+calculations once. PDF quarter reports are generated outside this app and
+don't read the stored data yet, they can use get_quarter_report_data the
+same way. Stored data of the user is removed when
+user's transactions change (see signals.py). Data is stored with the
+version of calculation, so data stored by older code is not used. Data of
+quarters that are not finished yet is not stored.
+
+Data is stored as JSON, dates and decimals are tagged, so they are read
+back with the same types. Data that can't be read back equal is not stored.
+
+Settings:
+
+* INTERNAL_REPORTS_QUARTER_DATA_CACHE - store and reuse computed data
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from internal_reports.concurrency import unlimited
+from internal_reports.constants import (
+    QUARTER_REPORT_DATA_CACHE_DEFAULT,
+    QUARTER_REPORT_DATA_VERSION
+)
+from internal_reports.history_cache import get_cached_portfolio_history
+from internal_reports.models import QuarterReportData
+from internal_reports.portfolio_history import to_dict
+from internal_reports.tracing import child_span
+from pdf.generators.quarter_report_modules.overview import (
+    get_portfolio_overview
+)
+from pdf.generators.quarter_report_modules.performance import (
+    PortfolioPerformanceGenerator
+)
+from pdf.generators.quarter_report_modules.summary import (
+    PortfolioSummaryCalculator
+)
+
+
+def calculate_quarter_report_data(user_mapping, start_date, end_date,
+                                  portfolio_creating_date,
+                                  call_slot=unlimited):
+    """
+    Calculate quarter report summary and overview
+
+    :param user_mapping: UserMapping instance
+    :param start_date: quarter start date
+    :param end_date: quarter end date
+    :param portfolio_creating_date: portfolio creating date
+    :param call_slot: context manager factory Core Analyse calls run in
+    :return: tuple with summary and overview data
+    """
+
+    with child_span('core_analyse.portfolio_history'):
+        history = get_cached_portfolio_history(
+            user_mapping=user_mapping,
+            start_date=portfolio_creating_date,
+            end_date=end_date,
+            call_slot=call_slot
+        )
+
+    # Summary and overview read days many times and may change them
+    history = to_dict(history)
+
+    with child_span('core_analyse.portfolio_performance'), call_slot():
+        portfolio_performance = PortfolioPerformanceGenerator(
+            user_mapping=user_mapping,
+            start_date=start_date,
+            end_date=end_date,
+            portfolio_creating_date=portfolio_creating_date
+        ).get_performance_data()
+
+    with child_span('internal_reports.quarter_validation.summary'):
+        summary = PortfolioSummaryCalculator(
+            user_mapping=user_mapping,
+            start_date=start_date,
+            end_date=end_date,
+            portfolio_creating_date=portfolio_creating_date,
+            portfolio_history=history,
+            costs=None,
+            portfolio_performance=portfolio_performance
+        ).calculate_extended()
+
+    date = end_date
+
+    last_sell_date = summary['last_sell_date']
+
+    if last_sell_date:
+        date = last_sell_date
+
+    with child_span('internal_reports.quarter_validation.overview'):
+        overview = get_portfolio_overview(
+            start_date=start_date,
+            end_date=date,
+            portfolio_creating_date=portfolio_creating_date,
+            portfolio_history=history
+        )['data']
+
+    return summary, overview
+
+
+def encode_value(value):
+    """
+    Tag values JSON has no type for
+    :param value: value json can't serialize
+    :return: JSON serializable value
+    """
+
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    if isinstance(value, numpy.generic):
+        return value.item()
+
+    raise TypeError('{} is not JSON serializable'.format(type(value)))
+
+
+def decode_value(value):
+    """
+    Read values tagged by encode_value
+    :param value: dict from JSON
+    :return: original value
+    """
+
+    if '__datetime__' in value:
+        text = value['__datetime__']
+        return datetime.strptime(
+            text, '%Y-%m-%dT%H:%M:%S.%f' if '.' in text
+            else '%Y-%m-%dT%H:%M:%S')
+    if '__date__' in value:
+        return datetime.strptime(value['__date__'], '%Y-%m-%d').date()
+    if '__decimal__' in value:
+        return Decimal(value['__decimal__'])
+
+    return value
+
+
+def dump_data(data):
+    """
+    Serialize quarter report data
+    :param data: summary or overview
+    :return: JSON string or None if data can't be read back equal
+    """
+
+    try:
+        dumped = json.dumps(data, default=encode_value)
+    except (TypeError, ValueError):
+        return None
+
+    if load_data(dumped) != data:
+        return None
+
+    return dumped
+
+
+def load_data(dumped):
+    """
+    Read quarter report data serialized by dump_data
+    :param dumped: JSON string
+    :return: summary or overview
+    """
+
+    return json.loads(dumped, object_hook=decode_value)
+
+
+def get_quarter_report_data(user_mapping, start_date, end_date,
+                            portfolio_creating_date, call_slot=unlimited,
+                            db_slot=unlimited, recompute=False):
+    """
+    Get stored quarter report summary and overview or calculate and store
+    them
+
+    :param user_mapping: UserMapping instance
+    :param start_date: quarter start date
+    :param end_date: quarter end date
+    :param portfolio_creating_date: portfolio creating date
+    :param call_slot: context manager factory Core Analyse calls run in
+    :param db_slot: context manager factory reads and writes of stored data
+        run in
+    :param recompute: calculate data even if it's stored and replace it
+    :return: tuple with summary and overview data
+    """
+
+    if (not getattr(settings, 'INTERNAL_REPORTS_QUARTER_DATA_CACHE',
+                    QUARTER_REPORT_DATA_CACHE_DEFAULT)
+            or end_date >= date.today()):
+        return calculate_quarter_report_data(
+            user_mapping, start_date, end_date, portfolio_creating_date,
+            call_slot)
+
+    key = dict(
+        user_id=user_mapping.pk,
+        start_date=start_date,
+        end_date=end_date,
+        portfolio_creating_date=portfolio_creating_date,
+        data_version=QUARTER_REPORT_DATA_VERSION
+    )
+
+    if not recompute:
+        with db_slot():
+            stored = QuarterReportData.objects.filter(**key).first()
+
+        if stored is not None:
+            return load_data(stored.summary), load_data(stored.overview)
+
+    summary, overview = calculate_quarter_report_data(
+        user_mapping, start_date, end_date, portfolio_creating_date,
+        call_slot)
+
+    data = dict(summary=dump_data(summary), overview=dump_data(overview),
+                created=datetime.now())
+
+    if None in data.values():
+        return summary, overview
+
+    try:
+        with db_slot(), transaction.atomic():
+            QuarterReportData.objects.update_or_create(defaults=data, **key)
+    except IntegrityError:
+        # Stored by another thread or process in the meantime
+        pass
+
+    return summary, overview
@@ -0,0 +1,265 @@
+"""
+Cheap pre-screen of quarter data before the full validation.
+
+Full validation builds quarter report data for every user, while most users
+pass it. Pre-screen checks stored daily portfolio values of all users of the
+context with a few bulk queries and finds users whose quarter looks normal:
+
+* daily values are stored for the whole quarter and are all positive
+* user has no transactions in the quarter, so there are no flows
+* portfolio end value differs from the start value less than
+  QUARTER_PRESCREEN_MAX_CHANGE, well below the 10% revenue limit
+* if balances of user's containers are stored for the first and the last
+  day of the quarter, their total changed less than
+  QUARTER_PRESCREEN_MAX_CHANGE too. Balances are stored only since
+  snapshot_balances task runs, quarters before that are checked on daily
+  values only
+
+All other users are suspicious and are validated fully, as well as a random
+audit sample of users that passed the pre-screen.
+
+Net flows are not calculated: amount, sign and currency of a Transaction
+depend on its type, which this app doesn't interpret anywhere. Any
+transaction in the quarter makes the user suspicious instead, which is
+stricter: users whose flows net out are validated fully too.
+
+Transaction date field is not guessed, it has to be configured.
+
+Settings:
+
+* INTERNAL_REPORTS_PRESCREEN_TRANSACTION_DATE_FIELD - date field of
+  Transaction flows are found by (the value date of the transaction).
+  Pre-screen is not available if it's not set or is not a date field of
+  the model
+"""
+import math
+import random
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import DateField, Max, Min, Sum
+
+from datastorage.models import Transaction
+from internal_reports.constants import QUARTER_PRESCREEN_MAX_CHANGE
+from internal_reports.daily_value_table import get_stored_user_ids
+from internal_reports.errors import PrescreenNotAvailable
+from internal_reports.models import (
+    AssetContainerBalanceSnapshot,
+    UserDailyPortfolioValue
+)
+
+
+def get_transaction_date_field():
+    """
+    Get date field of Transaction configured for the pre-screen
+    :return: field name
+    :raises PrescreenNotAvailable: if the field is not configured or
+        Transaction has no such date field
+    """
+
+    name = getattr(settings,
+                   'INTERNAL_REPORTS_PRESCREEN_TRANSACTION_DATE_FIELD', None)
+
+    if not name:
+        raise PrescreenNotAvailable
+
+    try:
+        field = Transaction._meta.get_field(name)
+    except FieldDoesNotExist:
+        raise PrescreenNotAvailable
+
+    # DateTimeField is a subclass of DateField
+    if not isinstance(field, DateField):
+        raise PrescreenNotAvailable
+
+    return name
+
+
+def get_users_with_flows(context, start_date, end_date,
+                         using=DEFAULT_DB_ALIAS):
+    """
+    Get users with transactions in the period
+    :param context: AppContext instance
+    :param start_date: period start date
+    :param end_date: period end date
+    :param using: database alias
+    :return: set with UserMapping IDs
+    :raises PrescreenNotAvailable: if transactions have no date field
+    """
+
+    date_field = get_transaction_date_field()
+
+    return set(Transaction.objects.using(using).filter(
+        user__app_context=context,
+        **{date_field + '__gte': start_date, date_field + '__lte': end_date}
+    ).values_list('user_id', flat=True).distinct())
+
+
+def get_edge_values(context, start_date, end_date, using=DEFAULT_DB_ALIAS):
+    """
+    Get stored values of the first and the last day of the period for users
+    whose values are all positive
+
+    :param context: AppContext instance
+    :param start_date: period start date
+    :param end_date: period end date
+    :param using: database alias
+    :return: dict with user ID as key and (start value, end value) as value
+    """
+
+    stats = UserDailyPortfolioValue.objects.using(using).filter(
+        user__app_context=context,
+        date__gte=start_date,
+        date__lte=end_date
+    ).values('user_id').annotate(
+        first_date=Min('date'),
+        last_date=Max('date'),
+        lowest_value=Min('value')
+    )
+
+    edges = {row['user_id']: (row['first_date'], row['last_date'])
+             for row in stats if row['lowest_value'] > 0}
+
+    if not edges:
+        return dict()
+
+    edge_dates = {date for dates in edges.values() for date in dates}
+
+    values = {
+        (user_id, date): value
+        for user_id, date, value in UserDailyPortfolioValue.objects.using(
+            using
+        ).filter(
+            user__app_context=context,
+            date__in=edge_dates
+        ).values_list('user_id', 'date', 'value')
+    }
+
+    return {
+        user_id: (values[(user_id, first_date)], values[(user_id, last_date)])
+        for user_id, (first_date, last_date) in edges.items()
+    }
+
+
+def get_balance_totals(context, start_date, end_date,
+                       using=DEFAULT_DB_ALIAS):
+    """
+    Get total stored balances of users on the first and the last day of the
+    period, for users with balances stored on both days
+
+    :param context: AppContext instance
+    :param start_date: period start date
+    :param end_date: period end date
+    :param using: database alias
+    :return: dict with user ID as key and (start total, end total) as value
+    """
+
+    totals = dict()
+
+    for user_id, day, total in AssetContainerBalanceSnapshot.objects.using(
+            using).filter(
+                user__app_context=context,
+                date__in=[start_date, end_date]
+            ).values_list('user_id', 'date').annotate(
+                total=Sum('value')).order_by():
+        totals.setdefault(user_id, dict())[day] = total or 0
+
+    return {
+        user_id: (days[start_date], days[end_date])
+        for user_id, days in totals.items()
+        if start_date in days and end_date in days
+    }
+
+
+def is_small_change(start_value, end_value):
+    """
+    Check if value changed less than QUARTER_PRESCREEN_MAX_CHANGE
+    :param start_value: value at the start of the period
+    :param end_value: value at the end of the period
+    :return: boolean value
+    """
+
+    if start_value <= 0:
+        return False
+
+    return abs(end_value / start_value - 1) <= QUARTER_PRESCREEN_MAX_CHANGE
+
+
+def find_unsuspicious_users(context, start_date, end_date,
+                            using=DEFAULT_DB_ALIAS):
+    """
+    Find users whose quarter passes cheap checks on stored data
+
+    :param context: AppContext instance
+    :param start_date: quarter start date
+    :param end_date: quarter end date
+    :param using: database alias
+    :return: set with UserMapping IDs
+    :raises PrescreenNotAvailable: if transactions have no date field
+    """
+
+    get_transaction_date_field()
+
+    stored_user_ids = get_stored_user_ids(start_date, end_date, using)
+
+    if not stored_user_ids:
+        return set()
+
+    users_with_flows = get_users_with_flows(context, start_date, end_date,
+                                            using)
+    balances = get_balance_totals(context, start_date, end_date, using)
+
+    unsuspicious = set()
+
+    for user_id, (start_value, end_value) in get_edge_values(
+            context, start_date, end_date, using).items():
+
+        if user_id not in stored_user_ids or user_id in users_with_flows:
+            continue
+
+        if not is_small_change(start_value, end_value):
+            continue
+
+        if user_id in balances and not is_small_change(*balances[user_id]):
+            continue
+
+        unsuspicious.add(user_id)
+
+    return unsuspicious
+
+
+def take_audit_sample(user_ids, fraction, seed=None):
+    """
+    Choose random users that are validated even if they pass pre-screen
+
+    :param user_ids: set with user IDs
+    :param fraction: share of users to choose, from 0 to 1
+    :param seed: random seed, so the sample of the report can be repeated
+    :return: set with chosen user IDs
+    """
+
+    size = min(len(user_ids), int(math.ceil(len(user_ids) * fraction)))
+
+    return set(random.Random(seed).sample(sorted(user_ids), size))
+
+
+def prescreen_quarter(context, start_date, end_date, audit_fraction,
+                      seed=None, using=DEFAULT_DB_ALIAS):
+    """
+    Find users that can skip full validation of the quarter
+
+    :param context: AppContext instance
+    :param start_date: quarter start date
+    :param end_date: quarter end date
+    :param audit_fraction: share of unsuspicious users validated anyway
+    :param seed: random seed of the audit sample
+    :param using: database alias
+    :return: set with UserMapping IDs that are not validated fully
+    """
+
+    unsuspicious = find_unsuspicious_users(context, start_date, end_date,
+                                           using)
+
+    return unsuspicious - take_audit_sample(unsuspicious, audit_fraction,
+                                            seed)
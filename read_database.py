@@ -0,0 +1,128 @@
+"""
+Database reporters read from.
+
+Report scans can go to a replica so they do not compete with the API on the
+primary database. Reads of the reporter thread and of its worker threads
+are routed to the read database, including reads of helpers outside this
+app (pdf.utils, Core Analyse client models), so nothing of the report is
+read from the primary. Report status, rows and stored data are written to
+the primary, by IDs, so instances read from the replica are never saved to
+the primary.
+
+Snapshots are kept short: a long REPEATABLE READ transaction on a replica
+holds back vacuum on the primary (with hot_standby_feedback) or is
+cancelled by replication conflicts. Every query sees its own snapshot, and
+related queries that have to agree with each other, like the prefetch of
+a report, run in one read_snapshot() that ends before users are processed.
+
+Settings:
+
+* INTERNAL_REPORTS_READ_DATABASE - database alias of reporter reads
+* DATABASE_ROUTERS - has to include
+  'internal_reports.read_database.ReadDatabaseRouter', so reads of code
+  outside this app are routed too
+"""
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+routing = threading.local()
+
+
+def get_read_database():
+    """
+    Get database alias reporters read from
+    :return: database alias
+    """
+
+    return getattr(settings, 'INTERNAL_REPORTS_READ_DATABASE',
+                   DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def route_reads(using):
+    """
+    Route reads of the current thread to the database. Writes still go to
+    the primary
+
+    :param using: database alias
+    """
+
+    previous = getattr(routing, 'using', None)
+    routing.using = None if using == DEFAULT_DB_ALIAS else using
+
+    try:
+        yield
+    finally:
+        routing.using = previous
+
+
+def bind_reads(func, using):
+    """
+    Route reads of function called from worker thread to the database
+    :param func: function that is called from another thread
+    :param using: database alias
+    :return: wrapped function
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with route_reads(using):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class ReadDatabaseRouter:
+    """
+    Router that sends reads of threads inside route_reads() to the read
+    database
+    """
+
+    @staticmethod
+    def db_for_read(model, **hints):
+        return getattr(routing, 'using', None)
+
+    @staticmethod
+    def db_for_write(model, **hints):
+        return None
+
+    @staticmethod
+    def allow_relation(obj1, obj2, **hints):
+        # Replica has the same data, instances read from it can be related
+        # to instances of the primary
+        databases = {DEFAULT_DB_ALIAS, get_read_database()}
+
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+@contextmanager
+def read_snapshot(using):
+    """
+    Run reads in one transaction with snapshot isolation. Nothing is done
+    for the default database, as writes of the report go there and must not
+    wait for the end of the snapshot. If transaction is already open its
+    snapshot is used, isolation can't be changed there. Keep the block
+    short, see the module docstring
+
+    :param using: database alias
+    """
+
+    connection = connections[using]
+
+    if using == DEFAULT_DB_ALIAS or connection.in_atomic_block:
+        yield
+        return
+
+    with transaction.atomic(using=using):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
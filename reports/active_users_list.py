@@ -1,27 +1,49 @@
-import json
-from datetime import datetime
+from multiprocessing.dummy import Pool
 
-from client_core_analyse.errors import CanNotConnectToCoreAnalyze
 from datastorage.standards import ASSET_CONTAINER_TYPES
 from internal_reports.constants import (
-    INTERNAL_REPORT_STATUS_READY,
-    INTERNAL_REPORT_STATUS_FAILED
+    ACTIVE_USERS_THRESHOLD_CSV_COLUMNS,
+    ACTIVE_USERS_WINDOW_SIZE
+)
+from internal_reports.daily_value_table import (
+    get_active_user_ids,
+    get_stored_daily_values,
+    get_stored_user_ids
+)
+from internal_reports.daily_values import DailyPortfolioValues
+from internal_reports.db_connections import close_pool_connections
+from internal_reports.history_cache import (
+    HISTORY_ERRORS,
+    get_cached_portfolio_history
+)
+from internal_reports.read_database import bind_reads, read_snapshot
+from internal_reports.reports.base import BaseReporter
+from internal_reports.tracing import (
+    bind_context,
+    child_span,
+    span,
+    user_span
+)
+from internal_reports.utils import (
+    chunked,
+    get_threshold_suffix,
+    get_thresholds_csv_columns
 )
-from internal_reports.errors import BrokenPortfolioComponent
-from pdf.errors import NoPortfolioHistory
-from pdf.utils import get_formatted_portfolio_history
 from permission.models import UserMapping
 from serviceAPI import settings
 from tools.dates import format_date_short, read_date_short
 
 
-class ReporterActiveUsersList:
+class ReporterActiveUsersList(BaseReporter):
     """
     Reporter that generate list of active users with requested parameters
     """
 
-    def __init__(self, start_date, end_date, consecutive_days,
-                 amount_to_validate, context):
+    empty_message = 'There were no active users in the period'
+    sort_key = None
+
+    def __init__(self, start_date, end_date, consecutive_days=None,
+                 amount_to_validate=None, context=None, thresholds=None):
         """
         Initialise reporter
 
@@ -30,77 +52,178 @@ class ReporterActiveUsersList:
         :param consecutive_days: Number of consecutive days
         :param amount_to_validate: Min value of portfolio that user should have
         :param context: AppContext instance
+        :param thresholds: list of [consecutive_days, amount_to_validate]
+            pairs, used instead of the single pair. Report has columns for
+            every pair
         """
 
+        super(ReporterActiveUsersList, self).__init__(context)
+
         self.start_date = read_date_short(start_date) if start_date else None
         self.end_date = read_date_short(end_date) if start_date else None
-        self.consecutive_days = consecutive_days
-        self.amount_to_validate = amount_to_validate
-        self.context = context
+        self.combined = bool(thresholds)
+
+        if thresholds:
+            self.thresholds = [tuple(threshold) for threshold in thresholds]
+        else:
+            self.thresholds = [(consecutive_days, amount_to_validate)]
+
+        self.consecutive_days, self.amount_to_validate = self.thresholds[0]
+
+    def generate_rows(self):
+        """
+        Generate report entry for each active user. Histories are fetched
+        in thread pool, rows are built in the order of users
+        """
+
+        users = get_users_with_investments(self.context).using(
+            self.database)
+
+        self.stored_users, active_users = self.get_stored_users()
+
+        self.metrics.update(stored_users=0, fetched_users=0)
 
-        self.active_users_list = list()
+        with span('internal_reports.active_users.fetch_histories',
+                  threads=self.context.threads_core_analyse_2):
+            for user, daily_values in self.iter_daily_values(users):
+                if user.pk in self.stored_users:
+                    self.metrics['stored_users'] += 1
 
-        self.internal_report = None
+                    if user.pk not in active_users:
+                        continue
 
-    def run(self, internal_report):
+                    row = self.prepare_stored_user_data(user)
+                else:
+                    self.metrics['fetched_users'] += 1
+
+                    row = self.prepare_user_data(user, daily_values)
+
+                if row:
+                    yield row
+
+    def iter_daily_values(self, users):
+        """
+        Fetch daily values of users concurrently in thread pool. Users are
+        read from the database by the calling thread and queued to the pool
+        in windows
+        :param users: queryset with users
+        :return: iterator of tuples with user and DailyPortfolioValues
+            instance, error or None in the order of users
         """
-        Trigger report generating
-        :param internal_report: Internal report instance
 
-        :return: list with data
+        processes = self.context.threads_core_analyse_2
+        fetch_daily_values = bind_context(
+            bind_reads(self.fetch_daily_values, self.database))
+
+        with Pool(processes) as pool:
+            try:
+                for window in chunked(users.iterator(),
+                                      ACTIVE_USERS_WINDOW_SIZE):
+                    for result in pool.imap(fetch_daily_values, window):
+                        yield result
+            finally:
+                close_pool_connections(pool, processes)
+
+    def get_stored_users(self):
+        """
+        Find users whose daily values are stored for the period and active
+        users among them
+        :return: tuple with sets of stored and active UserMapping IDs
         """
 
-        users = get_users_with_investments(self.context)
+        if not self.start_date or not self.end_date:
+            return set(), set()
 
-        self.internal_report = internal_report
+        with span('internal_reports.active_users.stored_values'), \
+                read_snapshot(self.database):
+            active_users = set()
 
-        self.prepare_user_data(users)
+            for consecutive_days, amount_to_validate in self.thresholds:
+                active_users.update(get_active_user_ids(
+                    self.start_date, self.end_date,
+                    consecutive_days, amount_to_validate,
+                    using=self.database))
 
-        self.internal_report.data = json.dumps(self.active_users_list,
-                                               indent=4)
-        self.internal_report.status = INTERNAL_REPORT_STATUS_READY
-        self.internal_report.generated = datetime.now()
+            return (get_stored_user_ids(self.start_date, self.end_date,
+                                        using=self.database),
+                    active_users)
 
-        if not len(self.active_users_list):
-            self.internal_report.status = INTERNAL_REPORT_STATUS_FAILED
-            self.internal_report.data = (
-                'There were no active users in the period')
+    def prepare_stored_user_data(self, user):
+        """
+        Prepare data for active user from stored daily values
+        :param user: UserMapping instance
+        :return: dict with report entry or None if user is not active
+        """
 
-        self.internal_report.save()
+        return self.check_thresholds(
+            user,
+            get_stored_daily_values(user, self.start_date, self.end_date,
+                                    using=self.database)
+        )
 
-    def prepare_user_data(self, users):
+    def fetch_daily_values(self, user):
         """
-        Prepare data for certain user
-        :param users: UserMapping queryset
+        Get daily values of the user from portfolio history. It's called in
+        thread pool, users with stored values are skipped
+        :param user: UserMapping instance
+        :return: tuple with user and DailyPortfolioValues instance, error
+            or None
         """
-        for user in users:
+
+        if user.pk in self.stored_users:
+            return user, None
+
+        with user_span('internal_reports.active_users.user',
+                       user_id=user.app_uid):
             try:
-                portfolio_history = get_formatted_portfolio_history(
-                    user, self.start_date, self.end_date)
-                portfolio_history_dates = list(portfolio_history.keys())
-                (
-                    consecutive_days_data,
-                    average_value_of_consecutive_days
-                ) = DailyPortfolioValue().check_daily_portfolio_value(
-                    portfolio_history, self.consecutive_days,
-                    self.amount_to_validate)
-
-                if len(consecutive_days_data):
-                    average_portfolio_value = calc_average_portfolio_value(
-                        portfolio_history)
-
-                    self.active_users_list.append(prepare_active_user_data(
-                        average_portfolio_value,
-                        portfolio_history,
-                        portfolio_history_dates,
-                        user,
-                        consecutive_days_data,
-                        average_value_of_consecutive_days
-                    ))
-            except (NoPortfolioHistory,
-                    BrokenPortfolioComponent,
-                    CanNotConnectToCoreAnalyze) as ex:
-                self.active_users_list.append(prepare_failed_user_data(user, ex))
+                with child_span('core_analyse.portfolio_history'):
+                    portfolio_history = get_cached_portfolio_history(
+                        user, self.start_date, self.end_date)
+
+                return user, DailyPortfolioValues.from_history(
+                    portfolio_history)
+            except HISTORY_ERRORS as ex:
+                return user, ex
+
+    def prepare_user_data(self, user, daily_values):
+        """
+        Prepare data for certain user
+        :param user: UserMapping instance
+        :param daily_values: DailyPortfolioValues instance or error that
+            happened while fetching history
+        :return: dict with report entry or None if user is not active
+        """
+
+        if isinstance(daily_values, Exception):
+            if self.combined:
+                return prepare_failed_combined_user_data(
+                    user, self.thresholds, daily_values)
+            return prepare_failed_user_data(user, daily_values)
+
+        return self.check_thresholds(user, daily_values)
+
+    def check_thresholds(self, user, daily_values):
+        """
+        Check thresholds over daily values of the user
+        :param user: UserMapping instance
+        :param daily_values: DailyPortfolioValues of the user
+        :return: dict with report entry or None if user is not active
+        """
+
+        runs = [
+            daily_values.find_consecutive_days(consecutive_days,
+                                               amount_to_validate)
+            for consecutive_days, amount_to_validate in self.thresholds
+        ]
+
+        if not any(runs):
+            return None
+
+        if self.combined:
+            return prepare_combined_user_data(user, daily_values,
+                                              self.thresholds, runs)
+
+        return prepare_active_user_data(user, daily_values, *runs[0])
 
 
 def get_users_with_investments(context):
@@ -121,38 +244,27 @@ def get_users_with_investments(context):
     ).distinct()
 
 
-def prepare_active_user_data(average_portfolio_value,
-                             portfolio_history,
-                             portfolio_history_dates,
-                             user,
-                             consecutive_days_data,
-                             average_value_of_consecutive_days):
+def prepare_active_user_data(user, daily_values, start, end):
     """
     Prepare dict with data for each user
-    :param average_portfolio_value: average portfolio value for current user
-    :param portfolio_history: portfolio history
-    :param portfolio_history_dates: list with dates from portfolio history
     :param user: user object
-    :param consecutive_days_data: list with consecutive days data consist of
-        date and daily_portfolio_value for each day
-    :param average_value_of_consecutive_days:
-    :return:
+    :param daily_values: DailyPortfolioValues of the user
+    :param start: index of the first of consecutive days
+    :param end: index after the last of consecutive days
+    :return: dict with report entry
     """
     return dict(
         personid=user.app_uid,
-        position_start_date=format_date_short(consecutive_days_data[0]['date']),
-        position_start_value=round(
-            consecutive_days_data[0]['daily_portfolio_value'], 2),
-        position_average_value=round(average_portfolio_value, 2),
-        position_end_date=format_date_short(portfolio_history_dates[-1]),
-        position_end_value=calc_daily_portfolio_value(
-            portfolio_history.get(portfolio_history_dates[-1])['components']),
-        consecutive_days=len(consecutive_days_data),
+        position_start_date=format_date_short(daily_values.dates[start]),
+        position_start_value=round(daily_values.values[start], 2),
+        position_average_value=round(daily_values.average(), 2),
+        position_end_date=format_date_short(daily_values.dates[-1]),
+        position_end_value=daily_values.values[-1],
+        consecutive_days=end - start,
         average_value_of_consecutive_days=round(
-            average_value_of_consecutive_days, 2),
-        first_date_reported=format_date_short(portfolio_history_dates[0]),
-        position_first_date_reported=calc_daily_portfolio_value(
-            portfolio_history.get(portfolio_history_dates[0])['components']),
+            daily_values.average(start, end), 2),
+        first_date_reported=format_date_short(daily_values.dates[0]),
+        position_first_date_reported=daily_values.values[0],
         error=None
     )
 
@@ -179,81 +291,61 @@ def prepare_failed_user_data(user, error):
     )
 
 
-class DailyPortfolioValue:
-    def __init__(self):
-        self.consecutive_days_data = list()
-        self.total_value_consecutive_days = 0
+def prepare_combined_user_data(user, daily_values, thresholds, runs):
+    """
+    Prepare dict with data for each threshold
+    :param user: user object
+    :param daily_values: DailyPortfolioValues of the user
+    :param thresholds: list of (consecutive_days, amount_to_validate) pairs
+    :param runs: list with (start, end) indexes of consecutive days or None
+        for every threshold
+    :return: dict with report entry
+    """
+    data = dict(
+        personid=user.app_uid,
+        first_date_reported=format_date_short(daily_values.dates[0]),
+        position_first_date_reported=daily_values.values[0],
+        position_average_value=round(daily_values.average(), 2),
+        position_end_date=format_date_short(daily_values.dates[-1]),
+        position_end_value=daily_values.values[-1]
+    )
 
-    def check_daily_portfolio_value(self,
-                                    portfolio_history,
-                                    expected_consecutive_days,
-                                    amount_to_validate):
-        """
-        Check daily portfolio value to be equal or higher then
-        amount_to_validate
-        :param portfolio_history: portfolio history
-        :param expected_consecutive_days:
-        :param amount_to_validate: value to validate user's investment
-        :return: list of consecutive_days_data and average consecutive days
-            portfolio value
-        """
+    for (consecutive_days, amount_to_validate), run in zip(thresholds, runs):
+        suffix = get_threshold_suffix(consecutive_days, amount_to_validate)
 
-        for key, value in portfolio_history.items():
-            daily_ptf_value = calc_daily_portfolio_value(value['components'])
+        if not run:
+            data.update(dict.fromkeys(
+                [column + suffix
+                 for column in ACTIVE_USERS_THRESHOLD_CSV_COLUMNS], ''))
+            continue
 
-            if daily_ptf_value >= amount_to_validate:
-                self.consecutive_days_data.append(
-                    dict(date=key,
-                         daily_portfolio_value=daily_ptf_value)
-                )
-                self.total_value_consecutive_days += daily_ptf_value
+        start, end = run
 
-            elif len(self.consecutive_days_data) >= expected_consecutive_days:
-                break
-            else:
-                self.consecutive_days_data = list()
-                self.total_value_consecutive_days = 0
+        data.update({
+            'consecutive_days' + suffix: end - start,
+            'average_value_of_consecutive_days' + suffix: round(
+                daily_values.average(start, end), 2),
+            'position_start_date' + suffix: format_date_short(
+                daily_values.dates[start]),
+            'position_start_value' + suffix: round(
+                daily_values.values[start], 2)
+        })
 
-        return self.calc_average_value_of_consecutive_days(
-            expected_consecutive_days)
+    data.update(error=None)
 
-    def calc_average_value_of_consecutive_days(self, expected_consecutive_days):
-        """
-        Calc average value of consecutive days
-        :param expected_consecutive_days:
-        :return: consecutive days data and average value of consecutive days
-        """
-        if len(self.consecutive_days_data) >= expected_consecutive_days:
-            return (self.consecutive_days_data,
-                    self.total_value_consecutive_days /
-                    len(self.consecutive_days_data))
-        return list(), 0
+    return data
 
 
-def calc_average_portfolio_value(portfolio_history):
+def prepare_failed_combined_user_data(user, thresholds, error):
     """
-    Calculate average portfolio value
-    :param portfolio_history: portfolio history
-    :return: average portfolio value
+    Prepare dict with data for failed user in report with several thresholds
+    :param user: user object
+    :param thresholds: list of (consecutive_days, amount_to_validate) pairs
+    :param error: error that happened for user
+    :return: dict with report entry
     """
-    total_portfolio_value = 0
-    for key, value in portfolio_history.items():
-        total_portfolio_value += calc_daily_portfolio_value(value['components'])
+    data = dict.fromkeys(get_thresholds_csv_columns(thresholds), '')
 
-    return total_portfolio_value / len(portfolio_history)
+    data.update(personid=user.app_uid, error=str(error))
 
-
-def calc_daily_portfolio_value(components):
-    """
-    Calculate portfolio value for current day
-    :param components: portfolio component
-    :return: daily portfolio value
-    """
-    daily_portfolio_value = 0
-    for component in components:
-        try:
-            daily_portfolio_value += (component['price_eur']
-                                      * component['quantity'])
-        except KeyError:
-            raise BrokenPortfolioComponent
-    return round(daily_portfolio_value, 2)
+    return data
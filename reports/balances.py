@@ -1,64 +1,62 @@
-import json
-from datetime import datetime
-
-from datastorage.models import Order, AssetContainer
+from datastorage.models import AssetContainer
 from internal_reports.constants import (
-    INTERNAL_REPORT_STATUS_READY,
-    INTERNAL_REPORT_STATUS_FAILED
+    BALANCE_SNAPSHOT_COLUMNS,
+    INTERNAL_REPORT_BALANCES,
+    COLUMN_FORMATTER_CONTAINER_VALUE
 )
+from internal_reports.models import AssetContainerBalanceSnapshot
+from internal_reports.reports.base import FlatReporter
+from internal_reports.valuation import get_container_values
+from tools.dates import read_date_short
 
 
-class ReporterBalances:
+class ReporterBalances(FlatReporter):
     """
-    Reporter for balances
+    Reporter for balances. Balances for a past date are read from
+    AssetContainerBalanceSnapshot
     """
-    def __init__(self, context):
-        """
-        Initialise balances reporter
-        :param context: AppContext instance
-        """
 
-        self.context = context
-        self.data = list()
-        self.internal_report = None
+    empty_message = 'No users with balances'
+    report_type = INTERNAL_REPORT_BALANCES
+    model = AssetContainer
 
-    def run(self, internal_report):
+    def __init__(self, context, as_of_date=None):
         """
-        Generate report with balances
+        Initialise balances reporter
+
+        :param context: AppContext instance
+        :param as_of_date: string date of stored balances, current balances
+            are reported if it's not set
         """
 
-        asset_containers = AssetContainer.objects.filter(
-            user__app_context=self.context)
+        super(ReporterBalances, self).__init__(context)
 
-        self.internal_report = internal_report
+        self.as_of_date = (read_date_short(as_of_date).date()
+                           if as_of_date else None)
 
-        self.prepare_asset_containers_data(asset_containers)
+        if self.as_of_date:
+            self.model = AssetContainerBalanceSnapshot
 
-        if self.data:
-            self.data = sorted(self.data, key=lambda k: k['user_id'])
-            self.internal_report.data = json.dumps(self.data,
-                                                   indent=4)
-            self.internal_report.status = INTERNAL_REPORT_STATUS_READY
-            self.internal_report.generated = datetime.now()
+    def get_queryset(self):
+        if self.as_of_date:
+            return AssetContainerBalanceSnapshot.objects.filter(
+                user__app_context=self.context,
+                date=self.as_of_date)
 
-        else:
-            self.internal_report.status = INTERNAL_REPORT_STATUS_FAILED
-            self.internal_report.data = 'No users with order'
+        return AssetContainer.objects.filter(
+            user__app_context=self.context)
 
-        self.internal_report.save()
+    def get_columns(self):
+        if self.as_of_date:
+            return BALANCE_SNAPSHOT_COLUMNS
 
-    def prepare_asset_containers_data(self, asset_containers):
-        """
-        Generate report entry for user
+        return super(ReporterBalances, self).get_columns()
 
-        :param asset_containers: AssetContainers queryset
-        """
+    def get_column_formatters(self):
+        if self.as_of_date:
+            return dict()
 
-        for asset_container in asset_containers:
-            self.data.append(dict(
-                user_id=asset_container.user.app_uid,
-                name=asset_container.name,
-                type=asset_container.type.name,
-                total_value=asset_container.get_value()
-            )
-            )
+        return {
+            COLUMN_FORMATTER_CONTAINER_VALUE: get_container_values(
+                self.get_queryset().using(self.database)).get
+        }
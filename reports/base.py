@@ -0,0 +1,199 @@
+import abc
+import logging
+import time
+from datetime import datetime
+from operator import itemgetter
+
+from django.db import connections
+
+from internal_reports.constants import (
+    BINARY_ORDER_VENDORS,
+    INTERNAL_REPORT_COLUMNS,
+    INTERNAL_REPORT_CHUNK_SIZE,
+    INTERNAL_REPORT_SORT_BUFFER_SIZE,
+    INTERNAL_REPORT_STATUS_READY,
+    INTERNAL_REPORT_STATUS_FAILED
+)
+from internal_reports.read_database import get_read_database, route_reads
+from internal_reports.reports.columns import compile_columns
+from internal_reports.reports.sinks import DatabaseChunkSink
+from internal_reports.reports.sorting import BinaryOrder, external_sort
+from internal_reports.tracing import span
+from internal_reports.utils import chunked
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseReporter(metaclass=abc.ABCMeta):
+    """
+    Base class for reporters.
+
+    Reporter yields rows from generate_rows(), base class sorts them if
+    needed, writes them to the sink in chunks and sets report status, so the
+    whole report is never kept in memory.
+
+    :cvar empty_message: report data if there are no rows
+    :cvar empty_status: report status if there are no rows
+    :cvar sort_key: row key to sort report by, None keeps generating order
+    :cvar sorted_by_query: rows are already generated in sort_key order
+    :cvar chunk_size: number of rows written to the sink at once
+    :ivar database: database alias report querysets read from
+    """
+
+    empty_message = 'Report has no data'
+    empty_status = INTERNAL_REPORT_STATUS_FAILED
+    sort_key = 'user_id'
+    sorted_by_query = False
+    chunk_size = INTERNAL_REPORT_CHUNK_SIZE
+
+    def __init__(self, context):
+        """
+        Initialise reporter
+
+        :param context: AppContext instance
+        """
+
+        self.context = context
+        self.internal_report = None
+        self.metrics = dict()
+        self.database = get_read_database()
+
+    @abc.abstractmethod
+    def generate_rows(self):
+        """
+        Yield report rows
+        """
+
+    def get_sink(self, internal_report):
+        """
+        Sink used if no sink is passed to run()
+        :param internal_report: Internal report instance
+        :return: ReportSink instance
+        """
+
+        return DatabaseChunkSink(internal_report)
+
+    def sort_rows(self, rows):
+        """
+        Sort rows by sort_key with external merge sort
+        :param rows: iterable of rows
+        :return: iterable of rows
+        """
+
+        if not self.sort_key or self.sorted_by_query:
+            return rows
+
+        return external_sort(rows, key=itemgetter(self.sort_key),
+                             buffer_size=INTERNAL_REPORT_SORT_BUFFER_SIZE)
+
+    def run(self, internal_report, sink=None):
+        """
+        Generate report and store it
+
+        :param internal_report: Internal report instance
+        :param sink: ReportSink instance, rows are stored in DB by default
+        """
+
+        self.internal_report = internal_report
+
+        sink = sink or self.get_sink(internal_report)
+
+        started = time.time()
+        rows_count = 0
+
+        with span('internal_reports.reporter.write_rows',
+                  reporter=self.__class__.__name__) as current_span:
+            sink.open()
+
+            with route_reads(self.database):
+                for chunk in chunked(self.sort_rows(self.generate_rows()),
+                                     self.chunk_size):
+                    sink.write(chunk)
+                    rows_count += len(chunk)
+
+            if current_span is not None:
+                current_span.set_attribute('rows', rows_count)
+
+        if rows_count:
+            sink.close()
+            self.internal_report.data = None
+            self.internal_report.presorted = bool(self.sort_key)
+            self.internal_report.status = INTERNAL_REPORT_STATUS_READY
+            self.internal_report.generated = datetime.now()
+        else:
+            sink.discard()
+            self.internal_report.data = self.empty_message
+            self.internal_report.status = self.empty_status
+
+        duration = round(time.time() - started, 3)
+
+        self.internal_report.update_metrics(rows=rows_count,
+                                            duration=duration,
+                                            **self.metrics)
+        self.internal_report.save()
+
+        logger.info('{reporter}: {rows} rows in {duration}s'.format(
+            reporter=self.__class__.__name__,
+            rows=rows_count,
+            duration=duration))
+
+
+class FlatReporter(BaseReporter):
+    """
+    Reporter with one row per queryset entry. Rows are built with a single
+    values_list() query and a mapper compiled from INTERNAL_REPORT_COLUMNS,
+    model instances are not created. Rows are read with server-side cursor
+    and sorted by the database in code point order, as Python sorts them,
+    so worker memory does not depend on report size. Databases that can't
+    order by code points are sorted in Python.
+
+    :cvar report_type: report type, key of INTERNAL_REPORT_COLUMNS
+    :cvar model: model class of the queryset
+    """
+
+    report_type = None
+    model = None
+
+    @property
+    def sorted_by_query(self):
+        return connections[self.database].vendor in BINARY_ORDER_VENDORS
+
+    @abc.abstractmethod
+    def get_queryset(self):
+        """
+        Queryset with report entries
+        """
+
+    def get_columns(self):
+        """
+        Column spec of the report
+        :return: tuple with columns, see INTERNAL_REPORT_COLUMNS
+        """
+
+        return INTERNAL_REPORT_COLUMNS[self.report_type]
+
+    def get_column_formatters(self):
+        """
+        Formatters specific for the report
+        :return: dict with formatters by name
+        """
+
+        return dict()
+
+    def generate_rows(self):
+        """
+        Generate report entry for each queryset entry
+        """
+
+        fields, map_row = compile_columns(
+            self.get_columns(),
+            self.model,
+            self.get_column_formatters()
+        )
+
+        queryset = self.get_queryset().using(self.database).values_list(
+            *fields).order_by(BinaryOrder('user__app_uid').asc(), 'pk')
+
+        for row in queryset.iterator():
+            yield map_row(row)
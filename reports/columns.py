@@ -0,0 +1,167 @@
+from decimal import Decimal
+
+from django.utils.encoding import force_text
+
+from internal_reports.constants import (
+    COLUMN_FORMATTER_DATE_SHORT,
+    COLUMN_FORMATTER_DATE_LONG,
+    COLUMN_FORMATTER_CHOICE_DISPLAY
+)
+from internal_reports.utils import format_date_short_or_none
+from tools.dates import format_date_long
+
+
+def format_date_long_or_none(date):
+    """
+    Format datetime to long format if it's present
+    :param date: datetime object
+    :return: formatted string or None
+    """
+
+    if date:
+        return format_date_long(date)
+    return None
+
+
+def get_number_converter(model, path):
+    """
+    Build function that formats Decimal values as strings, the same way
+    serializers DecimalField does, so rows are JSON serializable and keep
+    decimal places of the field. Float values are used as is
+
+    :param model: model class
+    :param path: lookup path of the field
+    :return: converter function
+    """
+
+    decimal_places = getattr(get_model_field(model, path), 'decimal_places',
+                             None)
+    quantum = (Decimal(1).scaleb(-decimal_places)
+               if decimal_places is not None else None)
+
+    def to_json_number(value):
+        if not isinstance(value, Decimal):
+            return value
+
+        if quantum is not None:
+            value = value.quantize(quantum)
+
+        return '{:f}'.format(value)
+
+    return to_json_number
+
+
+FORMATTERS = {
+    COLUMN_FORMATTER_DATE_SHORT: format_date_short_or_none,
+    COLUMN_FORMATTER_DATE_LONG: format_date_long_or_none,
+}
+
+TYPE_CONVERTERS = {
+    float: get_number_converter,
+}
+
+
+def get_model_field(model, path):
+    """
+    Find model field by lookup path
+    :param model: model class
+    :param path: lookup path, e.g. 'user__app_uid'
+    :return: model field
+    """
+
+    parts = path.split('__')
+
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+
+    return model._meta.get_field(parts[-1])
+
+
+def get_choice_display(model, path):
+    """
+    Build formatter that works as get_FOO_display() for values
+    :param model: model class
+    :param path: lookup path of the field with choices
+    :return: formatter function
+    """
+
+    choices = {
+        key: force_text(value, strings_only=True)
+        for key, value in get_model_field(model, path).flatchoices
+    }
+
+    return lambda value: choices.get(value, value)
+
+
+def get_converter(model, source, formatter, column_type, formatters):
+    """
+    Build function that converts raw DB value to report value
+    :return: function or None if value is used as is
+    """
+
+    functions = list()
+
+    if formatter == COLUMN_FORMATTER_CHOICE_DISPLAY:
+        functions.append(get_choice_display(model, source))
+    elif formatter:
+        functions.append(formatters[formatter])
+
+    if column_type in TYPE_CONVERTERS:
+        functions.append(TYPE_CONVERTERS[column_type](model, source))
+
+    if not functions:
+        return None
+
+    if len(functions) == 1:
+        return functions[0]
+
+    first, second = functions
+
+    return lambda value: second(first(value))
+
+
+def compile_columns(columns, model, formatters=None):
+    """
+    Compile column spec into values_list() projection and row mapper.
+
+    Mapper is generated as a single function that builds row dict from the
+    values_list() tuple, so rows are built without model instances and
+    without per-column dispatch.
+
+    :param columns: column spec, see INTERNAL_REPORT_COLUMNS
+    :param model: model class the projection is made for
+    :param formatters: additional formatters by name
+    :return: tuple with list of fields and mapper function
+    """
+
+    all_formatters = dict(FORMATTERS, **(formatters or {}))
+
+    fields = list()
+    namespace = dict()
+    items = list()
+
+    for position, (name, source, formatter, column_type) in enumerate(columns):
+        if source is None:
+            continue
+
+        if source not in fields:
+            fields.append(source)
+
+        value = 'row[{}]'.format(fields.index(source))
+
+        converter = get_converter(model, source, formatter, column_type,
+                                  all_formatters)
+
+        if converter is not None:
+            converter_name = 'convert_{}'.format(position)
+            namespace[converter_name] = converter
+            value = '{}({})'.format(converter_name, value)
+
+        items.append('{!r}: {}'.format(name, value))
+
+    code = 'def map_row(row):\n    return {{{}}}\n'.format(', '.join(items))
+
+    exec(compile(code, '<{} columns>'.format(model.__name__), 'exec'),
+         namespace)
+
+    return fields, namespace['map_row']
@@ -0,0 +1,120 @@
+import abc
+import json
+
+from internal_reports.models import InternalReportChunk
+
+
+class ReportSink(metaclass=abc.ABCMeta):
+    """
+    Destination for report rows. Reporter writes rows in chunks, so sink
+    never gets the whole report at once
+    """
+
+    def open(self):
+        """
+        Prepare sink before the first chunk
+        """
+
+    @abc.abstractmethod
+    def write(self, rows):
+        """
+        Store chunk of rows
+        :param rows: list of rows
+        """
+
+    def close(self):
+        """
+        Finish writing after the last chunk
+        """
+
+    def discard(self):
+        """
+        Drop everything written, called if report has no rows
+        """
+
+
+class DatabaseChunkSink(ReportSink):
+    """
+    Store rows as InternalReportChunk entries of the report
+    """
+
+    def __init__(self, internal_report):
+        """
+        :param internal_report: InternalReport instance
+        """
+
+        self.internal_report = internal_report
+        self.number = 0
+
+    def open(self):
+        self.discard()
+        self.number = 0
+
+    def write(self, rows):
+        InternalReportChunk.objects.create(
+            report=self.internal_report,
+            number=self.number,
+            data=json.dumps(rows)
+        )
+        self.number += 1
+
+    def discard(self):
+        InternalReportChunk.objects.filter(
+            report=self.internal_report).delete()
+
+
+class FileSink(ReportSink):
+    """
+    Write rows to file as JSON list
+    """
+
+    def __init__(self, path):
+        """
+        :param path: file path
+        """
+
+        self.path = path
+        self.file = None
+        self.rows_written = 0
+
+    def open(self):
+        self.file = open(self.path, 'w')
+        self.file.write('[')
+        self.rows_written = 0
+
+    def write(self, rows):
+        for row in rows:
+            if self.rows_written:
+                self.file.write(',\n')
+            self.file.write(json.dumps(row))
+            self.rows_written += 1
+
+    def close(self):
+        self.file.write(']\n')
+        self.file.close()
+
+    def discard(self):
+        self.file.close()
+        open(self.path, 'w').close()
+
+
+class MemorySink(ReportSink):
+    """
+    Keep rows in memory, used in tests
+    """
+
+    def __init__(self):
+        self.rows = list()
+        self.chunks = 0
+
+    def open(self):
+        self.rows = list()
+        self.chunks = 0
+
+    def write(self, rows):
+        self.rows.extend(rows)
+        self.chunks += 1
+
+    def discard(self):
+        self.rows = list()
+        self.chunks = 0
@@ -0,0 +1,94 @@
+import heapq
+import json
+import tempfile
+
+from django.db.models import Func
+
+
+def external_sort(rows, key, buffer_size):
+    """
+    Sort rows that do not have to fit into memory. Rows are sorted in buffers
+    of buffer_size, full buffers are spilled to temporary files as JSON lines
+    and merged lazily at the end. Sort is stable, as sorted() is.
+
+    :param rows: iterable of JSON serializable rows
+    :param key: sort key function
+    :param buffer_size: max number of rows kept in memory
+    :return: generator of sorted rows
+    """
+
+    buffer = list()
+    runs = list()
+
+    try:
+        for row in rows:
+            buffer.append(row)
+
+            if len(buffer) >= buffer_size:
+                runs.append(spill_run(sorted(buffer, key=key)))
+                buffer = list()
+
+        buffer.sort(key=key)
+
+        if not runs:
+            for row in buffer:
+                yield row
+            return
+
+        if buffer:
+            runs.append(spill_run(buffer))
+            buffer = list()
+
+        for row in heapq.merge(*[read_run(run) for run in runs], key=key):
+            yield row
+
+    finally:
+        for run in runs:
+            run.close()
+
+
+def spill_run(rows):
+    """
+    Write sorted rows to temporary file
+    :param rows: list of rows
+    :return: file object positioned at the beginning
+    """
+
+    run = tempfile.TemporaryFile(mode='w+')
+
+    for row in rows:
+        run.write(json.dumps(row))
+        run.write('\n')
+
+    run.seek(0)
+
+    return run
+
+
+def read_run(run):
+    """
+    Read rows from temporary file
+    :param run: file object
+    :return: generator of rows
+    """
+
+    for line in run:
+        yield json.loads(line)
+
+
+class BinaryOrder(Func):
+    """
+    Order text by code points, as Python sorts strings, instead of database
+    collation. UTF-8 byte order is code point order, so text is compared as
+    bytes. SQLite compares text as bytes by default
+    """
+
+    template = '%(expressions)s'
+
+    def as_postgresql(self, compiler, connection):
+        return self.as_sql(compiler, connection,
+                           template='%(expressions)s COLLATE "C"')
+
+    def as_mysql(self, compiler, connection):
+        return self.as_sql(compiler, connection,
+                           template='BINARY %(expressions)s')
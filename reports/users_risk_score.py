@@ -1,20 +1,22 @@
-import json
-from datetime import datetime
-
-from datastorage.models import UserRiskProfile
-from internal_reports.constants import (
-    INTERNAL_REPORT_STATUS_FAILED,
-    INTERNAL_REPORT_STATUS_READY
+from datastorage.models import AssetContainer, UserRiskProfile
+from internal_reports.reports.base import BaseReporter
+from internal_reports.suggested_risk_scores import SuggestedRiskScores
+from internal_reports.valuation import (
+    get_container_values,
+    get_investment_container_ids
 )
 from pdf.errors import ReportWasNotGenerated
-from pdf.generators.utils import get_risk_profile
 from tools.dates import format_date_long
 
 
-class ReporterRiskScoreUsersList:
+class ReporterRiskScoreUsersList(BaseReporter):
     """
-    Prepare users list with risk score lower then desired_risk_score
+    Prepare users list with risk score lower then desired_risk_score.
+    Investments containers of all users and their values are read at once
     """
+
+    empty_message = 'There is no users with risk score in these limits'
+
     def __init__(self, context, lower_risk_score, upper_risk_score):
         """
         Initialise reporter
@@ -23,24 +25,37 @@ class ReporterRiskScoreUsersList:
         :param upper_risk_score: value to filter users
         """
 
+        super(ReporterRiskScoreUsersList, self).__init__(context)
+
         self.upper_risk_score = upper_risk_score
         self.lower_risk_score = lower_risk_score
-        self.context = context
-        self.users_risk_score_list = list()
+        self.container_values = dict()
+        self.investment_containers = dict()
+        self.suggested_scores = None
 
-        self.internal_report = None
-
-    def run(self, internal_report):
+    def run(self, internal_report, sink=None):
         """
-        Generate actual report
+        Generate report, then store suggested risk scores computed for it
+
         :param internal_report: Internal report instance
+        :param sink: ReportSink instance
         """
 
-        user_risk_profile_qs = UserRiskProfile.objects.filter(
-            user__app_context=self.context
-        )
+        super(ReporterRiskScoreUsersList, self).run(internal_report, sink)
 
-        self.internal_report = internal_report
+        if self.suggested_scores is not None:
+            self.suggested_scores.save()
+
+    def generate_rows(self):
+        """
+        Generate report entry for each user risk profile
+        """
+
+        user_risk_profile_qs = UserRiskProfile.objects.using(
+            self.database
+        ).filter(
+            user__app_context=self.context
+        ).select_related('user', 'risk_profile')
 
         if self.upper_risk_score:
             user_risk_profile_qs = user_risk_profile_qs.filter(
@@ -50,55 +65,47 @@ class ReporterRiskScoreUsersList:
             user_risk_profile_qs = user_risk_profile_qs.filter(
                 risk_profile__value__gt=self.lower_risk_score)
 
-        if not len(user_risk_profile_qs):
-            self.internal_report.status = INTERNAL_REPORT_STATUS_FAILED
-            self.internal_report.data = ('There is no users with risk score '
-                                         'in these limits')
-            self.internal_report.save()
-            return
+        containers = AssetContainer.objects.using(self.database).filter(
+            user__app_context=self.context)
+
+        self.container_values = get_container_values(containers)
+        self.investment_containers = get_investment_container_ids(containers)
 
-        self.prepare_user_data(user_risk_profile_qs)
+        self.suggested_scores = SuggestedRiskScores(self.context,
+                                                    using=self.database)
 
-        self.internal_report.data = json.dumps(self.users_risk_score_list,
-                                               indent=4)
-        self.internal_report.generated = datetime.now()
-        self.internal_report.status = INTERNAL_REPORT_STATUS_READY
-        self.internal_report.save()
+        for user_risk_profile in user_risk_profile_qs.iterator():
+            yield self.prepare_user_data(user_risk_profile)
 
-    def prepare_user_data(self, user_risk_profile_qs):
+    def prepare_user_data(self, user_risk_profile):
         """
         Prepare data for single user
-        :param user_risk_profile_qs: UserRiskProfile queryset
+        :param user_risk_profile: UserRiskProfile instance
+        :return: dict with report entry
         """
 
-        for user_risk_profile in user_risk_profile_qs:
-            user = user_risk_profile.user
-            portfolio_value = 0
-            container = user.get_container_investments()
+        user = user_risk_profile.user
+        portfolio_value = self.container_values.get(
+            self.investment_containers.get(user.pk), 0)
 
-            if container:
-                portfolio_value = container.get_value()
+        suggested_score = self.__get_suggested_risk_score(user_risk_profile)
 
-            suggested_score = self.__get_suggested_risk_score(user_risk_profile)
-
-            self.users_risk_score_list.append(dict(
-                user_id=user.app_uid,
-                selected_user_risk_score=user_risk_profile.risk_profile.value,
-                suggested_user_risk_score=suggested_score,
-                risk_score_date_save=format_date_long(
-                    user_risk_profile.last_modified),
-                investments_portfolio_value=portfolio_value
-            ))
+        return dict(
+            user_id=user.app_uid,
+            selected_user_risk_score=user_risk_profile.risk_profile.value,
+            suggested_user_risk_score=suggested_score,
+            risk_score_date_save=format_date_long(
+                user_risk_profile.last_modified),
+            investments_portfolio_value=portfolio_value
+        )
 
-    @staticmethod
-    def __get_suggested_risk_score(user_risk_profile):
+    def __get_suggested_risk_score(self, user_risk_profile):
         """
         Get suggested risk score
         :param user_risk_profile:
         :return: suggested risk score
         """
         try:
-            return get_risk_profile(user_risk_profile.user)['risk_profile'][
-                'value']
+            return self.suggested_scores.get(user_risk_profile)
         except ReportWasNotGenerated:
             return user_risk_profile.risk_profile.value
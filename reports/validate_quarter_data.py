@@ -1,26 +1,55 @@
-import json
 import logging
-from datetime import datetime
 from multiprocessing.dummy import Pool
 
+from client_core_analyse.errors import CanNotConnectToCoreAnalyze
 from common.decorators import log_time_ranges
+from django.conf import settings
 from datastorage.models import Transaction
 from historicals.utils import get_quarter_dates
-from internal_reports.constants import INTERNAL_REPORT_STATUS_READY
+from internal_reports.concurrency import AIMDLimiter, unlimited
+from internal_reports.constants import (
+    INTERNAL_REPORT_QUARTER_VALIDATION,
+    INTERNAL_REPORT_SORT_BUFFER_SIZE,
+    INTERNAL_REPORT_STATUS_READY,
+    QUARTER_CHECKS_BATCH_SIZE,
+    QUARTER_PRESCREEN_AUDIT_FRACTION,
+    QUARTER_REPORT_DATA_VERSION,
+    QUARTER_VALIDATION_POOL_CHUNK_SIZE,
+    QUARTER_VALIDATION_WINDOW_SIZE
+)
+from internal_reports.db_connections import (
+    close_thread_connections,
+    get_connection_limiter
+)
 from internal_reports.errors import TransactionsOutOfQuarterError
-from pdf.generators.quarter_report_modules.overview import (
-    get_portfolio_overview
+from internal_reports.history_cache import (
+    HISTORY_ERRORS,
+    get_cached_portfolio_history,
+    get_history_cache
 )
-from pdf.generators.quarter_report_modules.performance import (
-    PortfolioPerformanceGenerator
+from internal_reports.models import InternalReport, QuarterReportData
+from internal_reports.quarter_checks import (
+    evaluate_checks,
+    gather_check_values
 )
-from pdf.generators.quarter_report_modules.summary import (
-    PortfolioSummaryCalculator
+from internal_reports.quarter_data import get_quarter_report_data
+from internal_reports.quarter_prescreen import prescreen_quarter
+from internal_reports.read_database import bind_reads, read_snapshot
+from internal_reports.reports.base import BaseReporter
+from internal_reports.reports.sorting import external_sort
+from internal_reports.sampling import (
+    estimate_failure_rate,
+    get_portfolio_size_strata,
+    get_sample_size,
+    sample_users
 )
-from pdf.utils import (
-    get_formatted_portfolio_history,
-    get_portfolio_creating_date
+from internal_reports.tracing import (
+    span,
+    user_span,
+    bind_context
 )
+from internal_reports.utils import chunked
+from pdf.utils import get_portfolio_creating_date
 from permission.models import UserMapping
 from serviceAPI.settings import ISIN_CASH_COMPONENT
 from tools.dates import format_date_short, read_date_short
@@ -38,114 +67,547 @@ MESSAGE_FAILED_NO_DATA = 'User {} check failed (No data to check)'
 MESSAGE_ALL_VALID_DATA = 'All users have valid data for requested quarter'
 
 
-class ReporterInvalidQuarterData:
+class ReporterInvalidQuarterData(BaseReporter):
     """
     Validator class for Quarter reports
     """
 
-    def __init__(self, end_date, context):
+    empty_message = MESSAGE_ALL_VALID_DATA
+    empty_status = INTERNAL_REPORT_STATUS_READY
+    sort_key = 'user_id'
+
+    def __init__(self, end_date=None, context=None, end_dates=None,
+                 prescreen=False, sample_size=None, sample_fraction=None,
+                 stratify=False, recompute=False):
         """
         Initialise quarter reports validator
 
         :param end_date: quarter end date
         :param context: AppContext instance
+        :param end_dates: list of quarter end dates, used instead of
+            end_date to validate several quarters in one pass
+        :param prescreen: validate fully only users that fail cheap checks
+            on stored data and the audit sample
+        :param sample_size: validate only that many random users
+        :param sample_fraction: validate only that share of random users
+        :param stratify: sample users of all portfolio sizes proportionally
+        :param recompute: calculate quarter data again instead of using
+            stored one
         """
-        end_date_obj = read_date_short(end_date).date()
-        start_date = get_quarter_dates(end_date_obj)[0]
 
-        self.start_date = start_date
-        self.end_date = end_date_obj
-        self.context = context
-        self.data = list()
-
-        self.internal_report = None
+        super(ReporterInvalidQuarterData, self).__init__(context)
+
+        end_dates = [read_date_short(date_str).date()
+                     for date_str in end_dates or [end_date]]
+
+        # The latest quarter goes first, so its history is cached and
+        # earlier quarters are sliced from it
+        self.quarters = [
+            (get_quarter_dates(end_date_obj)[0], end_date_obj)
+            for end_date_obj in sorted(set(end_dates), reverse=True)
+        ]
+
+        self.start_date, self.end_date = self.quarters[0]
+        self.failed_users = set()
+        self.buy_transaction_users = None
+        self.prescreen = prescreen
+        self.prescreened = dict()
+        self.fully_validated = {end_date: list()
+                                for _, end_date in self.quarters}
+        self.sample_size = sample_size
+        self.sample_fraction = sample_fraction
+        self.stratify = stratify
+        self.recompute = recompute
+        self.population = None
+        self.sample = set()
 
     @log_time_ranges
-    def run(self, internal_report):
+    def run(self, internal_report, sink=None):
         """
         Validate all users quarter reports
         :param internal_report: Internal report instance
+        :param sink: ReportSink instance
+        """
 
-        :return: Response with invalid data
+        super(ReporterInvalidQuarterData, self).run(internal_report, sink)
+
+    def generate_rows(self):
+        """
+        Validate users in thread pool and yield invalid data as soon as it's
+        found, rows are sorted by user at the end
         """
 
-        user_mappings = UserMapping.objects.filter(
+        user_mappings = UserMapping.objects.using(self.database).filter(
             app_context=self.context,
             has_portfolio_history=True,
+        ).select_related('app_context')
+
+        # Sample, prefetch and pre-screen see the same data, the snapshot
+        # ends before users are validated
+        with read_snapshot(self.database):
+            if self.sample_size or self.sample_fraction:
+                with span('internal_reports.quarter_validation.sample'):
+                    user_mappings = user_mappings.filter(
+                        pk__in=self.choose_sample(user_mappings))
+
+            with span('internal_reports.quarter_validation.prefetch'):
+                self.buy_transaction_users = (
+                    self.get_buy_transaction_users())
+
+            if self.prescreen:
+                with span('internal_reports.quarter_validation.prescreen'):
+                    self.prescreened = self.prescreen_quarters()
+
+        # Configured threads are the most Core Analyse takes from the
+        # context, adaptive limit only goes below them
+        max_threads = getattr(
+            settings, 'INTERNAL_REPORTS_QUARTER_VALIDATION_MAX_THREADS',
+            self.context.threads_core_analyse_2)
+
+        self.connections = get_connection_limiter()
+
+        self.limiter = AIMDLimiter(
+            initial=self.get_initial_concurrency(),
+            maximum=max_threads,
+            failure_errors=(CanNotConnectToCoreAnalyze,)
         )
 
-        self.internal_report = internal_report
+        batch = list()
+
+        with span('internal_reports.quarter_validation.validate_users',
+                  threads=max_threads):
+            pool = Pool(max_threads)
+
+            try:
+                for user_mapping, rows, validators, end_dates in (
+                        self.iter_results(pool, user_mappings.iterator())):
+                    for row in rows:
+                        yield self.count_row(row)
+
+                    batch += validators
+
+                    if len(batch) >= QUARTER_CHECKS_BATCH_SIZE:
+                        for row in self.check_batch(batch):
+                            yield self.count_row(row)
+                        batch = list()
+
+                    for end_date in end_dates:
+                        self.fully_validated[end_date].append(
+                            user_mapping.app_uid)
+            finally:
+                pool.close()
+                pool.join()
+
+        with span('internal_reports.quarter_validation.checks'):
+            for row in self.check_batch(batch):
+                yield self.count_row(row)
+
+        self.metrics.update(concurrency=self.limiter.history,
+                            concurrency_limit=self.limiter.limit,
+                            db_connections=self.connections.size)
+
+        if self.population is not None:
+            self.metrics.update(sample=self.estimate_failure_rate())
+
+        if self.prescreen:
+            self.metrics.update(
+                prescreened=sum(len(user_ids)
+                                for user_ids in self.prescreened.values()),
+                fully_validated={
+                    format_date_short(end_date): sorted(user_ids)
+                    for end_date, user_ids in self.fully_validated.items()
+                }
+            )
 
-        pool = Pool(self.context.threads_core_analyse_2)
-        pool.map(self.handle_user, user_mappings)
-        pool.close()
-        pool.join()
+    def iter_results(self, pool, user_mappings):
+        """
+        Validate users in the pool in windows, so only a window of users is
+        queued at once and memory does not depend on number of users
 
-        self.internal_report.status = INTERNAL_REPORT_STATUS_READY
+        :param pool: thread pool
+        :param user_mappings: iterator of UserMapping instances
+        :return: generator of handle_user results in completion order
+        """
 
-        if self.data:
-            self.internal_report.data = json.dumps(self.data,
-                                                   indent=4)
-            self.internal_report.generated = datetime.now()
-        else:
-            self.internal_report.data = MESSAGE_ALL_VALID_DATA
+        handle_user = bind_context(bind_reads(self.handle_user,
+                                              self.database))
+
+        for window in chunked(user_mappings, QUARTER_VALIDATION_WINDOW_SIZE):
+            for result in pool.imap_unordered(
+                    handle_user, window,
+                    chunksize=QUARTER_VALIDATION_POOL_CHUNK_SIZE):
+                yield result
+
+    def count_row(self, row):
+        """
+        Remember user of report row for sample estimate
+        :param row: report row
+        :return: the same row
+        """
+
+        self.failed_users.add(row['user_id'])
+
+        return row
+
+    def sort_rows(self, rows):
+        """
+        Sort rows by user and quarter, so reports of the same users and
+        quarters are equal whatever order users are validated in
+        :param rows: iterable of rows
+        :return: iterable of rows
+        """
+
+        return external_sort(
+            rows,
+            key=lambda row: (row['user_id'], row.get('end_date') or ''),
+            buffer_size=INTERNAL_REPORT_SORT_BUFFER_SIZE)
+
+    def choose_sample(self, user_mappings):
+        """
+        Choose random users to validate
+        :param user_mappings: UserMapping queryset of all users
+        :return: set with UserMapping IDs
+        """
+
+        user_ids = list(user_mappings.values_list('pk', flat=True))
+
+        self.population = set(user_ids)
+
+        strata = (get_portfolio_size_strata(user_ids, self.end_date,
+                                            using=self.database)
+                  if self.stratify else None)
+
+        self.sample = sample_users(
+            user_ids,
+            get_sample_size(len(user_ids), self.sample_size,
+                            self.sample_fraction),
+            strata=strata,
+            seed=getattr(self.internal_report, 'pk', None)
+        )
+
+        return self.sample
+
+    def estimate_failure_rate(self):
+        """
+        Estimate failure rate of users by validated users of the sample,
+        users that passed the pre-screen are reported separately
+        :return: dict with estimate, see sampling.estimate_failure_rate
+        """
+
+        prescreened = self.get_fully_prescreened()
+
+        return estimate_failure_rate(
+            failures=len(self.failed_users),
+            total=len(self.sample - prescreened),
+            population=len(self.population),
+            prescreened=len(self.population & prescreened)
+        )
+
+    def get_fully_prescreened(self):
+        """
+        Find users that skip full validation of all quarters
+        :return: set with UserMapping IDs
+        """
+
+        if not self.prescreened:
+            return set()
+
+        return set.intersection(*map(set, self.prescreened.values()))
+
+    def prescreen_quarters(self):
+        """
+        Find users that skip full validation of every quarter
+        :return: dict with quarter end date as key and set of UserMapping
+            IDs as value
+        """
+
+        audit_fraction = getattr(
+            settings, 'INTERNAL_REPORTS_QUARTER_AUDIT_FRACTION',
+            QUARTER_PRESCREEN_AUDIT_FRACTION)
+
+        # Audit sample of the report is the same on every run
+        seed = getattr(self.internal_report, 'pk', None)
 
-        self.internal_report.save()
+        return {
+            end_date: prescreen_quarter(self.context, start_date, end_date,
+                                        audit_fraction, seed,
+                                        using=self.database)
+            for start_date, end_date in self.quarters
+        }
+
+    def get_initial_concurrency(self):
+        """
+        Start from concurrency the previous validation of the context ended
+        with, so every context converges to its best throughput
+        :return: number of concurrent users
+        """
+
+        previous_report = InternalReport.objects.filter(
+            context=self.context,
+            type=INTERNAL_REPORT_QUARTER_VALIDATION,
+            status=INTERNAL_REPORT_STATUS_READY,
+            metrics__isnull=False
+        ).exclude(
+            pk=getattr(self.internal_report, 'pk', None)
+        ).order_by('-generated').first()
+
+        if previous_report is not None:
+            limit = previous_report.get_metrics().get('concurrency_limit')
+
+            if limit:
+                return limit
+
+        return self.context.threads_core_analyse_2
 
     def handle_user(self, user_mapping):
         """
         Validate data for certain user
 
         :param user_mapping: UserMapping instance
+        :return: tuple with the user and results of validate_user
         """
 
         logger.info(MESSAGE_STARTED.format(user_mapping))
 
+        with user_span('internal_reports.quarter_validation.user',
+                       user_id=user_mapping.app_uid):
+            try:
+                self.prefetch_history(user_mapping)
+
+                return (user_mapping,) + self.validate_user(user_mapping)
+            finally:
+                # Connections opened by Core Analyse calls outside of
+                # database slots
+                close_thread_connections()
+
+    def prefetch_history(self, user_mapping):
+        """
+        Fetch portfolio history of the user to the history cache in a slot
+        of concurrency limiter, stored data is checked in a database slot.
+        Nothing is fetched if history is not cached or quarter data of the
+        user is already stored
+
+        :param user_mapping: UserMapping instance
+        """
+
+        if get_history_cache() is None:
+            return
+
+        quarters = [
+            (start_date, end_date) for start_date, end_date in self.quarters
+            if user_mapping.pk not in self.prescreened.get(end_date, ())
+        ]
+
+        with self.connections.slot():
+            stored = 0 if self.recompute else QuarterReportData.objects.filter(
+                user=user_mapping,
+                end_date__in=[end_date for _, end_date in quarters],
+                data_version=QUARTER_REPORT_DATA_VERSION
+            ).count()
+
+            if stored >= len(quarters):
+                return
+
+            creating_dates = [
+                get_portfolio_creating_date(user_mapping=user_mapping,
+                                            start_date=start_date)
+                for start_date, _ in quarters
+            ]
+
+        ranges = [(creating_date, end_date) for creating_date, (_, end_date)
+                  in zip(creating_dates, quarters)
+                  if creating_date <= end_date]
+
+        if not ranges:
+            return
+
         try:
-            data = UserQuarterDataValidator(
+            get_cached_portfolio_history(
                 user_mapping=user_mapping,
-                start_date=self.start_date,
-                end_date=self.end_date
-            ).validate()
+                start_date=min(start for start, _ in ranges),
+                end_date=max(end for _, end in ranges),
+                call_slot=self.limiter.slot
+            )
+        except HISTORY_ERRORS:
+            # Error is reported when the quarter is validated
+            pass
+
+    def validate_user(self, user_mapping):
+        """
+        Run validator for every quarter of certain user. Results are
+        returned, so worker threads do not change the reporter
 
-            if data:
-                self.data.append(data)
+        :param user_mapping: UserMapping instance
+        :return: tuple with list of report rows, list of validators waiting
+            for batch checks and list of end dates of validated quarters
+        """
 
-            logger.info(MESSAGE_FINISHED.format(user_mapping))
+        rows = list()
+        validators = list()
+        end_dates = list()
 
-        except TransactionsOutOfQuarterError:
-            logger.info(MESSAGE_FAILED_NO_DATA.format(user_mapping))
+        for start_date, end_date in self.quarters:
+            if user_mapping.pk in self.prescreened.get(end_date, ()):
+                continue
 
-        except Exception as ex:
-            self.data.append(
-                dict(
-                    user_id=user_mapping.app_uid,
-                    error=str(ex)
-                )
-            )
+            end_dates.append(end_date)
+
+            try:
+                validator = self.validate_user_quarter(
+                    user_mapping, start_date, end_date)
+
+                if validator is not None and validator.check_values is None:
+                    validator.is_report_data_valid()
+                    row = validator.get_invalid_data()
+
+                    if row:
+                        rows.append(row)
+
+                elif validator is not None:
+                    validators.append(validator)
+
+                logger.info(MESSAGE_FINISHED.format(user_mapping))
+
+            except TransactionsOutOfQuarterError:
+                logger.info(MESSAGE_FAILED_NO_DATA.format(user_mapping))
+                break
 
-            logger.info(MESSAGE_FAILED.format(user_mapping))
+            except Exception as ex:
+                rows.append(
+                    self.get_error_row(user_mapping, ex, start_date, end_date))
+
+                logger.info(MESSAGE_FAILED.format(user_mapping))
+
+        return rows, validators, end_dates
+
+    def get_error_row(self, user_mapping, error, start_date, end_date):
+        """
+        Report row for error of the user, quarter is added if several
+        quarters are validated
+
+        :param user_mapping: UserMapping instance
+        :param error: error that happened for the user
+        :param start_date: quarter start date
+        :param end_date: quarter end date
+        :return: dict with row data
+        """
+
+        data = dict(
+            user_id=user_mapping.app_uid,
+            error=str(error)
+        )
+
+        if len(self.quarters) > 1:
+            data.update(start_date=format_date_short(start_date),
+                        end_date=format_date_short(end_date))
+
+        return data
+
+    def validate_user_quarter(self, user_mapping, start_date, end_date):
+        """
+        Prepare quarter data of the user
+
+        :param user_mapping: UserMapping instance
+        :param start_date: quarter start date
+        :param end_date: quarter end date
+        :return: UserQuarterDataValidator instance with gathered data or
+            None if portfolio is created after the quarter
+        """
+
+        validator = UserQuarterDataValidator(
+            user_mapping=user_mapping,
+            start_date=start_date,
+            end_date=end_date,
+            has_buy_transactions=self.has_buy_transactions(user_mapping),
+            call_slot=self.limiter.slot,
+            db_slot=self.connections.slot,
+            recompute=self.recompute
+        )
+
+        return validator if validator.gather() else None
+
+    def check_batch(self, validators):
+        """
+        Run checks for validators at once
+
+        :param validators: list of UserQuarterDataValidator instances
+        :return: generator of report rows with invalid data
+        """
+
+        results = evaluate_checks(
+            [validator.check_values for validator in validators])
+
+        for validator, checks in zip(validators, results):
+            validator.apply_checks(checks)
+
+            try:
+                row = validator.get_invalid_data()
+            except Exception as ex:
+                row = self.get_error_row(validator.user_mapping, ex,
+                                         validator.start_date,
+                                         validator.end_date)
+
+            if row:
+                yield row
+
+    def get_buy_transaction_users(self):
+        """
+        Find users of the context with buy transactions in one query
+        :return: set with UserMapping IDs
+        """
+
+        return set(Transaction.objects.using(self.database).filter(
+            user__app_context=self.context,
+            type=TRANSACTION_TYPE_BUY
+        ).values_list('user_id', flat=True).distinct())
+
+    def has_buy_transactions(self, user_mapping):
+        """
+        Check prefetched buy transactions of the user
+        :param user_mapping: UserMapping instance
+        :return: boolean value or None if transactions are not prefetched
+        """
+
+        if self.buy_transaction_users is None:
+            return None
+
+        return user_mapping.pk in self.buy_transaction_users
 
 
 class UserQuarterDataValidator:
     """
     User quarter report validator
     """
-    def __init__(self, user_mapping, start_date, end_date):
+    def __init__(self, user_mapping, start_date, end_date,
+                 has_buy_transactions=None, call_slot=unlimited,
+                 db_slot=unlimited, recompute=False):
         """
         Initialise user's quarter report data
         :param user_mapping: UserMapping instance
         :param start_date: quarter start date
         :param end_date: quarter end date
+        :param has_buy_transactions: prefetched flag if user has buy
+            transactions, it's checked in DB if not passed
+        :param call_slot: context manager factory Core Analyse calls run
+            in, e.g. slot of concurrency limiter
+        :param db_slot: context manager factory database queries of the
+            validator run in, e.g. slot of connection limiter
+        :param recompute: calculate quarter data even if it's stored
         """
 
         self.user_mapping = user_mapping
+        self.call_slot = call_slot
+        self.db_slot = db_slot
+        self.recompute = recompute
+        self.has_buy_transactions = has_buy_transactions
         self.start_date = start_date
         self.end_date = end_date
-        self.portfolio_creating_date = get_portfolio_creating_date(
-            user_mapping=user_mapping,
-            start_date=start_date
-        )
+
+        with db_slot():
+            self.portfolio_creating_date = get_portfolio_creating_date(
+                user_mapping=user_mapping,
+                start_date=start_date
+            )
 
         self.revenue_per_asset_valid = False
         self.vs_valid = False
@@ -156,56 +618,32 @@ class UserQuarterDataValidator:
 
         self.summary = None
         self.overview = None
+        self.check_values = None
 
     def prepare_data(self):
         """
         Prepare quarter report data that will be validated
         """
 
-        transactions = Transaction.objects.filter(
-            user=self.user_mapping,
-            type=TRANSACTION_TYPE_BUY
-        )
+        if self.has_buy_transactions is None:
+            with self.db_slot():
+                self.has_buy_transactions = Transaction.objects.filter(
+                    user=self.user_mapping,
+                    type=TRANSACTION_TYPE_BUY
+                ).exists()
 
-        if not transactions.exists():
+        if not self.has_buy_transactions:
             raise TransactionsOutOfQuarterError
 
-        history = get_formatted_portfolio_history(
-            user_mapping=self.user_mapping,
-            portfolio_creating_date=self.portfolio_creating_date,
-            end_date=self.end_date
-        )
-
-        portfolio_performance = PortfolioPerformanceGenerator(
-            user_mapping=self.user_mapping,
-            start_date=self.start_date,
-            end_date=self.end_date,
-            portfolio_creating_date=self.portfolio_creating_date
-        ).get_performance_data()
-
-        self.summary = PortfolioSummaryCalculator(
+        self.summary, self.overview = get_quarter_report_data(
             user_mapping=self.user_mapping,
             start_date=self.start_date,
             end_date=self.end_date,
             portfolio_creating_date=self.portfolio_creating_date,
-            portfolio_history=history,
-            costs=None,
-            portfolio_performance=portfolio_performance
-        ).calculate_extended()
-
-        date = self.end_date
-
-        last_sell_date = self.summary['last_sell_date']
-
-        if last_sell_date:
-            date = last_sell_date
-
-        self.overview = get_portfolio_overview(
-            start_date=self.start_date,
-            end_date=date,
-            portfolio_creating_date=self.portfolio_creating_date,
-            portfolio_history=history
-        )['data']
+            call_slot=self.call_slot,
+            db_slot=self.db_slot,
+            recompute=self.recompute
+        )
 
     def validate(self):
         """
@@ -217,40 +655,35 @@ class UserQuarterDataValidator:
             return
 
         self.prepare_data()
+        self.is_report_data_valid()
 
-        if not self.is_report_data_valid():
-            self.summary.pop('flow_per_asset')
-
-            last_sell_date = self.summary['last_sell_date']
-
-            if last_sell_date:
-                last_sell_date = format_date_short(last_sell_date)
-                self.summary['last_sell_date'] = last_sell_date
-
-            return dict(
-                user_id=self.user_mapping.app_uid,
-                start_date=format_date_short(self.start_date),
-                end_date=format_date_short(self.end_date),
-                context=self.user_mapping.app_context.name,
-                revenue_is_valid=self.revenue_is_valid,
-                start_values_are_valid=self.start_valid,
-                end_values_are_valid=self.end_valid,
-                transaction_and_revenue_valid=self.trans_and_revenue_valid,
-                is_cash_component_valid=self.vs_valid,
-                revenue_per_asset_valid=self.revenue_per_asset_valid,
-                **self.summary
-            )
+        return self.get_invalid_data()
 
-    def is_report_data_valid(self):
+    def gather(self):
         """
-        Check if quarter report data is valid
-        :return: boolean value that shows if data valid
+        Prepare quarter report data and collect values for batch checks.
+        check_values stays None if data can't be checked in batch
+        :return: False if portfolio is created after the quarter
         """
 
-        self.validate_revenue_per_asset(self.summary, self.overview)
-        self.validate_revenue(self.summary)
-        self.validate_portfolio_values(self.summary, self.overview)
+        if self.portfolio_creating_date > self.end_date:
+            return False
+
+        self.prepare_data()
+        self.check_values = gather_check_values(self.summary, self.overview)
+
+        return True
+
+    def apply_checks(self, checks):
+        """
+        Set results of batch checks
+        :param checks: dict with check results from evaluate_checks
+        """
+
+        for name, value in checks.items():
+            setattr(self, name, value)
 
+    def is_valid(self):
         return (self.revenue_per_asset_valid
                 and self.vs_valid
                 and self.revenue_is_valid
@@ -258,6 +691,49 @@ class UserQuarterDataValidator:
                 and self.end_valid
                 and self.trans_and_revenue_valid)
 
+    def get_invalid_data(self):
+        """
+        Prepare report entry of checked data
+        :return: dict of invalid data or None if data is valid
+        """
+
+        if self.is_valid():
+            return None
+
+        self.summary.pop('flow_per_asset')
+
+        last_sell_date = self.summary['last_sell_date']
+
+        if last_sell_date:
+            last_sell_date = format_date_short(last_sell_date)
+            self.summary['last_sell_date'] = last_sell_date
+
+        return dict(
+            user_id=self.user_mapping.app_uid,
+            start_date=format_date_short(self.start_date),
+            end_date=format_date_short(self.end_date),
+            context=self.user_mapping.app_context.name,
+            revenue_is_valid=self.revenue_is_valid,
+            start_values_are_valid=self.start_valid,
+            end_values_are_valid=self.end_valid,
+            transaction_and_revenue_valid=self.trans_and_revenue_valid,
+            is_cash_component_valid=self.vs_valid,
+            revenue_per_asset_valid=self.revenue_per_asset_valid,
+            **self.summary
+        )
+
+    def is_report_data_valid(self):
+        """
+        Check if quarter report data is valid
+        :return: boolean value that shows if data valid
+        """
+
+        self.validate_revenue_per_asset(self.summary, self.overview)
+        self.validate_revenue(self.summary)
+        self.validate_portfolio_values(self.summary, self.overview)
+
+        return self.is_valid()
+
     def validate_revenue_per_asset(self, summary, overview_raw):
         """
         Validate revenue value using data from each asset
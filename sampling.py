@@ -0,0 +1,168 @@
+"""
+Random samples of users for quick health checks.
+
+Sample can be stratified by portfolio size: users are split into groups by
+the latest stored portfolio value and every group gets its share of the
+sample, so small and big portfolios are represented as in the whole
+population and the failure rate of the sample estimates the failure rate of
+all users.
+"""
+import math
+import random
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import OuterRef, Subquery
+
+from internal_reports.constants import (
+    SAMPLING_CONFIDENCE_Z,
+    SAMPLING_STRATA_COUNT
+)
+from internal_reports.models import UserDailyPortfolioValue
+from permission.models import UserMapping
+
+
+# Stratum of users without stored portfolio value
+UNKNOWN_SIZE_STRATUM = -1
+
+
+def get_sample_size(population, sample_size=None, sample_fraction=None):
+    """
+    Number of users to sample
+    :param population: number of all users
+    :param sample_size: requested number of users
+    :param sample_fraction: requested share of users, from 0 to 1
+    :return: number of users not bigger than population
+    """
+
+    if sample_size is None:
+        sample_size = int(math.ceil(population * sample_fraction))
+
+    return min(sample_size, population)
+
+
+def get_portfolio_size_strata(user_ids, end_date,
+                              strata_count=SAMPLING_STRATA_COUNT,
+                              using=DEFAULT_DB_ALIAS):
+    """
+    Split users into groups of about the same number of users by the latest
+    portfolio value stored on or before the date
+
+    :param user_ids: list with UserMapping IDs
+    :param end_date: date of portfolio values
+    :param strata_count: number of groups of users with stored values
+    :param using: database alias
+    :return: dict with user ID as key and group number as value
+    """
+
+    latest_value = UserDailyPortfolioValue.objects.filter(
+        user_id=OuterRef('pk'),
+        date__lte=end_date
+    ).order_by('-date').values('value')[:1]
+
+    values = {
+        user_id: value
+        for user_id, value in UserMapping.objects.using(using).filter(
+            pk__in=user_ids
+        ).annotate(
+            value=Subquery(latest_value)
+        ).values_list('pk', 'value')
+        if value is not None
+    }
+
+    ordered = sorted(values, key=values.get)
+
+    strata = {user_id: UNKNOWN_SIZE_STRATUM for user_id in user_ids}
+
+    for position, user_id in enumerate(ordered):
+        strata[user_id] = position * strata_count // len(ordered)
+
+    return strata
+
+
+def sample_users(user_ids, size, strata=None, seed=None):
+    """
+    Choose random users. With strata every group gets share of the sample
+    proportional to its size, remainders go to the groups with the largest
+    fractional parts
+
+    :param user_ids: list with user IDs
+    :param size: number of users to choose
+    :param strata: dict with user ID as key and group as value
+    :param seed: random seed
+    :return: set with chosen user IDs
+    """
+
+    generator = random.Random(seed)
+    user_ids = sorted(user_ids)
+
+    if not strata:
+        return set(generator.sample(user_ids, size))
+
+    groups = dict()
+
+    for user_id in user_ids:
+        groups.setdefault(strata[user_id], list()).append(user_id)
+
+    quotas = {key: len(group) * size / len(user_ids)
+              for key, group in groups.items()}
+    counts = {key: int(quota) for key, quota in quotas.items()}
+
+    for key in sorted(quotas, key=lambda key: counts[key] - quotas[key])[
+            :size - sum(counts.values())]:
+        counts[key] += 1
+
+    sample = set()
+
+    for key, group in groups.items():
+        sample.update(generator.sample(group, counts[key]))
+
+    return sample
+
+
+def wilson_interval(failures, total, z=SAMPLING_CONFIDENCE_Z):
+    """
+    Wilson score interval of the failure rate
+
+    :param failures: number of failed users in the sample
+    :param total: number of users in the sample
+    :param z: standard normal quantile of the confidence level
+    :return: tuple with lower and upper bounds
+    """
+
+    if not total:
+        return 0.0, 1.0
+
+    rate = failures / total
+    denominator = 1 + z ** 2 / total
+    center = (rate + z ** 2 / (2 * total)) / denominator
+    margin = (z * math.sqrt(rate * (1 - rate) / total
+                            + z ** 2 / (4 * total ** 2)) / denominator)
+
+    return max(center - margin, 0.0), min(center + margin, 1.0)
+
+
+def estimate_failure_rate(failures, total, population, prescreened=0):
+    """
+    Failure rate of all users estimated by the sample. Users that passed the
+    pre-screen are not validated, so they are not part of the estimate and
+    are reported separately
+
+    :param failures: number of failed users in the sample
+    :param total: number of validated users in the sample
+    :param population: number of all users
+    :param prescreened: number of users of the population that passed the
+        pre-screen
+    :return: dict with estimate and its confidence bounds
+    """
+
+    lower, upper = wilson_interval(failures, total)
+
+    return dict(
+        population=population - prescreened,
+        prescreened=prescreened,
+        sample_size=total,
+        failed=failures,
+        failure_rate=failures / total if total else None,
+        failure_rate_lower=lower,
+        failure_rate_upper=upper
+    )
@@ -1,16 +1,16 @@
 import json
 from datetime import date, datetime
+from itertools import islice
 
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
 
-from datastorage.models import Asset
 from internal_reports.constants import (
+    INTERNAL_REPORT_PAGE_SIZE,
     INTERNAL_REPORT_TYPES,
     INTERNAL_REPORT_STATUSES
 )
 from internal_reports.models import InternalReport
-from internal_reports.utils import format_date_short_or_none
 from tools.utils import BasicDataSerializer
 from tools.dates import (
     format_date_long,
@@ -62,25 +62,36 @@ class InternalReportSerializer(serializers.ModelSerializer):
 
 class InternalReportDetailedSerializer(InternalReportSerializer):
     """
-    Serializer for single internal report
+    Serializer for single internal report. Rows of reports stored in chunks
+    are returned by pages, page number is passed in context
     """
 
     data = serializers.SerializerMethodField()
+    page = serializers.SerializerMethodField()
+    metrics = serializers.SerializerMethodField()
 
     class Meta:
         model = InternalReport
         fields = ('id', 'context', 'type', 'status', 'generated', 'input_data',
-                  'data')
+                  'data', 'page', 'metrics')
 
-    @staticmethod
-    def get_data(obj):
+    def get_page(self, obj):
+        return self.context.get('page', 0)
+
+    def get_data(self, obj):
         if not obj.data:
-            return {}
+            start = self.get_page(obj) * INTERNAL_REPORT_PAGE_SIZE
+            return list(islice(obj.iter_rows(), start,
+                               start + INTERNAL_REPORT_PAGE_SIZE)) or {}
         try:
             return json.loads(obj.data)
         except ValueError:
             return obj.data
 
+    @staticmethod
+    def get_metrics(obj):
+        return obj.get_metrics()
+
 
 class InternalReportListRequestSerializer(BasicDataSerializer):
     start_date = serializers.DateField(
@@ -141,35 +152,3 @@ class InternalReportListRequestSerializer(BasicDataSerializer):
 
         return validated_data
 
-
-class InternalReportAssetsSerializer(serializers.ModelSerializer):
-    """
-    Serializer for assets internal report data
-    """
-
-    updated_at = serializers.SerializerMethodField()
-    price = serializers.SerializerMethodField()
-    user_id = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Asset
-        fields = ('id', 'user_id', 'name', 'type', 'value',
-                  'quantity', 'price', 'updated_at'
-        )
-
-    @staticmethod
-    def get_updated_at(obj):
-        if obj.financial_information:
-            return format_date_short_or_none(
-                obj.financial_information.market_data_updated)
-        return None
-
-    @staticmethod
-    def get_price(obj):
-        if obj.financial_information:
-            return obj.financial_information.unit_price
-        return None
-
-    @staticmethod
-    def get_user_id(obj):
-        return obj.user.app_uid
@@ -0,0 +1,43 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from datastorage.models import Transaction
+from internal_reports.models import (
+    QuarterReportData,
+    SuggestedRiskScore,
+    UserDailyPortfolioValueSync
+)
+
+
+def invalidate_user_report_data(user_id):
+    """
+    Drop cached histories, stored daily values, quarter report data and
+    suggested risk score of the user
+
+    :param user_id: UserMapping ID
+    """
+
+    # Signals are connected when the app is ready, history cache pulls in
+    # Core Analyse client and pdf, so it's imported on the first change
+    from internal_reports.history_cache import invalidate_user_history
+
+    invalidate_user_history(user_id)
+    UserDailyPortfolioValueSync.objects.filter(user_id=user_id).delete()
+    QuarterReportData.objects.filter(user_id=user_id).delete()
+    SuggestedRiskScore.objects.filter(user_id=user_id).delete()
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def invalidate_report_data_on_transaction_change(sender, instance, **kwargs):
+    """
+    Report data of the user depends on transactions, so it's dropped when
+    they change. It's done after commit, so transaction writes do not wait
+    for it and rolled back changes do not drop anything
+    """
+
+    transaction.on_commit(
+        partial(invalidate_user_report_data, instance.user_id))
@@ -0,0 +1,183 @@
+"""
+Stored suggested risk scores of users.
+
+Suggested score is derived from user's risk questionnaire and portfolio, so
+it's stored with a fingerprint of its inputs: content of the user's risk
+profile row and content of all user's rows of input models (transactions
+by default). Rows are hashed with all their columns, so changes made in
+place, also by queryset updates that send no signals, change the
+fingerprint. Score is computed again only when the fingerprint changes.
+
+Stored scores and inputs of all users of the report are read with one query
+per model. Computed scores are kept in memory and stored in batches by
+save() after the report rows are generated.
+
+Settings:
+
+* INTERNAL_REPORTS_SUGGESTED_RISK_SCORE_INPUTS - labels of models with
+  user foreign key the score is derived from, e.g. the model of
+  questionnaire answers, which is defined outside of this app
+"""
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+
+from internal_reports.constants import (
+    SUGGESTED_RISK_SCORE_BATCH_SIZE,
+    SUGGESTED_RISK_SCORE_DEFAULT_INPUTS
+)
+from internal_reports.models import SuggestedRiskScore
+from internal_reports.utils import chunked
+from pdf.generators.utils import get_risk_profile
+
+
+def get_row_content(instance):
+    """
+    Get values of all columns of model instance
+    :param instance: model instance
+    :return: list of values
+    """
+
+    return [getattr(instance, field.attname)
+            for field in instance._meta.concrete_fields]
+
+
+def make_fingerprint(user_risk_profile, inputs_digest):
+    """
+    Hash inputs of the suggested risk score
+
+    :param user_risk_profile: UserRiskProfile instance
+    :param inputs_digest: hex digest of user's rows of input models
+    :return: hex digest
+    """
+
+    inputs = [get_row_content(user_risk_profile), inputs_digest]
+
+    return hashlib.sha1(
+        json.dumps(inputs, default=str).encode()).hexdigest()
+
+
+def hash_input_rows(context, using=DEFAULT_DB_ALIAS):
+    """
+    Hash rows of input models of every user of the context, one query per
+    model
+
+    :param context: AppContext instance
+    :param using: database alias
+    :return: dict with UserMapping ID as key and hex digest as value
+    """
+
+    hashes = defaultdict(hashlib.sha1)
+
+    labels = getattr(settings, 'INTERNAL_REPORTS_SUGGESTED_RISK_SCORE_INPUTS',
+                     SUGGESTED_RISK_SCORE_DEFAULT_INPUTS)
+
+    for label in labels:
+        model = apps.get_model(label)
+        columns = [field.attname for field in model._meta.concrete_fields]
+
+        rows = model.objects.using(using).filter(
+            user__app_context=context
+        ).order_by('user_id', 'pk').values_list('user_id', *columns)
+
+        for row in rows.iterator():
+            hashes[row[0]].update(
+                json.dumps([label] + list(row[1:]), default=str).encode())
+
+    return {user_id: digest.hexdigest() for user_id, digest in hashes.items()}
+
+
+def compute_suggested_risk_score(user_mapping):
+    """
+    Derive suggested risk score from questionnaire and portfolio
+    :param user_mapping: UserMapping instance
+    :return: suggested risk score
+    :raises ReportWasNotGenerated: if score can't be derived
+    """
+
+    return get_risk_profile(user_mapping)['risk_profile']['value']
+
+
+class SuggestedRiskScores:
+    """
+    Suggested risk scores of users of the context
+    """
+
+    def __init__(self, context, using=DEFAULT_DB_ALIAS):
+        """
+        Read stored scores and inputs of all users
+
+        :param context: AppContext instance
+        :param using: database alias stored scores and inputs are read from,
+            scores are stored to the default database
+        """
+
+        self.stored = {
+            user_id: (fingerprint, value)
+            for user_id, fingerprint, value
+            in SuggestedRiskScore.objects.using(using).filter(
+                user__app_context=context
+            ).values_list('user_id', 'fingerprint', 'value').iterator()
+        }
+
+        self.inputs = hash_input_rows(context, using)
+        self.computed = dict()
+
+    def get(self, user_risk_profile):
+        """
+        Get stored score or compute it if inputs changed. Computed score is
+        stored by save()
+
+        :param user_risk_profile: UserRiskProfile instance
+        :return: suggested risk score
+        :raises ReportWasNotGenerated: if score can't be derived
+        """
+
+        user_id = user_risk_profile.user_id
+
+        fingerprint = make_fingerprint(user_risk_profile,
+                                       self.inputs.get(user_id))
+
+        stored_fingerprint, value = self.stored.get(user_id, (None, None))
+
+        if stored_fingerprint == fingerprint:
+            return json.loads(value)
+
+        score = compute_suggested_risk_score(user_risk_profile.user)
+
+        self.stored[user_id] = (fingerprint, json.dumps(score))
+        self.computed[user_id] = self.stored[user_id]
+
+        return score
+
+    def save(self):
+        """
+        Store computed scores in batches. Batch that conflicts with scores
+        stored by another report in the meantime is skipped, its scores are
+        computed again next time
+        """
+
+        computed, self.computed = self.computed, dict()
+        now = datetime.now()
+
+        for user_ids in chunked(sorted(computed),
+                                SUGGESTED_RISK_SCORE_BATCH_SIZE):
+            try:
+                with transaction.atomic():
+                    SuggestedRiskScore.objects.filter(
+                        user_id__in=user_ids).delete()
+
+                    SuggestedRiskScore.objects.bulk_create([
+                        SuggestedRiskScore(user_id=user_id,
+                                           fingerprint=computed[user_id][0],
+                                           value=computed[user_id][1],
+                                           computed=now)
+                        for user_id in user_ids
+                    ])
+            except IntegrityError:
+                pass
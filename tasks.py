@@ -0,0 +1,29 @@
+from internal_reports.balance_snapshots import snapshot_context_balances
+from internal_reports.daily_value_table import fill_daily_values
+from internal_reports.reports.active_users_list import (
+    get_users_with_investments
+)
+from permission.models import AppContext
+from serviceAPI.celery import app
+
+
+@app.task
+def fill_daily_portfolio_values():
+    """
+    Store daily portfolio values up to yesterday for users with investments.
+    Should be scheduled once a day, after market data is updated
+    """
+
+    for context in AppContext.objects.all():
+        fill_daily_values(get_users_with_investments(context).iterator())
+
+
+@app.task
+def snapshot_balances():
+    """
+    Store today's values of all asset containers. Should be scheduled once
+    a day, after market data is updated
+    """
+
+    for context in AppContext.objects.all():
+        snapshot_context_balances(context)
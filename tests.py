@@ -1,8 +1,17 @@
 import json
+import threading
+import time
 from datetime import datetime, timedelta, date
+from decimal import Decimal
 from multiprocessing.pool import ThreadPool
+from operator import itemgetter
+from unittest import skipIf
 
 from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import DateField
+from django.test import override_settings
 from django.urls import reverse
 from mock import patch
 from rest_framework import status
@@ -28,39 +37,132 @@ from client_service_c.models import service_cRebalancingOrder
 from client_service_c.tests import Basicservice_cTest
 from client_service_c.utils.common import get_order_status
 from client_service_c.views import RebalancingView
+from datastorage.constants import TRANSACTION_TYPE_BUY
 from datastorage.models import (
+    Asset,
+    AssetContainer,
+    Goal,
     Order,
+    Transaction,
     UserRiskProfile,
     RiskProfile,
     RecurrentOrderContainer
 )
 from historicals.utils import get_quarter_dates
+from internal_reports.concurrency import AIMDLimiter
 from internal_reports.constants import (
     FILE_FORMAT_JSON,
+    HISTORY_DAY_ESTIMATED_BYTES,
+    INTERNAL_REPORT_COLUMNS,
+    INTERNAL_REPORT_CSV_COLUMNS,
+    INTERNAL_REPORT_GOALS,
+    INTERNAL_REPORT_ORDERS,
+    INTERNAL_REPORT_TYPES,
     INTERNAL_REPORT_STATUS_READY,
     INTERNAL_REPORT_ACTIVE_USERS,
-    INTERNAL_REPORT_STATUS_GENERATING
+    INTERNAL_REPORT_STATUS_GENERATING,
+    QUARTER_REPORT_DATA_VERSION
 )
+from internal_reports.balance_snapshots import snapshot_context_balances
+from internal_reports.daily_value_table import fill_daily_values
+from internal_reports.db_connections import (
+    ConnectionLimiter,
+    close_pool_connections
+)
+from internal_reports.daily_values import DailyPortfolioValues
 from internal_reports.errors import (
+    BrokenPortfolioComponent,
     DatesForReportAreRequired,
     RequiredParameters,
     NoInternalReportError,
     CanNotDownloadReportError,
     ReportDataError,
+    PrescreenNotAvailable,
     WrongFileFormat,
     WrongInputValue
 )
-from internal_reports.generator import generate_report_in_background
-from internal_reports.models import InternalReport
+from internal_reports.generator import (
+    generate_report_in_background,
+    get_reporter_class
+)
+from internal_reports.history_cache import (
+    HistoryVersions,
+    LocalHistoryCacheBackend,
+    PortfolioHistoryCache,
+    clear_history_cache,
+    estimate_history_size
+)
+from internal_reports.management.commands.benchmark_report_imports import (
+    measure_import
+)
+from internal_reports.models import (
+    AssetContainerBalanceSnapshot,
+    InternalReport,
+    QuarterReportData,
+    UserDailyPortfolioValue,
+    UserDailyPortfolioValueSync
+)
+from internal_reports.portfolio_history import (
+    ColumnarPortfolioHistory,
+    to_columnar,
+    to_dict
+)
+from internal_reports.quarter_checks import (
+    evaluate_checks,
+    gather_check_values,
+    round_values
+)
+from internal_reports.quarter_data import get_quarter_report_data
+from internal_reports.quarter_prescreen import (
+    find_unsuspicious_users,
+    get_transaction_date_field,
+    take_audit_sample
+)
+from internal_reports.read_database import (
+    ReadDatabaseRouter,
+    bind_reads,
+    route_reads
+)
 from internal_reports.reports.active_users_list import ReporterActiveUsersList
 from internal_reports.reports.assets import ReporterAssets
 from internal_reports.reports.balances import ReporterBalances
+from internal_reports.reports.columns import (
+    compile_columns,
+    get_number_converter
+)
 from internal_reports.reports.goals_report import ReporterGoals
 from internal_reports.reports.orders import ReporterOrders
 from internal_reports.reports.recurrent_orders import ReporterRecurrentOrders
+from internal_reports.reports.sinks import MemorySink
+from internal_reports.reports.sorting import external_sort
 from internal_reports.reports.users_risk_score import ReporterRiskScoreUsersList
 from internal_reports.reports.validate_quarter_data import (
-    ReporterInvalidQuarterData
+    ReporterInvalidQuarterData,
+    UserQuarterDataValidator
+)
+from internal_reports.sampling import (
+    UNKNOWN_SIZE_STRATUM,
+    get_portfolio_size_strata,
+    sample_users,
+    wilson_interval
+)
+from internal_reports.serializers import InternalReportDetailedSerializer
+from internal_reports.signals import invalidate_user_report_data
+from internal_reports.suggested_risk_scores import SuggestedRiskScores
+from internal_reports.tracing import (
+    bind_context,
+    child_span,
+    span,
+    trace,
+    user_span
+)
+from internal_reports.utils import (
+    format_date_short_or_none,
+    get_quarter_end_dates_from_request
+)
+from internal_reports.valuation import (
+    get_container_values,
+    get_investment_container_ids
 )
 from internal_reports.views import (
     GenerateActiveUsersView,
@@ -100,8 +202,7 @@ from serviceAPI.testing_tools import (
     FAKE_FUND_NAME_2,
     FAKE_ISIN_3,
     FAKE_FUND_NAME_3,
-    MockAnalyseClientCorrectRebalance,
-    PoolWithoutThreads)
+    MockAnalyseClientCorrectRebalance)
 from serviceAPI.testing_utils import (
     create_user,
     assign_risk_profile,
@@ -110,8 +211,16 @@ from serviceAPI.testing_utils import (
 from tools.dates import format_date_short
 
 
+def imap_without_threads(self, func, iterable, chunksize=1):
+    return map(func, iterable)
+
+
 class InternalReportBasicTest(Basicservice_cTest):
 
+    def setUp(self):
+        super(InternalReportBasicTest, self).setUp()
+        clear_history_cache()
+
     def view_report(self, report_id):
         url = reverse('internal:view')
 
@@ -168,7 +277,15 @@ class ServiceEndpointsTest(InternalReportBasicTest):
         with self.assertRaises(NoInternalReportError):
             self.download_report(report_id=0)
 
+    def test_reporters_registry(self):
+        self.assertIs(get_reporter_class(INTERNAL_REPORT_ACTIVE_USERS),
+                      ReporterActiveUsersList)
+
+        for report_type, _ in INTERNAL_REPORT_TYPES:
+            self.assertTrue(hasattr(get_reporter_class(report_type), 'run'))
+
 
+@patch.object(ThreadPool, 'imap', imap_without_threads)
 class ActiveUsersReportTest(InternalReportBasicTest):
 
     def setUp(self):
@@ -398,6 +515,82 @@ class ActiveUsersReportTest(InternalReportBasicTest):
             response = self.view_report(report.id)
             self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_generate_active_users_list_from_stored_values(self):
+
+        def get_portfolio_history(*_, **__):
+            return self.history
+
+        report_dates = dict(start_date=format_date_short(self.start_date),
+                            end_date=format_date_short(self.end_date),
+                            consecutive_days=1)
+
+        with patch('pdf.utils.get_portfolio_history', get_portfolio_history):
+            fetched_report = self.generate_report(**report_dates)
+
+            fill_daily_values([self.user_mapping], self.end_date)
+
+        stored_report = self.generate_report(**report_dates)
+
+        self.assertEqual(stored_report.get_metrics()['stored_users'], 1)
+        self.assertEqual(list(stored_report.iter_rows()),
+                         list(fetched_report.iter_rows()))
+
+    def test_stored_period_ends_with_history(self):
+
+        def get_portfolio_history(*_, **__):
+            return self.history
+
+        with patch('pdf.utils.get_portfolio_history', get_portfolio_history):
+            fill_daily_values([self.user_mapping],
+                              self.end_date + timedelta(days=10))
+
+        sync = UserDailyPortfolioValueSync.objects.get(user=self.user_mapping)
+        last_day = UserDailyPortfolioValue.objects.filter(
+            user=self.user_mapping).latest('date').date
+
+        self.assertLessEqual(last_day, self.end_date)
+        self.assertEqual(sync.synced_until, last_day)
+
+    def test_users_without_history_are_not_stored(self):
+
+        def get_portfolio_history(*_, **__):
+            raise NoPortfolioHistory
+
+        with patch('pdf.utils.get_portfolio_history', get_portfolio_history):
+            stored = fill_daily_values([self.user_mapping], self.end_date)
+
+        self.assertEqual(stored, 0)
+        self.assertFalse(UserDailyPortfolioValueSync.objects.filter(
+            user=self.user_mapping).exists())
+
+    def test_generate_active_users_list_with_thresholds(self):
+
+        def get_portfolio_history(*_, **__):
+            return self.history
+
+        thresholds = [[1, 0], [100000, 10 ** 9]]
+
+        internal_report = InternalReport.objects.create(
+            context=self.context,
+            type=INTERNAL_REPORT_ACTIVE_USERS,
+            status=INTERNAL_REPORT_STATUS_GENERATING,
+            input_data=json.dumps(dict(thresholds=thresholds))
+        )
+        sink = MemorySink()
+
+        with patch('pdf.utils.get_portfolio_history', get_portfolio_history):
+            ReporterActiveUsersList(
+                context=self.context,
+                start_date=format_date_short(self.start_date),
+                end_date=format_date_short(self.end_date),
+                thresholds=thresholds
+            ).run(internal_report, sink=sink)
+
+        self.assertEqual(len(sink.rows), 1)
+        self.assertEqual(list(sink.rows[0]), internal_report.get_csv_columns())
+        self.assertEqual(sink.rows[0]['consecutive_days_100000d_1000000000'],
+                         '')
+
     def test_generate_active_users_list_with_broken_history(self):
         def get_portfolio_history(*_, **__):
 
@@ -517,6 +710,57 @@ class UsersRiskScoreTest(InternalReportBasicTest):
         response = self.download_report(report.id)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_suggested_risk_score_is_stored(self):
+        risk_profile = RiskProfile.objects.create(
+            value=10,
+            upper_range=5,
+            lower_range=-5,
+            context=self.context
+        )
+        user_risk_profile = UserRiskProfile.objects.create(
+            user=self.context.usermapping_set.first(),
+            risk_profile=risk_profile
+        )
+
+        with patch('internal_reports.suggested_risk_scores.get_risk_profile',
+                   return_value=dict(risk_profile=dict(value=7))) as compute:
+            for _ in range(2):
+                scores = SuggestedRiskScores(self.context)
+                self.assertEqual(scores.get(user_risk_profile), 7)
+                scores.save()
+
+        self.assertEqual(compute.call_count, 1)
+
+    def test_suggested_risk_score_after_input_edit(self):
+        risk_profiles = [
+            RiskProfile.objects.create(value=value, upper_range=5,
+                                       lower_range=-5, context=self.context)
+            for value in (10, 20)
+        ]
+        user_risk_profile = UserRiskProfile.objects.create(
+            user=self.context.usermapping_set.first(),
+            risk_profile=risk_profiles[0]
+        )
+
+        compute_patch = patch(
+            'internal_reports.suggested_risk_scores.get_risk_profile',
+            return_value=dict(risk_profile=dict(value=7)))
+
+        with override_settings(
+                INTERNAL_REPORTS_SUGGESTED_RISK_SCORE_INPUTS=[
+                    'datastorage.UserRiskProfile']), compute_patch as compute:
+            scores = SuggestedRiskScores(self.context)
+            scores.get(user_risk_profile)
+            scores.save()
+
+            # Update sends no signals, instance passed to get() is not changed
+            UserRiskProfile.objects.filter(pk=user_risk_profile.pk).update(
+                risk_profile=risk_profiles[1])
+
+            SuggestedRiskScores(self.context).get(user_risk_profile)
+
+        self.assertEqual(compute.call_count, 2)
+
     @patch.object(CoreInteractClient, 'risk_profile_user',
                   MockCoreInteractClient.risk_profile_user)
     def test_generate_users_risk_score_list_without_lower(self):
@@ -564,7 +808,7 @@ class ValidateQuarterReportsDataTest(InternalReportBasicTest):
 
     @patch('internal_reports.generator.generate_report_in_background.delay',
            generate_report_in_background)
-    @patch.object(ThreadPool, 'map', PoolWithoutThreads.map)
+    @patch.object(ThreadPool, 'imap_unordered', imap_without_threads)
     def send_request(self, end_date=None):
         request = self.factory.get(reverse('internal:validate-quarter-data'))
         request.user = self.service_c_user
@@ -580,7 +824,7 @@ class ValidateQuarterReportsDataTest(InternalReportBasicTest):
 
         return view.validate_quarter_data(request=request)
 
-    @patch.object(ThreadPool, 'map', PoolWithoutThreads.map)
+    @patch.object(ThreadPool, 'imap_unordered', imap_without_threads)
     def generate_report(self, end_date=None):
 
         response = self.send_request(end_date=end_date)
@@ -650,6 +894,33 @@ class ValidateQuarterReportsDataTest(InternalReportBasicTest):
         UserMapping.objects.all().delete()
         self.generate_report(end_date=datetime.now().date())
 
+    def test_prefetched_buy_transactions_match_user_query(self):
+        self.create_order(settings.KEY_BUY, 100, self.user_mapping)
+        self.execute_orders(self.user_mapping)
+        create_user(self.context, 'user_without_transactions')
+
+        reporter = ReporterInvalidQuarterData(
+            context=self.context,
+            end_date=format_date_short(datetime.now().date())
+        )
+
+        with self.assertNumQueries(1):
+            reporter.buy_transaction_users = (
+                reporter.get_buy_transaction_users())
+
+        users = list(UserMapping.objects.filter(app_context=self.context))
+        flags = set()
+
+        for user in users:
+            with self.assertNumQueries(0):
+                prefetched = reporter.has_buy_transactions(user)
+
+            self.assertEqual(prefetched, Transaction.objects.filter(
+                user=user, type=TRANSACTION_TYPE_BUY).exists())
+            flags.add(prefetched)
+
+        self.assertEqual(flags, {True, False})
+
     @patch.object(GearmanClient, 'get_gearman_data',
                   MockAssetPerformanceRequest.gearman_response)
     def test_with_data(self):
@@ -1211,6 +1482,27 @@ class InternalReportOrdersTest(InternalReportBasicTest):
         response = self.download_report(report.id, file_format=FILE_FORMAT_JSON)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_orders_report_rows_are_in_code_point_order(self):
+        for app_uid in ('b_user', 'B_user', 'a_user', '\u00e4_user', 'Z_user'):
+            user = create_user(self.context, app_uid)
+            user.app_uid = app_uid
+            user.save()
+
+            Order.objects.create(
+                action='BUYI',
+                status=STATUS_PENDING,
+                user=user,
+                amount=100,
+                value_date=datetime.today()
+            )
+
+        report = self.generate_report()
+
+        user_ids = [row['user_id'] for row in report.iter_rows()]
+
+        self.assertEqual(len(user_ids), 6)
+        self.assertEqual(user_ids, sorted(user_ids))
+
     def test_generate_orders_report_with_date_range(self):
         report = self.generate_report(
             format_date_short(datetime.today() - timedelta(days=5)),
@@ -1227,24 +1519,31 @@ class InternalReportOrdersTest(InternalReportBasicTest):
 class InternalBalancesTest(InternalReportBasicTest):
     @patch('internal_reports.generator.generate_report_in_background.delay',
            generate_report_in_background)
-    def send_request(self):
+    def send_request(self, as_of_date=None):
         request = self.factory.get(
             reverse('internal:generate-balances'))
         request.user = self.service_c_user
 
+        request.query_params = dict()
+
+        if as_of_date:
+            request.query_params.update(
+                as_of_date=format_date_short(as_of_date))
+
         view = GenerateBalancesView()
 
         return view.generate_balances(request=request)
 
-    def generate_report(self):
-        response = self.send_request()
+    def generate_report(self, as_of_date=None):
+        response = self.send_request(as_of_date=as_of_date)
 
         report_id = response.data['id']
 
         internal_report = InternalReport.objects.get(pk=report_id)
 
         generator = ReporterBalances(
-            context=self.context
+            context=self.context,
+            as_of_date=format_date_short_or_none(as_of_date)
         )
 
         generator.internal_report = internal_report
@@ -1327,6 +1626,44 @@ class InternalBalancesTest(InternalReportBasicTest):
         response = self.view_report(report.id)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_bulk_container_values(self):
+        containers = AssetContainer.objects.filter(
+            user__app_context=self.context)
+
+        with override_settings(INTERNAL_REPORTS_BULK_VALUATION=True):
+            values = get_container_values(containers)
+
+        self.assertEqual(set(values), {container.pk
+                                       for container in containers})
+
+        for container in containers:
+            self.assertAlmostEqual(values[container.pk],
+                                   container.get_value())
+
+    def test_bulk_investment_containers(self):
+        container_ids = get_investment_container_ids(
+            AssetContainer.objects.filter(user__app_context=self.context))
+
+        self.assertEqual(container_ids[self.user_mapping.pk],
+                         self.user_mapping.get_container_investments().pk)
+
+    def test_generate_balances_report_as_of_date(self):
+        day = date(2020, 1, 31)
+
+        snapshot_context_balances(self.context, day)
+
+        snapshots = AssetContainerBalanceSnapshot.objects.filter(
+            user__app_context=self.context, date=day)
+
+        self.assertEqual(
+            set(snapshots.values_list('container_id', flat=True)),
+            set(AssetContainer.objects.filter(
+                user__app_context=self.context).values_list('pk', flat=True)))
+
+        report = self.generate_report(as_of_date=day)
+
+        self.assertEqual(report.get_metrics()['rows'], snapshots.count())
+
 
 class InternalReportListTest(InternalReportBasicTest):
     def send_request(self,
@@ -1493,3 +1830,789 @@ class InternalReportAssetsList(InternalReportBasicTest):
 
         response = self.view_report(report.id)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ReporterStreamingTest(InternalReportBasicTest):
+    def create_report(self):
+        return InternalReport.objects.create(
+            context=self.context,
+            type=INTERNAL_REPORT_GOALS,
+            status=INTERNAL_REPORT_STATUS_GENERATING,
+            input_data=json.dumps({})
+        )
+
+    def test_external_sort_is_stable(self):
+        rows = [dict(user_id=str(index % 7), position=index)
+                for index in range(100)]
+
+        sorted_rows = external_sort(rows, key=itemgetter('user_id'),
+                                    buffer_size=8)
+
+        self.assertEqual(list(sorted_rows),
+                         sorted(rows, key=itemgetter('user_id')))
+
+    def test_rows_written_to_memory_sink(self):
+        create_goal(self.user_mapping)
+
+        internal_report = self.create_report()
+        sink = MemorySink()
+
+        ReporterGoals(
+            context=self.context,
+            start_date=None,
+            end_date=None
+        ).run(internal_report, sink=sink)
+
+        self.assertEqual(internal_report.status, INTERNAL_REPORT_STATUS_READY)
+        self.assertEqual(len(sink.rows), 1)
+        self.assertFalse(internal_report.chunks.exists())
+        self.assertEqual(internal_report.get_metrics()['rows'], 1)
+
+    def test_rows_stored_in_chunks(self):
+        for _ in range(3):
+            create_goal(self.user_mapping)
+
+        internal_report = self.create_report()
+
+        generator = ReporterGoals(
+            context=self.context,
+            start_date=None,
+            end_date=None
+        )
+        generator.chunk_size = 2
+        generator.run(internal_report)
+
+        internal_report.refresh_from_db()
+
+        self.assertEqual(internal_report.chunks.count(), 2)
+        self.assertEqual(len(list(internal_report.iter_rows())), 3)
+
+        response = self.download_report(internal_report.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_chunked_report_is_streamed(self):
+        for _ in range(3):
+            create_goal(self.user_mapping)
+
+        internal_report = self.create_report()
+
+        generator = ReporterGoals(
+            context=self.context,
+            start_date=None,
+            end_date=None
+        )
+        generator.chunk_size = 2
+        generator.run(internal_report)
+
+        internal_report.refresh_from_db()
+
+        response = self.download_report(internal_report.id)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(lines[0].split(','),
+                         internal_report.get_csv_columns())
+        self.assertEqual(len(lines), 4)
+
+        response = self.download_report(internal_report.id,
+                                        file_format=FILE_FORMAT_JSON)
+        rows = json.loads(b''.join(response.streaming_content).decode())
+
+        self.assertEqual(rows, list(internal_report.iter_rows()))
+
+    def test_detailed_report_is_paged(self):
+        internal_report = self.create_report()
+        internal_report.status = INTERNAL_REPORT_STATUS_READY
+        internal_report.save()
+        internal_report.chunks.create(
+            number=0,
+            data=json.dumps([dict(user_id=str(index))
+                             for index in range(3)]))
+
+        with patch('internal_reports.serializers.INTERNAL_REPORT_PAGE_SIZE',
+                   2):
+            data = InternalReportDetailedSerializer(
+                internal_report, context=dict(page=1)).data
+
+        self.assertEqual(data['page'], 1)
+        self.assertEqual(data['data'], [dict(user_id='2')])
+
+
+class ReportColumnsTest(InternalReportBasicTest):
+    def test_compiled_orders_row(self):
+        order = Order.objects.create(
+            action='BUYI',
+            status=STATUS_PENDING,
+            user=self.user_mapping,
+            amount=100,
+            value_date=datetime.today()
+        )
+        order.refresh_from_db()
+
+        fields, map_row = compile_columns(
+            INTERNAL_REPORT_COLUMNS[INTERNAL_REPORT_ORDERS], Order)
+
+        row = map_row(
+            Order.objects.filter(pk=order.pk).values_list(*fields).get())
+
+        self.assertEqual(row, dict(
+            user_id=order.user.app_uid,
+            type=order.action,
+            date=format_date_short_or_none(order.value_date),
+            value=order.value,
+            status=order.get_status_display(),
+            rebalancing=order.rebalancing
+        ))
+        self.assertEqual(list(row),
+                         INTERNAL_REPORT_CSV_COLUMNS[INTERNAL_REPORT_ORDERS])
+
+    def test_goals_row_has_no_column_without_source(self):
+        create_goal(self.user_mapping)
+
+        fields, map_row = compile_columns(
+            INTERNAL_REPORT_COLUMNS[INTERNAL_REPORT_GOALS], Goal)
+
+        row = map_row(Goal.objects.filter(
+            user=self.user_mapping).values_list(*fields).get())
+
+        self.assertNotIn('name', row)
+        self.assertIn('name',
+                      INTERNAL_REPORT_CSV_COLUMNS[INTERNAL_REPORT_GOALS])
+
+    def test_decimal_value_formatted_as_string(self):
+        convert = get_number_converter(Asset, 'value')
+
+        value = convert(Decimal('1.5'))
+
+        self.assertIsInstance(value, str)
+        self.assertEqual(Decimal(value), Decimal('1.5'))
+        self.assertEqual(convert(1.5), 1.5)
+        self.assertIsNone(convert(None))
+
+
+class DailyPortfolioValuesTest(InternalReportBasicTest):
+    @staticmethod
+    def get_history(values):
+        start_date = date.today() - timedelta(days=len(values))
+
+        return {
+            start_date + timedelta(days=index): dict(components=[
+                dict(isin=FAKE_ISIN_1, price_eur=value / 2.0, quantity=1),
+                dict(isin=FAKE_ISIN_2, price_eur=value / 4.0, quantity=2),
+            ])
+            for index, value in enumerate(values)
+        }
+
+    def test_find_consecutive_days(self):
+        daily_values = DailyPortfolioValues.from_history(
+            self.get_history([60, 60, 30, 70, 80, 90, 100, 30, 60]))
+
+        self.assertEqual(daily_values.values,
+                         [60, 60, 30, 70, 80, 90, 100, 30, 60])
+        self.assertEqual(daily_values.find_consecutive_days(2, 50), (0, 2))
+        self.assertEqual(daily_values.find_consecutive_days(3, 50), (3, 7))
+        self.assertIsNone(daily_values.find_consecutive_days(5, 50))
+        self.assertEqual(daily_values.average(3, 7), 85)
+
+    def test_columnar_history(self):
+        history = self.get_history([60, 30, 70])
+        columnar = ColumnarPortfolioHistory.from_dict(history)
+
+        self.assertEqual(dict(columnar.items()), history)
+        self.assertEqual(
+            DailyPortfolioValues.from_history(columnar).values, [60, 30, 70])
+
+    def test_columnar_history_to_dict(self):
+        history = self.get_history([60, 30, 70])
+        converted = to_dict(ColumnarPortfolioHistory.from_dict(history))
+        first_date = list(history)[0]
+
+        converted[first_date]['components'].append(dict())
+
+        self.assertEqual(len(converted[first_date]['components']), 3)
+        self.assertIs(to_dict(history), history)
+
+    def test_broken_component(self):
+        history = self.get_history([60])
+        list(history.values())[0]['components'].append(dict())
+
+        with self.assertRaises(BrokenPortfolioComponent):
+            DailyPortfolioValues.from_history(history)
+
+
+class PortfolioHistoryCacheTest(InternalReportBasicTest):
+    def setUp(self):
+        super(PortfolioHistoryCacheTest, self).setUp()
+        self.cache = self.make_cache()
+        self.loads = 0
+
+    @staticmethod
+    def make_cache(max_bytes=10 ** 6):
+        return PortfolioHistoryCache(LocalHistoryCacheBackend(
+            max_bytes=max_bytes, timeout=60,
+            versions=HistoryVersions('default')))
+
+    def load_history(self):
+        self.loads += 1
+        start_date = date.today() - timedelta(days=9)
+
+        return {start_date + timedelta(days=index): index
+                for index in range(10)}
+
+    def test_range_inside_cached_one(self):
+        end_date = date.today()
+        start_date = end_date - timedelta(days=9)
+
+        self.cache.get(self.user_mapping, start_date, end_date,
+                       self.load_history)
+        history = self.cache.get(self.user_mapping,
+                                 start_date + timedelta(days=5), end_date,
+                                 self.load_history)
+
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(list(history.values()), [5, 6, 7, 8, 9])
+
+    def test_invalidate(self):
+        end_date = date.today()
+        start_date = end_date - timedelta(days=9)
+
+        self.cache.get(self.user_mapping, start_date, end_date,
+                       self.load_history)
+        self.cache.invalidate(self.user_mapping.pk)
+        self.cache.get(self.user_mapping, start_date, end_date,
+                       self.load_history)
+
+        self.assertEqual(self.loads, 2)
+
+    def test_invalidate_from_other_process(self):
+        end_date = date.today()
+        start_date = end_date - timedelta(days=9)
+
+        self.cache.get(self.user_mapping, start_date, end_date,
+                       self.load_history)
+        self.make_cache().invalidate(self.user_mapping.pk)
+        self.cache.get(self.user_mapping, start_date, end_date,
+                       self.load_history)
+
+        self.assertEqual(self.loads, 2)
+
+    def test_clear_keeps_other_keys(self):
+        end_date = date.today()
+        start_date = end_date - timedelta(days=9)
+
+        caches['default'].set('other_key', 'value')
+
+        self.cache.get(self.user_mapping, start_date, end_date,
+                       self.load_history)
+        self.make_cache().clear()
+        self.cache.get(self.user_mapping, start_date, end_date,
+                       self.load_history)
+
+        self.assertEqual(self.loads, 2)
+        self.assertEqual(caches['default'].get('other_key'), 'value')
+
+    def test_evicted_by_size(self):
+        end_date = date.today()
+        start_date = end_date - timedelta(days=9)
+        other_user = create_user(self.context, 'other')
+
+        self.cache = self.make_cache(
+            max_bytes=15 * HISTORY_DAY_ESTIMATED_BYTES)
+
+        for user_mapping in [self.user_mapping, other_user,
+                             self.user_mapping]:
+            self.cache.get(user_mapping, start_date, end_date,
+                           self.load_history)
+
+        self.assertEqual(self.loads, 3)
+        self.assertEqual(self.cache.backend.size,
+                         10 * HISTORY_DAY_ESTIMATED_BYTES)
+
+    def test_columnar_history_size(self):
+        history = DailyPortfolioValuesTest.get_history([60, 30, 70])
+
+        self.assertLess(
+            estimate_history_size(to_columnar(history)),
+            estimate_history_size(history))
+
+
+class AIMDLimiterTest(InternalReportBasicTest):
+    @staticmethod
+    def call(limiter, latency, failed=False):
+        limiter.acquire()
+        limiter.release(latency, failed)
+
+    def test_increase_while_healthy(self):
+        limiter = AIMDLimiter(initial=2, maximum=4)
+
+        for _ in range(10):
+            self.call(limiter, latency=0.1)
+
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual([limit for _, limit in limiter.history], [2, 3, 4])
+
+    def test_decrease_on_failure_and_slow_calls(self):
+        limiter = AIMDLimiter(initial=4)
+
+        for _ in range(4):
+            self.call(limiter, latency=0.1)
+
+        for _ in range(5):
+            self.call(limiter, latency=0.1, failed=True)
+
+        self.assertEqual(limiter.limit, 2)
+
+        for _ in range(2):
+            self.call(limiter, latency=1)
+
+        self.assertEqual(limiter.limit, 1)
+
+    def test_recover_when_service_gets_slower(self):
+        limiter = AIMDLimiter(initial=4, maximum=8)
+
+        for _ in range(8):
+            self.call(limiter, latency=0.1)
+
+        for _ in range(30):
+            self.call(limiter, latency=0.5)
+
+        self.assertEqual([limit for _, limit in limiter.history],
+                         [4, 5, 6, 3, 4, 5, 6, 7])
+
+
+class QuarterReportDataTest(InternalReportBasicTest):
+    def setUp(self):
+        super(QuarterReportDataTest, self).setUp()
+
+        self.end_date = get_quarter_dates(date.today())[0] - timedelta(days=1)
+        self.start_date = get_quarter_dates(self.end_date)[0]
+        self.calculations = 0
+
+    def calculate(self, *_):
+        self.calculations += 1
+
+        return (dict(last_sell_date=date(2020, 2, 3), value=Decimal('1.5')),
+                [dict(isin=FAKE_ISIN_1, end_total_value=10.0)])
+
+    def get_data(self, end_date=None, recompute=False):
+        with patch('internal_reports.quarter_data.'
+                   'calculate_quarter_report_data', self.calculate):
+            return get_quarter_report_data(
+                user_mapping=self.user_mapping,
+                start_date=self.start_date,
+                end_date=end_date or self.end_date,
+                portfolio_creating_date=self.start_date,
+                recompute=recompute
+            )
+
+    def test_stored_data_is_reused(self):
+        QuarterReportData.objects.create(
+            user=self.user_mapping,
+            start_date=self.start_date,
+            end_date=self.end_date,
+            portfolio_creating_date=self.start_date,
+            data_version=QUARTER_REPORT_DATA_VERSION,
+            summary=json.dumps(dict(last_sell_date=None)),
+            overview=json.dumps(dict(portfolio_value=100))
+        )
+
+        self.assertEqual(
+            self.get_data(),
+            (dict(last_sell_date=None), dict(portfolio_value=100))
+        )
+        self.assertEqual(self.calculations, 0)
+
+    def test_data_is_read_back_with_types(self):
+        computed = self.get_data()
+
+        self.assertEqual(self.get_data(), computed)
+        self.assertEqual(self.calculations, 1)
+
+    def test_data_of_other_version_is_not_used(self):
+        QuarterReportData.objects.create(
+            user=self.user_mapping,
+            start_date=self.start_date,
+            end_date=self.end_date,
+            portfolio_creating_date=self.start_date,
+            data_version=QUARTER_REPORT_DATA_VERSION - 1,
+            summary=json.dumps(dict()),
+            overview=json.dumps(list())
+        )
+
+        self.get_data()
+
+        self.assertEqual(self.calculations, 1)
+
+    def test_unfinished_quarter_is_not_stored(self):
+        self.get_data(end_date=date.today())
+
+        self.assertFalse(QuarterReportData.objects.exists())
+
+    def test_recompute_replaces_stored_data(self):
+        self.get_data()
+        self.get_data(recompute=True)
+
+        self.assertEqual(self.calculations, 2)
+        self.assertEqual(QuarterReportData.objects.count(), 1)
+
+    def test_stored_data_is_dropped_with_user_data(self):
+        QuarterReportData.objects.create(
+            user=self.user_mapping,
+            start_date=date(2020, 1, 1),
+            end_date=date(2020, 3, 31),
+            portfolio_creating_date=date(2020, 1, 1),
+            data_version=QUARTER_REPORT_DATA_VERSION,
+            summary=json.dumps(dict()),
+            overview=json.dumps(list())
+        )
+        UserDailyPortfolioValueSync.objects.create(
+            user=self.user_mapping,
+            synced_from=date(2020, 1, 1),
+            synced_until=date(2020, 3, 31)
+        )
+
+        invalidate_user_report_data(self.user_mapping.pk)
+
+        self.assertFalse(QuarterReportData.objects.filter(
+            user=self.user_mapping).exists())
+        self.assertFalse(UserDailyPortfolioValueSync.objects.filter(
+            user=self.user_mapping).exists())
+
+
+class QuarterChecksTest(InternalReportBasicTest):
+    def test_round_values_like_round(self):
+        values = [0.125, 0.135, 2.675, -1.005, 1234.5678, 0.0, -0.004, 10]
+
+        self.assertEqual(round_values(values).tolist(),
+                         [round(value, 2) for value in values])
+
+    def test_checks_match_validator(self):
+        summary = dict(
+            flow_per_asset={ISIN_CASH_COMPONENT: 10.0, FAKE_ISIN_1: 100.0},
+            return_in_cash=0,
+            cumulative_performance=0.05,
+            flow_before_last_sell=None,
+            net_inflow_outflow=110.0,
+            ptf_before_last_sell=None,
+            portfolio_end_value=215.5,
+            portfolio_start_value=100.0
+        )
+        overview = [
+            dict(isin=ISIN_CASH_COMPONENT, start_total_value=50.0,
+                 end_total_value=60.0),
+            dict(isin=FAKE_ISIN_1, start_total_value=50.0,
+                 end_total_value=155.5),
+        ]
+
+        validator = UserQuarterDataValidator.__new__(UserQuarterDataValidator)
+        validator.summary = summary
+        validator.overview = overview
+        validator.is_report_data_valid()
+
+        checks = evaluate_checks([gather_check_values(summary, overview)])[0]
+
+        self.assertEqual(
+            checks,
+            {name: getattr(validator, name) for name in checks})
+
+
+class MultiQuarterValidationTest(InternalReportBasicTest):
+    def test_quarters_of_year(self):
+        end_dates = get_quarter_end_dates_from_request(dict(year='2020'))
+
+        self.assertEqual(end_dates, [date(2020, 3, 31), date(2020, 6, 30),
+                                     date(2020, 9, 30), date(2020, 12, 31)])
+
+    def test_latest_quarter_first(self):
+        reporter = ReporterInvalidQuarterData(
+            context=self.context,
+            end_dates=[format_date_short(date(2020, 3, 31)),
+                       format_date_short(date(2020, 9, 30))]
+        )
+
+        self.assertEqual(reporter.quarters, [
+            (get_quarter_dates(date(2020, 9, 30))[0], date(2020, 9, 30)),
+            (get_quarter_dates(date(2020, 3, 31))[0], date(2020, 3, 31)),
+        ])
+
+
+class QuarterPrescreenTest(InternalReportBasicTest):
+    def setUp(self):
+        super(QuarterPrescreenTest, self).setUp()
+
+        # Any date field of Transaction, value date is configured in
+        # production
+        date_field = next(field.name
+                          for field in Transaction._meta.get_fields()
+                          if isinstance(field, DateField))
+
+        settings_override = override_settings(
+            INTERNAL_REPORTS_PRESCREEN_TRANSACTION_DATE_FIELD=date_field)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.start_date, self.end_date = get_quarter_dates(date(2020, 3, 31))
+
+    def store_values(self, start_value, end_value):
+        UserDailyPortfolioValueSync.objects.create(
+            user=self.user_mapping,
+            synced_from=self.start_date,
+            synced_until=self.end_date
+        )
+        UserDailyPortfolioValue.objects.create(
+            user=self.user_mapping, date=self.start_date, value=start_value)
+        UserDailyPortfolioValue.objects.create(
+            user=self.user_mapping, date=self.end_date, value=end_value)
+
+    def store_balance(self, day, value):
+        AssetContainerBalanceSnapshot.objects.create(
+            container_id=1,
+            user=self.user_mapping,
+            date=day,
+            value=value
+        )
+
+    def find_unsuspicious_users(self):
+        return find_unsuspicious_users(self.context, self.start_date,
+                                       self.end_date)
+
+    def test_transaction_date_field_is_configured(self):
+        self.assertTrue(get_transaction_date_field())
+
+    def test_prescreen_fails_without_transaction_date_field(self):
+        for name in (None, 'no_such_field', 'user'):
+            with override_settings(
+                    INTERNAL_REPORTS_PRESCREEN_TRANSACTION_DATE_FIELD=name):
+                with self.assertRaises(PrescreenNotAvailable):
+                    self.find_unsuspicious_users()
+
+    def test_audit_sample(self):
+        user_ids = set(range(100))
+
+        sample = take_audit_sample(user_ids, 0.05, seed=1)
+
+        self.assertEqual(len(sample), 5)
+        self.assertTrue(sample <= user_ids)
+        self.assertEqual(sample, take_audit_sample(user_ids, 0.05, seed=1))
+
+    def test_small_change_is_not_suspicious(self):
+        self.store_values(100.0, 101.0)
+
+        self.assertIn(self.user_mapping.pk, self.find_unsuspicious_users())
+
+    def test_big_change_is_suspicious(self):
+        self.store_values(100.0, 150.0)
+
+        self.assertNotIn(self.user_mapping.pk,
+                         self.find_unsuspicious_users())
+
+    def test_big_balance_change_is_suspicious(self):
+        self.store_values(100.0, 101.0)
+        self.store_balance(self.start_date, 100.0)
+        self.store_balance(self.end_date, 150.0)
+
+        self.assertNotIn(self.user_mapping.pk,
+                         self.find_unsuspicious_users())
+
+
+class QuarterValidationSamplingTest(InternalReportBasicTest):
+    def test_stratified_sample(self):
+        user_ids = list(range(100))
+        strata = {user_id: user_id % 4 for user_id in user_ids}
+
+        sample = sample_users(user_ids, 10, strata=strata, seed=1)
+
+        self.assertEqual(len(sample), 10)
+        self.assertEqual(
+            sorted(len([user_id for user_id in sample
+                        if strata[user_id] == stratum])
+                   for stratum in range(4)),
+            [2, 2, 3, 3])
+
+    def test_wilson_interval(self):
+        lower, upper = wilson_interval(5, 100)
+
+        self.assertAlmostEqual(lower, 0.0215, places=4)
+        self.assertAlmostEqual(upper, 0.1118, places=4)
+        self.assertEqual(wilson_interval(0, 0), (0.0, 1.0))
+
+    def test_strata_by_latest_value_before_date(self):
+        end_date = date(2020, 3, 31)
+        small_user = create_user(self.context, 'small_user')
+        unknown_user = create_user(self.context, 'unknown_user')
+
+        UserDailyPortfolioValue.objects.create(
+            user=self.user_mapping, date=end_date - timedelta(days=3),
+            value=1000.0)
+        UserDailyPortfolioValue.objects.create(
+            user=small_user, date=end_date - timedelta(days=1), value=10.0)
+        UserDailyPortfolioValue.objects.create(
+            user=small_user, date=end_date + timedelta(days=1),
+            value=5000.0)
+        UserDailyPortfolioValue.objects.create(
+            user=unknown_user, date=end_date + timedelta(days=1),
+            value=10.0)
+
+        strata = get_portfolio_size_strata(
+            [self.user_mapping.pk, small_user.pk, unknown_user.pk],
+            end_date, strata_count=2)
+
+        self.assertEqual(strata, {small_user.pk: 0,
+                                  self.user_mapping.pk: 1,
+                                  unknown_user.pk: UNKNOWN_SIZE_STRATUM})
+
+    def test_prescreened_users_are_not_in_estimate(self):
+        reporter = ReporterInvalidQuarterData(
+            context=self.context,
+            end_dates=[format_date_short(date(2020, 3, 31)),
+                       format_date_short(date(2020, 6, 30))],
+            prescreen=True
+        )
+        reporter.population = set(range(10))
+        reporter.sample = {1, 2, 3, 4}
+        reporter.prescreened = {date(2020, 3, 31): {1, 2, 7},
+                                date(2020, 6, 30): {1, 3, 7}}
+
+        reporter.failed_users = {'user_3'}
+
+        estimate = reporter.estimate_failure_rate()
+
+        self.assertEqual(estimate['sample_size'], 3)
+        self.assertEqual(estimate['failed'], 1)
+        self.assertEqual(estimate['population'], 8)
+        self.assertEqual(estimate['prescreened'], 2)
+
+
+class ConnectionLimiterTest(InternalReportBasicTest):
+    def test_threads_wait_for_slot(self):
+        limiter = ConnectionLimiter(2)
+        lock = threading.Lock()
+        active = [0]
+        peak = [0]
+
+        def use_database():
+            with limiter.slot():
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.01)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=use_database) for _ in range(8)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(peak[0], 2)
+
+    def test_connections_of_every_worker_are_closed(self):
+        threads = set()
+
+        def close_thread_connections():
+            threads.add(threading.get_ident())
+
+        with patch('internal_reports.db_connections.close_thread_connections',
+                   close_thread_connections):
+            with ThreadPool(3) as pool:
+                close_pool_connections(pool, 3)
+
+        self.assertEqual(len(threads), 3)
+
+
+@skipIf(trace is None, 'OpenTelemetry is not installed')
+class UserSpanSamplingTest(InternalReportBasicTest):
+    def setUp(self):
+        super(UserSpanSamplingTest, self).setUp()
+
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+            InMemorySpanExporter
+        )
+
+        self.exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+
+        patcher = patch.object(trace, 'get_tracer', provider.get_tracer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def trace_users(self, sample_rate, users=3):
+        def handle_user(_):
+            with user_span('internal_reports.test.user'):
+                with child_span('core_analyse.portfolio_history'):
+                    pass
+
+        with override_settings(
+                INTERNAL_REPORTS_TRACING_EXPORTER='file',
+                INTERNAL_REPORTS_TRACING_USER_SAMPLE_RATE=sample_rate):
+            with span('internal_reports.test.users'):
+                pool = ThreadPool(2)
+                pool.map(bind_context(handle_user), range(users))
+                pool.close()
+                pool.join()
+
+        return [finished.name
+                for finished in self.exporter.get_finished_spans()]
+
+    def test_children_of_sampled_users(self):
+        names = self.trace_users(1.0)
+
+        self.assertEqual(names.count('internal_reports.test.user'), 3)
+        self.assertEqual(names.count('core_analyse.portfolio_history'), 3)
+
+    def test_children_of_not_sampled_users(self):
+        names = self.trace_users(0.0)
+
+        self.assertEqual(names, ['internal_reports.test.users'])
+
+
+class ReportImportsTest(InternalReportBasicTest):
+    def test_urls_import_without_heavy_modules(self):
+        result = measure_import()
+
+        self.assertEqual(result['loaded'], [])
+
+
+class ReadDatabaseTest(InternalReportBasicTest):
+    def setUp(self):
+        super(ReadDatabaseTest, self).setUp()
+        self.router = ReadDatabaseRouter()
+
+    def test_reads_routed_inside_block(self):
+        with route_reads('replica'):
+            self.assertEqual(self.router.db_for_read(UserMapping), 'replica')
+
+            with route_reads('other'):
+                self.assertEqual(self.router.db_for_read(UserMapping),
+                                 'other')
+
+            self.assertEqual(self.router.db_for_read(UserMapping), 'replica')
+            self.assertIsNone(self.router.db_for_write(UserMapping))
+
+        self.assertIsNone(self.router.db_for_read(UserMapping))
+
+    def test_default_database_is_not_routed(self):
+        with route_reads(DEFAULT_DB_ALIAS):
+            self.assertIsNone(self.router.db_for_read(UserMapping))
+
+    def test_worker_threads_routed_by_bound_function(self):
+        def get_read_alias(_):
+            return self.router.db_for_read(UserMapping)
+
+        pool = ThreadPool(2)
+
+        try:
+            with route_reads('replica'):
+                unbound = pool.map(get_read_alias, range(2))
+
+            bound = pool.map(bind_reads(get_read_alias, 'replica'), range(2))
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(unbound, [None, None])
+        self.assertEqual(bound, ['replica', 'replica'])
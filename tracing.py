@@ -0,0 +1,239 @@
+"""
+Tracing helpers for internal reports.
+
+OpenTelemetry is an optional dependency: when it is not installed or no
+exporter is configured every helper below is a cheap no-op, so reporters can
+be instrumented unconditionally.
+
+Settings:
+
+* INTERNAL_REPORTS_TRACING_EXPORTER - 'otlp', 'file' or None (disabled)
+* INTERNAL_REPORTS_TRACING_ENDPOINT - OTLP/HTTP collector endpoint
+* INTERNAL_REPORTS_TRACING_FILE - file for the 'file' exporter
+* INTERNAL_REPORTS_TRACING_USER_SAMPLE_RATE - share of per-user spans kept
+"""
+import atexit
+import logging
+import os
+import random
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+from internal_reports.constants import (
+    TRACING_EXPORTER_OTLP,
+    TRACING_EXPORTER_FILE,
+    TRACING_DEFAULT_ENDPOINT,
+    TRACING_DEFAULT_FILE,
+    TRACING_DEFAULT_USER_SAMPLE_RATE,
+    TRACING_SERVICE_NAME
+)
+
+try:
+    from opentelemetry import context as otel_context, propagate, trace
+except ImportError:
+    otel_context = propagate = trace = None
+
+
+logger = logging.getLogger(__name__)
+
+TRACER_NAME = 'internal_reports'
+
+
+def is_enabled():
+    """
+    Check if tracing is available and configured
+    :return: boolean value
+    """
+
+    return (trace is not None
+            and bool(getattr(settings, 'INTERNAL_REPORTS_TRACING_EXPORTER',
+                             None)))
+
+
+def configure_tracing():
+    """
+    Install tracer provider with exporter requested in settings
+    """
+
+    if not is_enabled():
+        return
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        BatchSpanProcessor,
+        ConsoleSpanExporter
+    )
+
+    exporter_name = settings.INTERNAL_REPORTS_TRACING_EXPORTER
+    trace_file = None
+
+    if exporter_name == TRACING_EXPORTER_OTLP:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter
+        )
+        exporter = OTLPSpanExporter(endpoint=getattr(
+            settings, 'INTERNAL_REPORTS_TRACING_ENDPOINT',
+            TRACING_DEFAULT_ENDPOINT))
+
+    elif exporter_name == TRACING_EXPORTER_FILE:
+        trace_file = open(getattr(settings, 'INTERNAL_REPORTS_TRACING_FILE',
+                                  TRACING_DEFAULT_FILE), 'a')
+        exporter = ConsoleSpanExporter(
+            out=trace_file,
+            formatter=lambda span: span.to_json(indent=None) + os.linesep)
+
+    else:
+        logger.warning('Unknown tracing exporter {}'.format(exporter_name))
+        return
+
+    provider = TracerProvider(
+        resource=Resource.create({'service.name': TRACING_SERVICE_NAME}),
+        shutdown_on_exit=False)
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+    atexit.register(shutdown_tracing, provider, trace_file)
+
+
+def shutdown_tracing(provider, trace_file=None):
+    """
+    Export remaining spans and close the trace file
+    :param provider: TracerProvider instance
+    :param trace_file: file of the 'file' exporter
+    """
+
+    provider.shutdown()
+
+    if trace_file is not None:
+        trace_file.close()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Open span as a child of the current one
+    :param name: span name
+    :param attributes: span attributes, None values are skipped
+    """
+
+    if not is_enabled():
+        yield None
+        return
+
+    tracer = trace.get_tracer(TRACER_NAME)
+
+    with tracer.start_as_current_span(name) as current_span:
+        for key, value in attributes.items():
+            if value is not None:
+                current_span.set_attribute(key, value)
+        yield current_span
+
+
+@contextmanager
+def user_span(name, **attributes):
+    """
+    Open per-user span for sampled users only, so thousands of users do not
+    flood the collector
+    :param name: span name
+    :param attributes: span attributes
+    """
+
+    sample_rate = getattr(settings, 'INTERNAL_REPORTS_TRACING_USER_SAMPLE_RATE',
+                          TRACING_DEFAULT_USER_SAMPLE_RATE)
+
+    if not is_enabled():
+        yield None
+        return
+
+    if random.random() >= sample_rate:
+        # Current span is replaced by not recording one, so child_span()
+        # calls made for the user are not recorded too
+        not_recording = trace.NonRecordingSpan(
+            trace.get_current_span().get_span_context())
+
+        with trace.use_span(not_recording, end_on_exit=False):
+            yield None
+        return
+
+    with span(name, **attributes) as current_span:
+        yield current_span
+
+
+@contextmanager
+def child_span(name, **attributes):
+    """
+    Open span only if the current span is recorded. Used for external calls
+    made on behalf of a (possibly not sampled) user
+    :param name: span name
+    :param attributes: span attributes
+    """
+
+    if not is_enabled() or not trace.get_current_span().is_recording():
+        yield None
+        return
+
+    with span(name, **attributes) as current_span:
+        yield current_span
+
+
+def inject_headers(headers):
+    """
+    Put current trace context into message headers
+    :param headers: dict with headers
+    """
+
+    if is_enabled() and headers is not None:
+        propagate.inject(headers)
+
+
+@contextmanager
+def continue_trace(request):
+    """
+    Continue trace started by the publisher of Celery task
+    :param request: Celery task request
+    """
+
+    if not is_enabled():
+        yield
+        return
+
+    carrier = dict(getattr(request, 'headers', None) or {})
+
+    for field in propagate.get_global_textmap().fields:
+        value = getattr(request, field, None)
+        if value is not None:
+            carrier.setdefault(field, value)
+
+    token = otel_context.attach(propagate.extract(carrier))
+
+    try:
+        yield
+    finally:
+        otel_context.detach(token)
+
+
+def bind_context(func):
+    """
+    Bind function to the current trace context so spans opened in worker
+    threads become children of the caller's span
+    :param func: function that is called from another thread
+    :return: wrapped function
+    """
+
+    if not is_enabled():
+        return func
+
+    parent_context = otel_context.get_current()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = otel_context.attach(parent_context)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            otel_context.detach(token)
+
+    return wrapper
@@ -1,8 +1,12 @@
+import calendar
+import csv
 import datetime
 
-import pandas as pd
-
 import json
+from itertools import chain
+from operator import itemgetter
+
+from django.http import StreamingHttpResponse
 
 from internal_reports.constants import *
 from internal_reports.errors import (
@@ -10,8 +14,12 @@ from internal_reports.errors import (
     RequiredParameters,
     WrongFileFormat,
     ReportDataError,
-    WrongInputValue
+    WrongInputValue,
+    WrongQuarterDates,
+    WrongSampleParameters,
+    WrongThresholds
 )
+from internal_reports.reports.sorting import external_sort
 from tools.dates import (
     read_date_short,
     format_date_long,
@@ -49,6 +57,54 @@ def get_required_int_value(value_str, param_name):
         raise RequiredParameters(param_name=param_name)
 
 
+def get_thresholds(value_str):
+    """
+    Get list of thresholds from string like '10:50,20:100'
+    :param value_str: string value
+    :return: list of [consecutive_days, amount_to_validate] pairs
+    """
+    try:
+        thresholds = [
+            [int(value) for value in pair.split(':')]
+            for pair in value_str.split(',')
+        ]
+    except ValueError:
+        raise WrongThresholds
+
+    if not thresholds or any(len(pair) != 2 for pair in thresholds):
+        raise WrongThresholds
+
+    return thresholds
+
+
+def get_threshold_suffix(consecutive_days, amount_to_validate):
+    """
+    Get suffix of report columns for the threshold
+    :param consecutive_days: number of consecutive days
+    :param amount_to_validate: min value of portfolio
+    :return: string suffix
+    """
+    return ACTIVE_USERS_THRESHOLD_SUFFIX.format(
+        consecutive_days=consecutive_days,
+        amount_to_validate=amount_to_validate)
+
+
+def get_thresholds_csv_columns(thresholds):
+    """
+    Get columns of active users report with several thresholds
+    :param thresholds: list of [consecutive_days, amount_to_validate] pairs
+    :return: list of columns
+    """
+    columns = list(ACTIVE_USERS_THRESHOLDS_CSV_COLUMNS)
+
+    for consecutive_days, amount_to_validate in thresholds:
+        suffix = get_threshold_suffix(consecutive_days, amount_to_validate)
+        columns.extend(column + suffix
+                       for column in ACTIVE_USERS_THRESHOLD_CSV_COLUMNS)
+
+    return columns + ['error']
+
+
 def get_int_value(value_str):
     if value_str:
         return int(value_str)
@@ -56,6 +112,34 @@ def get_int_value(value_str):
         return None
 
 
+def get_page_from_request(parameters):
+    """
+    Read page of report rows from request parameters
+    :param parameters: Request parameters dict
+    :return: page number, 0 by default
+    """
+
+    try:
+        page = int(parameters.get('page') or 0)
+    except ValueError:
+        raise WrongInputValue
+
+    if page < 0:
+        raise WrongInputValue
+
+    return page
+
+
+class Echo(object):
+    """
+    Pseudo buffer for csv writer, returns written line instead of storing it
+    """
+
+    @staticmethod
+    def write(value):
+        return value
+
+
 def prepare_response(report, file_format):
     """
     Prepare response
@@ -64,6 +148,14 @@ def prepare_response(report, file_format):
     :return: response object
     """
 
+    filename = '{type}_on_{date}.{format}'.format(
+        type=report.get_type_display(),
+        date=format_date_long(report.generated),
+        format=file_format).replace(' ', '_')
+
+    if not report.data:
+        return prepare_streaming_response(report, file_format, filename)
+
     data = report.get_data()
 
     if isinstance(data, str):
@@ -71,12 +163,9 @@ def prepare_response(report, file_format):
             description=data
         )
 
-    filename = '{type}_on_{date}.{format}'.format(
-        type=report.get_type_display(),
-        date=format_date_long(report.generated),
-        format=file_format).replace(' ', '_')
     sort_by_user_id = (data[0].get('user_id')
-                       if isinstance(data, list) else False)
+                       if isinstance(data, list) and not report.presorted
+                       else False)
 
     if file_format == FILE_FORMAT_JSON:
         response = prepare_json_response(data, sort_by_user_id, filename)
@@ -86,6 +175,74 @@ def prepare_response(report, file_format):
     return response
 
 
+def prepare_streaming_response(report, file_format, filename):
+    """
+    Prepare file response for report stored in chunks. Rows are streamed
+    from the database chunk by chunk, so the report is never loaded into
+    memory at once
+    :param report: InternalReport instance
+    :param file_format: file format for the report
+    :param filename: filename
+    :return: streaming response with attached file
+    """
+
+    rows = report.iter_rows()
+    first_row = next(rows, None)
+
+    if first_row is None:
+        raise ReportDataError(description='Report has no data')
+
+    rows = chain([first_row], rows)
+
+    if not report.presorted and first_row.get('user_id'):
+        rows = external_sort(rows, key=itemgetter('user_id'),
+                             buffer_size=INTERNAL_REPORT_SORT_BUFFER_SIZE)
+
+    if file_format == FILE_FORMAT_JSON:
+        response = StreamingHttpResponse(iter_json_lines(rows),
+                                         content_type=MIME_TYPE_JSON)
+    else:
+        response = StreamingHttpResponse(
+            iter_csv_lines(rows, report.get_csv_columns()),
+            content_type=MIME_TYPE_CSV)
+
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(
+        filename)
+
+    return response
+
+
+def iter_json_lines(rows):
+    """
+    Serialize rows to JSON list piece by piece
+    :param rows: iterable of report rows
+    :return: generator of strings
+    """
+
+    yield '['
+
+    for number, row in enumerate(rows):
+        yield '{}\n{}'.format(',' if number else '', json.dumps(row))
+
+    yield '\n]'
+
+
+def iter_csv_lines(rows, columns):
+    """
+    Serialize rows to CSV line by line. Values missing in a row are empty
+    :param rows: iterable of report rows
+    :param columns: list of CSV columns
+    :return: generator of strings
+    """
+
+    writer = csv.DictWriter(Echo(), fieldnames=columns, extrasaction='ignore')
+
+    yield writer.writerow(dict(zip(columns, columns)))
+
+    for row in rows:
+        yield writer.writerow(row)
+
+
 def prepare_json_response(data, sort_by_user_id, filename):
     """
     Prepare response in JSON format
@@ -113,6 +270,9 @@ def prepare_csv_response(data, sort_by_user_id, filename, report):
     :return: response with formatted data and filename
     """
 
+    # pandas is heavy and only needed for CSV downloads
+    import pandas as pd
+
     users_list_df = (pd.DataFrame(data=data).sort_values('user_id')
                      if sort_by_user_id else pd.DataFrame(data=data))
 
@@ -138,6 +298,76 @@ def get_end_date_from_request(parameters):
             else datetime.datetime.now().date())
 
 
+def get_quarter_end_dates_from_request(parameters):
+    """
+    Read list of quarter end dates from request parameters: comma separated
+    end_dates or year, which means all finished quarters of the year
+    :param parameters: Request parameters dict
+    :return: list of dates or None if they are not requested
+    """
+
+    if parameters.get('end_dates'):
+        try:
+            return [read_date_short(date_str.strip()).date()
+                    for date_str in parameters['end_dates'].split(',')]
+        except ValueError:
+            raise WrongQuarterDates
+
+    if parameters.get('year'):
+        try:
+            year = int(parameters['year'])
+        except ValueError:
+            raise WrongQuarterDates
+
+        today = datetime.datetime.now().date()
+
+        end_dates = [
+            datetime.date(year, month, calendar.monthrange(year, month)[1])
+            for month in QUARTER_END_MONTHS
+        ]
+        end_dates = [end_date for end_date in end_dates if end_date < today]
+
+        if not end_dates:
+            raise WrongQuarterDates
+
+        return end_dates
+
+    return None
+
+
+def get_sample_from_request(parameters):
+    """
+    Read sampling parameters of quarter validation from request parameters
+    :param parameters: Request parameters dict
+    :return: dict with sample_size or sample_fraction and stratify flag,
+        empty if sample is not requested
+    """
+
+    sample = dict()
+
+    try:
+        if parameters.get('sample_size'):
+            sample.update(sample_size=int(parameters['sample_size']))
+
+            if sample['sample_size'] <= 0:
+                raise WrongSampleParameters
+
+        elif parameters.get('sample_fraction'):
+            sample.update(
+                sample_fraction=float(parameters['sample_fraction']))
+
+            if not 0 < sample['sample_fraction'] <= 1:
+                raise WrongSampleParameters
+
+    except ValueError:
+        raise WrongSampleParameters
+
+    if sample and check_for_true_false_all(parameters, 'stratify') == 'True':
+        sample.update(stratify=True)
+
+    return sample
+
+
 def get_date_from_request(parameters, name):
     """
     Read date from request parameters
@@ -223,3 +453,24 @@ def filter_queryset_by_date_range(queryset, start_date, end_date, field_name):
         )
 
     return queryset
+
+
+def chunked(iterable, size):
+    """
+    Split iterable into lists of given size
+    :param iterable: any iterable
+    :param size: max size of chunk
+    :return: generator of lists
+    """
+
+    chunk = list()
+
+    for item in iterable:
+        chunk.append(item)
+
+        if len(chunk) >= size:
+            yield chunk
+            chunk = list()
+
+    if chunk:
+        yield chunk
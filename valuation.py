@@ -0,0 +1,68 @@
+"""
+Values of many asset containers at once.
+
+Container value is the sum of values of its assets (Asset rows related to
+the container as has_assets), so values of all containers of a report are
+read with one aggregate query instead of get_value() call per container.
+tests.py checks that both give the same values. If bulk valuation is
+switched off, get_value() of every container is used.
+
+Investments container of users is found for all users at once too, as the
+Prospery depot of the user, the same containers users with investments are
+found by (see get_users_with_investments).
+
+Settings:
+
+* INTERNAL_REPORTS_BULK_VALUATION - use aggregate query
+"""
+from django.conf import settings
+from django.db.models import Sum
+
+from datastorage.standards import ASSET_CONTAINER_TYPES
+from internal_reports.constants import (
+    ASSET_CONTAINER_ASSETS_RELATION,
+    BULK_VALUATION_DEFAULT
+)
+
+
+def get_container_values(containers):
+    """
+    Get current values of containers
+
+    :param containers: AssetContainer queryset
+    :return: dict with container ID as key and value as value
+    """
+
+    if not getattr(settings, 'INTERNAL_REPORTS_BULK_VALUATION',
+                   BULK_VALUATION_DEFAULT):
+        return {container.pk: container.get_value()
+                for container in containers.iterator()}
+
+    sums = containers.order_by().annotate(
+        total_value=Sum(ASSET_CONTAINER_ASSETS_RELATION + '__value')
+    ).values_list('pk', 'total_value')
+
+    return {container_id: value or 0 for container_id, value in sums}
+
+
+def get_investment_container_ids(containers):
+    """
+    Find investments container of every user with one query: the first
+    Prospery depot of the user. tests.py checks it's the container
+    UserMapping.get_container_investments() returns
+
+    :param containers: AssetContainer queryset
+    :return: dict with UserMapping ID as key and container ID as value
+    """
+
+    investments = containers.filter(
+        type__type_id=ASSET_CONTAINER_TYPES['depot']['code'],
+        source__is_prospery=True
+    ).order_by('user_id', 'pk').values_list('user_id', 'pk')
+
+    container_ids = dict()
+
+    for user_id, container_id in investments:
+        container_ids.setdefault(user_id, container_id)
+
+    return container_ids
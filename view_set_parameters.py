@@ -46,6 +46,88 @@ AMOUNT_TO_VALIDATE = dict(
     location="query"
 )
 
+END_DATES = dict(
+    name="end_dates",
+    description="Comma separated end dates of quarters, used instead of "
+                "end_date to validate several quarters at once",
+    required=False,
+    type="string",
+    location="query"
+)
+
+YEAR = dict(
+    name="year",
+    description="Validate all finished quarters of the year",
+    required=False,
+    type="integer",
+    location="query"
+)
+
+AS_OF_DATE = dict(
+    name="as_of_date",
+    description="Report balances stored for the date instead of current "
+                "ones",
+    required=False,
+    type="string",
+    location="query"
+)
+
+PRESCREEN = dict(
+    name="prescreen",
+    description="Validate fully only users that fail cheap checks on "
+                "stored daily values and balances and a random audit "
+                "sample (true/false)",
+    required=False,
+    type="string",
+    location="query"
+)
+
+SAMPLE_SIZE = dict(
+    name="sample_size",
+    description="Validate only that many random users and estimate "
+                "failure rate of all users",
+    required=False,
+    type="integer",
+    location="query"
+)
+
+SAMPLE_FRACTION = dict(
+    name="sample_fraction",
+    description="Validate only that share of random users (0-1), used if "
+                "sample_size is not set",
+    required=False,
+    type="number",
+    location="query"
+)
+
+RECOMPUTE = dict(
+    name="recompute",
+    description="Calculate quarter data again instead of using stored one "
+                "(true/false)",
+    required=False,
+    type="string",
+    location="query"
+)
+
+STRATIFY = dict(
+    name="stratify",
+    description="Sample users of all portfolio sizes proportionally "
+                "(true/false)",
+    required=False,
+    type="string",
+    location="query"
+)
+
+THRESHOLDS = dict(
+    name="thresholds",
+    description="Comma separated consecutive_days:amount_to_validate pairs, "
+                "e.g. 10:50,20:100. Used instead of consecutive_days and "
+                "amount_to_validate, report has columns for every pair",
+    required=False,
+    type="string",
+    location="query"
+)
+
 FILE_FORMAT = dict(
     name="file_format",
     description="File format for report (csv or json; default is csv)",
@@ -93,6 +175,7 @@ GENERATE_ACTIVE_USERS_PARAMETERS_LIST = [
     END_DATE,
     CONSECUTIVE_DAYS,
     AMOUNT_TO_VALIDATE,
+    THRESHOLDS,
 ]
 
 GENERATE_USERS_RISK_SCORE_PARAMETERS_LIST = [
@@ -101,7 +184,14 @@ GENERATE_USERS_RISK_SCORE_PARAMETERS_LIST = [
 ]
 
 GENERATE_VALIDATED_QUARTER_REPORT_DATA = [
-    END_DATE_OPTIONAL
+    END_DATE_OPTIONAL,
+    END_DATES,
+    YEAR,
+    PRESCREEN,
+    SAMPLE_SIZE,
+    SAMPLE_FRACTION,
+    STRATIFY,
+    RECOMPUTE
 ]
 
 GENERATE_GOALS_PARAMETERS_LIST = [
@@ -119,4 +209,8 @@ GENERATE_RECURRENT_ORDERS_PARAMETERS_LIST = [
     END_DATE_OPTIONAL,
     DIRECT_DEBIT,
     PERIOD_FINISHED
-]
\ No newline at end of file
+]
+
+GENERATE_BALANCES_PARAMETERS_LIST = [
+    AS_OF_DATE
+]
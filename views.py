@@ -22,11 +22,15 @@ from .constants import *
 from .view_set_parameters import *
 from .utils import (
     get_end_date_from_request,
+    get_quarter_end_dates_from_request,
+    get_sample_from_request,
     get_date,
     get_required_int_value,
+    get_thresholds,
     get_file_format_from_request,
     prepare_response,
     get_int_value,
+    get_page_from_request,
     get_date_from_request,
     check_for_true_false_all,
     format_date_short_or_none
@@ -55,20 +59,27 @@ class GenerateActiveUsersView(ViewSet):
             'start_date', None), 'start_date')
         end_date = get_date(parameters.get(
             'end_date', None), 'end_date')
-        consecutive_days = get_required_int_value(parameters.get(
-            'consecutive_days', None), 'consecutive_days')
-        amount_to_validate = get_required_int_value(parameters.get(
-            'amount_to_validate', None), 'amount_to_validate')
+
+        input_data = dict(
+            start_date=format_date_short(start_date),
+            end_date=format_date_short(end_date)
+        )
+
+        if parameters.get('thresholds'):
+            input_data.update(
+                thresholds=get_thresholds(parameters.get('thresholds')))
+        else:
+            input_data.update(
+                consecutive_days=get_required_int_value(parameters.get(
+                    'consecutive_days', None), 'consecutive_days'),
+                amount_to_validate=get_required_int_value(parameters.get(
+                    'amount_to_validate', None), 'amount_to_validate')
+            )
 
         return start_report_generating(
             context,
             INTERNAL_REPORT_ACTIVE_USERS,
-            input_data=dict(
-                start_date=format_date_short(start_date),
-                end_date=format_date_short(end_date),
-                consecutive_days=consecutive_days,
-                amount_to_validate=amount_to_validate
-            )
+            input_data=input_data
         )
 
 
@@ -115,15 +126,37 @@ class QuarterDataValidationView(ViewSet):
         """
 
         parameters = request.query_params
-        end_date = get_end_date_from_request(parameters)
+        end_dates = get_quarter_end_dates_from_request(parameters)
+        prescreen = check_for_true_false_all(parameters, 'prescreen')
+        recompute = check_for_true_false_all(parameters, 'recompute')
         context = request.user.appcontextmembers.context
 
+        if end_dates:
+            input_data = dict(end_dates=[format_date_short(end_date)
+                                         for end_date in end_dates])
+        else:
+            input_data = dict(end_date=format_date_short(
+                get_end_date_from_request(parameters)))
+
+        if prescreen == 'True':
+            # Pre-screen pulls in numpy and Core Analyse client, web workers
+            # import it only when it's requested
+            from internal_reports.quarter_prescreen import (
+                get_transaction_date_field
+            )
+
+            get_transaction_date_field()
+            input_data.update(prescreen=True)
+
+        if recompute == 'True':
+            input_data.update(recompute=True)
+
+        input_data.update(get_sample_from_request(parameters))
+
         return start_report_generating(
             context,
             INTERNAL_REPORT_QUARTER_VALIDATION,
-            input_data=dict(
-                end_date=format_date_short(end_date)
-            )
+            input_data=input_data
         )
 
 
@@ -230,6 +263,7 @@ class GenerateBalancesView(ViewSet):
     """
 
     @staticmethod
+    @drf_extra_parameters(GENERATE_BALANCES_PARAMETERS_LIST)
     def generate_balances(request):
         """
         Start report generating with asset container balances
@@ -239,11 +273,13 @@ class GenerateBalancesView(ViewSet):
         :return: Response with data for asset container balances
         """
 
+        as_of_date = get_date_from_request(request.query_params, 'as_of_date')
         context = request.user.appcontextmembers.context
 
         return start_report_generating(
             context,
             INTERNAL_REPORT_BALANCES,
+            input_data=dict(as_of_date=format_date_short_or_none(as_of_date))
         )
 
 
@@ -349,9 +385,15 @@ class GetReportView(ViewSet):
           type: integer
           required: true
           location: query
+        - name: page
+          description: page of report rows, starting from 0
+          type: integer
+          required: false
+          location: query
         """
 
         report_id = request.query_params.get('report_id', None)
+        page = get_page_from_request(request.query_params)
 
         try:
             report = InternalReport.objects.get(pk=report_id)
@@ -359,7 +401,8 @@ class GetReportView(ViewSet):
             raise NoInternalReportError
 
         return Response(
-            data=InternalReportDetailedSerializer(report).data,
+            data=InternalReportDetailedSerializer(
+                report, context=dict(page=page)).data,
             status=status.HTTP_200_OK
         )
 